@@ -0,0 +1,215 @@
+"""
+Best efforts: the fastest continuous stretch of a run for standard distances.
+
+For a distance d, every point j is taken as the end of a window and the
+window start is the position exactly d before it on the cumulative moving
+distance, with its time interpolated between the two points around it. As
+j moves forward the start only ever moves forward too, so one pass with two
+pointers covers all windows for a distance in O(n). Elapsed time is used,
+so a stop inside the window counts against it.
+"""
+import sqlite3
+from app.track import np, has_numpy
+
+METERS_PER_MILE = 1609.344
+
+# Standard best-effort distances in meters
+BEST_EFFORT_DISTANCES = {
+    '400m': 400,
+    '1k': 1000,
+    'mile': METERS_PER_MILE,
+    '5k': 5000,
+    '10k': 10000
+}
+
+# Windows faster than this (min/mile) are GPS errors, as in the segment
+# validation; the world record mile pace is around 3:43
+MIN_EFFORT_PACE = 3.0
+
+def fastest_window(cum_distance, times, distance, minimum_pace=MIN_EFFORT_PACE):
+    """
+    Fastest window covering `distance` (same units as cum_distance, miles).
+
+    Returns (elapsed seconds, start position, end index, start index) or
+    None when the track is shorter than the distance. The start position
+    is the interpolated cumulative distance where the window begins and
+    start index the last point at or before it.
+    """
+    n = len(cum_distance)
+    if n < 2 or distance <= 0 or cum_distance[-1] < distance:
+        return None
+    minimum_seconds = minimum_pace * 60 * distance
+
+    if has_numpy:
+        ends = np.flatnonzero(cum_distance >= distance)
+        targets = cum_distance[ends] - distance
+        starts = np.searchsorted(cum_distance, targets, side='right') - 1
+        span = cum_distance[starts + 1] - cum_distance[starts]
+        fraction = np.where(span > 0, (targets - cum_distance[starts]) / np.where(span > 0, span, 1.0), 0.0)
+        start_times = times[starts] + fraction * (times[starts + 1] - times[starts])
+        elapsed = times[ends] - start_times
+        elapsed = np.where(elapsed >= minimum_seconds, elapsed, np.inf)
+        best = int(np.argmin(elapsed))
+        if not np.isfinite(elapsed[best]):
+            return None
+        return float(elapsed[best]), float(targets[best]), int(ends[best]), int(starts[best])
+
+    best = None
+    i = 0
+    for j in range(n):
+        target = cum_distance[j] - distance
+        if target < 0:
+            continue
+        # Last point at or before the window start
+        while cum_distance[i + 1] <= target:
+            i += 1
+        span = cum_distance[i + 1] - cum_distance[i]
+        fraction = (target - cum_distance[i]) / span if span > 0 else 0.0
+        elapsed = times[j] - (times[i] + fraction * (times[i + 1] - times[i]))
+        if elapsed >= minimum_seconds and (best is None or elapsed < best[0]):
+            best = (elapsed, target, j, i)
+    return best
+
+def find_best_efforts(track, cum_distance, distances=None):
+    """
+    Best effort for every distance (name -> meters; default
+    BEST_EFFORT_DISTANCES) the run is long enough for.
+
+    `cum_distance` is the cumulative moving distance (miles) per point,
+    e.g. the 'distance' prefix sums from segment_prefix_sums. Each effort
+    has its name, distance (meters and miles), time (seconds), pace
+    (min/mile), where it starts and ends in the run (miles) and the point
+    index range [start_idx, end_idx).
+    """
+    times = track['time']
+    efforts = []
+    for name, meters in sorted((distances or BEST_EFFORT_DISTANCES).items(), key=lambda item: item[1]):
+        miles = meters / METERS_PER_MILE
+        window = fastest_window(cum_distance, times, miles)
+        if window is None:
+            continue
+        elapsed, start_distance, end_idx, start_idx = window
+        efforts.append({
+            'name': name,
+            'distance_m': meters,
+            'distance': miles,
+            'time_seconds': elapsed,
+            'pace': elapsed / 60 / miles,
+            'start_distance': start_distance,
+            'end_distance': start_distance + miles,
+            'start_idx': start_idx,
+            'end_idx': end_idx + 1
+        })
+    return efforts
+
+def riegel_predictions(efforts, distances=[5, 10, 21.1, 42.2]):
+    """
+    Race times (minutes, keyed like '5k') by the Riegel formula from the
+    longest best effort, which extrapolates the least
+    """
+    if not efforts:
+        return None
+    base = max(efforts, key=lambda effort: effort['distance_m'])
+    base_minutes = base['time_seconds'] / 60
+    base_km = base['distance_m'] / 1000
+    return {f"{distance}k": base_minutes * (distance / base_km) ** 1.06 for distance in distances}
+
+def ensure_best_efforts_table(conn):
+    """Create the run_best_efforts table if it doesn't exist"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS run_best_efforts (
+            run_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            date TEXT,
+            name TEXT NOT NULL,
+            distance_m REAL NOT NULL,
+            time_seconds REAL NOT NULL,
+            pace REAL,
+            start_distance REAL,
+            PRIMARY KEY (run_id, name),
+            FOREIGN KEY (run_id) REFERENCES runs(id)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_run_best_efforts_user ON run_best_efforts (user_id, name, time_seconds)')
+
+class BestEffortStore:
+    """Storage operations on the run_best_efforts table"""
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+        with self._connect() as conn:
+            ensure_best_efforts_table(conn)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_name, timeout=30)
+
+    def save(self, run_id, user_id, date, efforts):
+        """Store the best efforts of a run, replacing any earlier ones"""
+        if efforts is None:
+            return
+        with self._connect() as conn:
+            conn.execute('DELETE FROM run_best_efforts WHERE run_id = ?', (run_id,))
+            conn.executemany('''
+                INSERT INTO run_best_efforts (run_id, user_id, date, name, distance_m, time_seconds, pace, start_distance)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(run_id, user_id, date, effort['name'], effort['distance_m'], effort['time_seconds'],
+                   effort['pace'], effort['start_distance']) for effort in efforts])
+
+    def for_run(self, run_id, user_id=None):
+        """Best efforts of a run, shortest distance first"""
+        query = '''
+            SELECT name, distance_m, time_seconds, pace, start_distance
+            FROM run_best_efforts WHERE run_id = ?
+        '''
+        args = [run_id]
+        if user_id is not None:
+            query += ' AND user_id = ?'
+            args.append(user_id)
+        query += ' ORDER BY distance_m'
+        with self._connect() as conn:
+            rows = conn.execute(query, args).fetchall()
+        return [{
+            'name': name,
+            'distance_m': distance_m,
+            'time_seconds': time_seconds,
+            'pace': pace,
+            'start_distance': start_distance
+        } for name, distance_m, time_seconds, pace, start_distance in rows]
+
+    def personal_records(self, user_id, start_date=None, end_date=None):
+        """
+        Fastest effort per distance over a user's runs, optionally within a
+        date range, with the run it came from; shortest distance first
+        """
+        conditions = 'user_id = ?'
+        args = [user_id]
+        if start_date:
+            conditions += ' AND date >= ?'
+            args.append(start_date)
+        if end_date:
+            conditions += ' AND date <= ?'
+            args.append(end_date)
+        query = f'''
+            SELECT name, distance_m, time_seconds, pace, run_id, date
+            FROM (
+                SELECT *, ROW_NUMBER() OVER (PARTITION BY name ORDER BY time_seconds, date, run_id) AS position
+                FROM run_best_efforts WHERE {conditions}
+            )
+            WHERE position = 1
+            ORDER BY distance_m
+        '''
+        with self._connect() as conn:
+            rows = conn.execute(query, args).fetchall()
+        return [{
+            'name': name,
+            'distance_m': distance_m,
+            'time_seconds': time_seconds,
+            'pace': pace,
+            'run_id': run_id,
+            'date': date
+        } for name, distance_m, time_seconds, pace, run_id, date in rows]
+
+    def delete(self, run_id):
+        """Drop the best efforts of a run"""
+        with self._connect() as conn:
+            conn.execute('DELETE FROM run_best_efforts WHERE run_id = ?', (run_id,))
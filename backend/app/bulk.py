@@ -0,0 +1,109 @@
+"""
+Bulk import of run histories.
+
+Uploaded GPX, TCX and FIT files (plain or inside zip archives) are queued as
+background analysis jobs of one batch (see app.jobs), so the request only
+has to unpack and store the files; the job workers analyze and save them.
+"""
+import os
+import re
+import uuid
+import zipfile
+from datetime import datetime
+from app.running import RUN_FILE_EXTENSIONS
+
+# Largest run file accepted from an upload or zip archive (uncompressed),
+# so a zip bomb can't exhaust memory
+BULK_MAX_FILE_BYTES = int(os.environ.get('BULK_MAX_FILE_BYTES', 64 * 1024 * 1024))
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+class FileTooLarge(ValueError):
+    """Raised for an upload or archive member over BULK_MAX_FILE_BYTES"""
+
+def read_capped(stream, limit=BULK_MAX_FILE_BYTES):
+    """Read a binary stream in chunks, raising FileTooLarge past `limit` bytes"""
+    chunks = []
+    size = 0
+    while True:
+        chunk = stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            return b''.join(chunks)
+        size += len(chunk)
+        if size > limit:
+            raise FileTooLarge(f"File is larger than {limit // (1024 * 1024)} MB")
+        chunks.append(chunk)
+
+def read_member(archive, member, limit=BULK_MAX_FILE_BYTES):
+    """
+    Contents of a zip archive member, refusing members whose declared size
+    is over `limit` and, since the declared size can lie, stopping once more
+    than `limit` bytes actually come out
+    """
+    if member.file_size > limit:
+        raise FileTooLarge(f"File is larger than {limit // (1024 * 1024)} MB")
+    with archive.open(member) as stream:
+        return read_capped(stream, limit)
+
+def iter_run_uploads(uploads):
+    """
+    Yield (filename, read) for every GPX, TCX or FIT file in a list of uploaded
+    files.
+
+    Zip archives are opened in place and each .gpx/.tcx/.fit member (plain or .gz) is yielded with a
+    function that reads it when called, so only the file being queued is
+    held in memory. Reads raise FileTooLarge past BULK_MAX_FILE_BYTES.
+    Other files are yielded with read=None.
+    """
+    for upload in uploads:
+        name = upload.filename or ''
+        if name.lower().endswith('.zip'):
+            try:
+                archive = zipfile.ZipFile(upload.stream)
+            except zipfile.BadZipFile:
+                print(f"Skipping unreadable zip archive: {name}")
+                yield name, None
+                continue
+            for member in archive.infolist():
+                member_name = os.path.basename(member.filename)
+                if member.is_dir() or member.filename.startswith('__MACOSX/') or member_name.startswith('.'):
+                    continue
+                if member_name.lower().endswith(RUN_FILE_EXTENSIONS):
+                    yield member_name, (lambda archive=archive, member=member: read_member(archive, member))
+                else:
+                    yield member_name, None
+        elif name.lower().endswith(RUN_FILE_EXTENSIONS):
+            yield name, (lambda upload=upload: read_capped(upload.stream))
+        else:
+            yield name, None
+
+def run_date_from_filename(filename):
+    """Run date (YYYY-MM-DD) from a file name, or today"""
+    date_match = re.search(r'\d{4}-\d{2}-\d{2}', filename)
+    return date_match.group(0) if date_match else datetime.now().strftime('%Y-%m-%d')
+
+def enqueue_uploads(queue, user_id, uploads, params):
+    """
+    Queue every GPX, TCX and FIT file in the uploads as an analysis job.
+
+    `params` are the job parameters shared by all files (pace_limit,
+    user_age, ...); each job gets the run date from its file name. Returns
+    (batch_id, files) with one dict per file in upload order: status
+    'queued' with its job_id, 'error' with a message, or 'skipped' for files
+    that are not GPX, TCX or FIT.
+    """
+    batch_id = uuid.uuid4().hex
+    files = []
+    for filename, read in iter_run_uploads(uploads):
+        if read is None:
+            files.append({'filename': filename, 'status': 'skipped', 'error': 'Not a GPX, TCX or FIT file'})
+            continue
+        try:
+            data = read()
+        except Exception as e:
+            files.append({'filename': filename, 'status': 'error', 'error': f'Could not read file: {str(e)}'})
+            continue
+        job_params = dict(params, run_date=run_date_from_filename(filename))
+        job_id = queue.enqueue(user_id, data, job_params, filename=filename, batch_id=batch_id)
+        files.append({'filename': filename, 'status': 'queued', 'job_id': job_id})
+    return batch_id, files
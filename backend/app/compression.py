@@ -0,0 +1,37 @@
+"""
+Compressed uploads.
+
+GPX is verbose XML and shrinks 8-12x with gzip, so clients may send run
+files as .gz files. They are inflated on the fly as the parser reads, so
+no inflated copy of the document is made before parsing. Request bodies
+sent with Content-Encoding gzip/deflate are undone in the web layer (see
+routes.request_encoding).
+"""
+import io
+import gzip
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Upload file name suffixes of compressed run files
+COMPRESSED_EXTENSIONS = ('.gz',)
+
+def is_gzip(head):
+    """True if the first bytes of a file are a gzip header"""
+    return head[:2] == GZIP_MAGIC
+
+def peek(stream, size):
+    """First `size` bytes of a seekable binary stream, leaving its position unchanged"""
+    head = stream.read(size)
+    stream.seek(-len(head), io.SEEK_CUR)
+    return head
+
+def decompressed(stream):
+    """
+    A seekable binary stream as it should be parsed: a gzip.GzipFile that
+    inflates it while it is read if it holds gzip data, else the stream
+    itself. Concatenated gzip members are read as one file. Streams that
+    cannot seek are returned as they are.
+    """
+    if hasattr(stream, 'seekable') and stream.seekable() and is_gzip(peek(stream, 2)):
+        return gzip.GzipFile(fileobj=stream, mode='rb')
+    return stream
@@ -154,6 +154,8 @@ class RunDatabase:
                     total_distance REAL,
                     avg_pace REAL,
                     avg_hr REAL,
+                    elevation_gain REAL,
+                    elevation_loss REAL,
                     data TEXT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     FOREIGN KEY (user_id) REFERENCES users(id)
@@ -186,6 +188,15 @@ class RunDatabase:
                 cursor.execute('ALTER TABLE runs ADD COLUMN pace_limit REAL')
                 conn.commit()
             
+            # Elevation summary columns, so lists of runs don't need the data JSON
+            try:
+                cursor.execute('SELECT elevation_gain, elevation_loss FROM runs LIMIT 1')
+            except sqlite3.OperationalError:
+                print("Adding elevation_gain and elevation_loss columns to runs table")
+                cursor.execute('ALTER TABLE runs ADD COLUMN elevation_gain REAL')
+                cursor.execute('ALTER TABLE runs ADD COLUMN elevation_loss REAL')
+                conn.commit()
+            
             # First, check if we need to add new columns
             try:
                 cursor.execute('SELECT weight, gender FROM profile LIMIT 1')
@@ -224,6 +235,8 @@ class RunDatabase:
                     total_distance REAL,
                     avg_pace REAL,
                     avg_hr REAL,
+                    elevation_gain REAL,
+                    elevation_loss REAL,
                     data TEXT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     FOREIGN KEY (user_id) REFERENCES users(id)
@@ -335,7 +348,7 @@ class RunDatabase:
                             print(f"Error decoding JSON for run {run[0]}")
                             value = {}
                     # Ensure numeric fields have default values
-                    elif column in ['total_distance', 'avg_pace', 'avg_hr', 'pace_limit']:
+                    elif column in ['total_distance', 'avg_pace', 'avg_hr', 'pace_limit', 'elevation_gain', 'elevation_loss']:
                         value = float(value) if value is not None else 0.0
                     run_dict[column] = value
                 formatted_runs.append(run_dict)
@@ -535,7 +548,8 @@ class RunDatabase:
             conn.commit()
             return True 
 
-    def add_run(self, user_id, date, data, total_distance, avg_pace, avg_hr, pace_limit=None):
+    def add_run(self, user_id, date, data, total_distance, avg_pace, avg_hr, pace_limit=None,
+                elevation_gain=None, elevation_loss=None):
         """Add a new run to the database"""
         try:
             # Debug what data is being passed to add_run
@@ -553,10 +567,11 @@ class RunDatabase:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT INTO runs 
-                    (user_id, date, data, total_distance, avg_pace, avg_hr, pace_limit)
+                    (user_id, date, data, total_distance, avg_pace, avg_hr, pace_limit, elevation_gain, elevation_loss)
                     VALUES 
-                    (?, ?, ?, ?, ?, ?, ?)
-                ''', (user_id, date, data, total_distance, avg_pace, avg_hr, pace_limit))
+                    (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (user_id, date, data, total_distance, avg_pace, avg_hr, pace_limit,
+                      elevation_gain, elevation_loss))
                 conn.commit()
                 run_id = cursor.lastrowid
                 print(f"Database: Successfully saved run {run_id} with metrics")
@@ -565,6 +580,25 @@ class RunDatabase:
             print(f"Error adding run: {e}")
             return None 
 
+    def update_run(self, run_id, user_id, data, total_distance, avg_pace, avg_hr, pace_limit=None,
+                   elevation_gain=None, elevation_loss=None):
+        """Replace the analysis of a run (e.g. after reanalysis). Returns True if the run was updated"""
+        try:
+            with sqlite3.connect(self.db_name) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE runs SET data = ?, total_distance = ?, avg_pace = ?, avg_hr = ?, pace_limit = ?,
+                                    elevation_gain = ?, elevation_loss = ?
+                    WHERE id = ? AND user_id = ?
+                ''', (data, total_distance, avg_pace, avg_hr, pace_limit, elevation_gain, elevation_loss,
+                      run_id, user_id))
+                conn.commit()
+                return cursor.rowcount > 0
+        except Exception as e:
+            print(f"Error updating run {run_id}: {e}")
+            traceback.print_exc()
+            return False
+
     def get_run(self, run_id, user_id):
         """Get a specific run by ID and verify it belongs to the user"""
         try:
@@ -320,6 +320,8 @@ class RunDatabaseAdapter:
                     avg_pace REAL,
                     avg_hr REAL,
                     pace_limit REAL,
+                    elevation_gain REAL,
+                    elevation_loss REAL,
                     data TEXT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     FOREIGN KEY (user_id) REFERENCES users(id)
@@ -361,6 +363,15 @@ class RunDatabaseAdapter:
                 cursor.execute('ALTER TABLE runs ADD COLUMN pace_limit REAL')
                 conn.commit()
             
+            # Elevation summary columns, so lists of runs don't need the data JSON
+            try:
+                cursor.execute('SELECT elevation_gain, elevation_loss FROM runs LIMIT 1')
+            except sqlite3.OperationalError:
+                print("Adding elevation_gain and elevation_loss columns to runs table")
+                cursor.execute('ALTER TABLE runs ADD COLUMN elevation_gain REAL')
+                cursor.execute('ALTER TABLE runs ADD COLUMN elevation_loss REAL')
+                conn.commit()
+            
             # Check if we need to add new columns
             try:
                 cursor.execute('SELECT weight, gender FROM profile LIMIT 1')
@@ -424,14 +435,18 @@ class RunDatabaseAdapter:
                             total_distance, 
                             avg_pace, 
                             avg_hr, 
+                            elevation_gain,
+                            elevation_loss,
                             data
-                        ) VALUES (?, ?, ?, ?, ?, ?)
+                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
                     ''', (
                         user_id,
                         run_data['date'],
                         total_distance,
                         avg_pace,
                         avg_hr,
+                        data_obj.get('elevation_gain'),
+                        data_obj.get('elevation_loss'),
                         data_str
                     ))
                     conn.commit()
@@ -0,0 +1,218 @@
+"""
+Downsampling engine for high-frequency tracks.
+
+Every strategy takes a TrackArray and returns the sorted indices of the
+points to keep; the caller decides what to do with them (usually
+TrackArray.take). Kept points are tracked in a bytearray bitmap, so each
+strategy is a fixed number of linear passes over the track.
+
+Strategies:
+    smart: time gap + heart rate change + pace transition rules
+    lttb: Largest-Triangle-Three-Buckets on the distance/time curve, with an
+          explicit target point budget
+"""
+from math import inf
+from app.track import np, has_numpy
+from app.geo import step_distances, time_steps, cumulative_sum, instantaneous_pace
+
+# Downsampling of high-frequency tracks during analysis; analyze_run_file
+# takes overrides of these as its `downsample` option
+DOWNSAMPLE_DEFAULTS = {
+    'strategy': 'smart',
+    'min_time_gap': 3,
+    'target_points': 1000
+}
+
+def find_pace_transitions(paces, pace_limit):
+    """
+    Bitmap of the points where the pace crosses `pace_limit`.
+
+    Points without a valid pace (infinite) neither start nor end a
+    transition, matching the behaviour of the original XML downsampler.
+    """
+    n = len(paces)
+    transitions = bytearray(n)
+    if not pace_limit:
+        return transitions
+
+    limit = float(pace_limit)
+    previous_status = None
+    for i in range(1, n):
+        current_status = paces[i] <= limit if paces[i] != inf else None
+        if current_status is not None and previous_status is not None and current_status != previous_status:
+            transitions[i] = 1
+        previous_status = current_status
+    return transitions
+
+def smart_keep_indices(track, min_time_gap=3, pace_limit=None, significant_hr_change=5):
+    """
+    Keep points that preserve heart rate trends and pace transitions.
+
+    1. Points at least `min_time_gap` seconds after the previous point
+    2. Points whose HR moved more than `significant_hr_change` bpm from the
+       last kept point
+    3. Every pace transition with one point either side
+    If more than half of the points survive, every other kept point is
+    dropped again, except the pace transitions.
+    """
+    n = len(track)
+    if n < 3:
+        return list(range(n))
+
+    time_diffs = time_steps(track['time'])
+    paces = instantaneous_pace(step_distances(track['lat'], track['lon']), time_diffs)
+    if has_numpy:
+        time_diffs = time_diffs.tolist()
+        paces = paces.tolist()
+    heart_rates = [int(hr) if hr == hr else None for hr in track['hr']]
+
+    keep = bytearray(n)
+    keep[0] = keep[n - 1] = 1
+
+    # First pass: time interval
+    for i in range(1, n - 1):
+        if time_diffs[i] >= min_time_gap:
+            keep[i] = 1
+
+    # Second pass: significant heart rate changes from the last kept point
+    current_kept_point = 0
+    for i in range(1, n - 1):
+        if keep[i]:
+            current_kept_point = i
+            continue
+        if (heart_rates[i] is not None and
+            heart_rates[current_kept_point] is not None and
+            abs(heart_rates[i] - heart_rates[current_kept_point]) > significant_hr_change):
+            keep[i] = 1
+            current_kept_point = i
+
+    # Third pass: pace transitions and their neighbours
+    transitions = find_pace_transitions(paces, pace_limit)
+    protected = bytearray(n)
+    if pace_limit:
+        transition_points_added = 0
+        for i in range(1, n - 1):
+            if transitions[i]:
+                for j in (i - 1, i, i + 1):
+                    protected[j] = 1
+                    if not keep[j]:
+                        keep[j] = 1
+                        transition_points_added += 1
+        print(f"Added {transition_points_added} points to preserve pace transitions")
+
+    points_to_keep = [i for i in range(n) if keep[i]]
+
+    # For extremely high-frequency files, thin out what is left
+    if len(points_to_keep) > n * 0.5:
+        print("Still keeping too many points, applying additional filtering")
+        keep_every_n = 2
+        filtered_points = [points_to_keep[0]]
+        for position in range(1, len(points_to_keep) - 1):
+            idx = points_to_keep[position]
+            if protected[idx] or position % keep_every_n == 0:
+                filtered_points.append(idx)
+        filtered_points.append(points_to_keep[-1])
+        points_to_keep = filtered_points
+
+    return points_to_keep
+
+def lttb_keep_indices(track, target_points=1000, x_column='time', y_column=None):
+    """
+    Largest-Triangle-Three-Buckets downsampling to at most `target_points`.
+
+    The points between the fixed first and last one are split into equal
+    buckets; from each bucket the point forming the largest triangle with
+    the previously kept point and the average of the next bucket is kept.
+    By default the curve is cumulative distance over time, so the points
+    where the pace changes most are the ones that survive.
+    """
+    n = len(track)
+    target_points = int(target_points or 0)
+    if target_points >= n or target_points < 3:
+        return list(range(n))
+
+    xs = track[x_column]
+    if y_column is None:
+        ys = track['cum_distance'] if 'cum_distance' in track else cumulative_sum(step_distances(track['lat'], track['lon']))
+    else:
+        ys = track[y_column]
+
+    bucket_size = (n - 2) / (target_points - 2)
+    points_to_keep = [0]
+    previous = 0
+
+    if has_numpy:
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        for bucket in range(target_points - 2):
+            start = int(bucket * bucket_size) + 1
+            end = int((bucket + 1) * bucket_size) + 1
+            next_end = min(int((bucket + 2) * bucket_size) + 1, n)
+            if end >= n - 1:
+                next_x, next_y = xs[n - 1], ys[n - 1]
+            else:
+                next_x, next_y = xs[end:next_end].mean(), ys[end:next_end].mean()
+
+            # Twice the triangle area; the constant factor doesn't change the argmax
+            areas = np.abs((xs[previous] - next_x) * (ys[start:end] - ys[previous]) -
+                           (xs[previous] - xs[start:end]) * (next_y - ys[previous]))
+            previous = start + int(np.argmax(areas))
+            points_to_keep.append(previous)
+    else:
+        for bucket in range(target_points - 2):
+            start = int(bucket * bucket_size) + 1
+            end = int((bucket + 1) * bucket_size) + 1
+            next_end = min(int((bucket + 2) * bucket_size) + 1, n)
+            if end >= n - 1:
+                next_x, next_y = xs[n - 1], ys[n - 1]
+            else:
+                count = next_end - end
+                next_x = sum(xs[end:next_end]) / count
+                next_y = sum(ys[end:next_end]) / count
+
+            prev_x, prev_y = xs[previous], ys[previous]
+            best_area = -1.0
+            best_index = start
+            for i in range(start, end):
+                area = abs((prev_x - next_x) * (ys[i] - prev_y) - (prev_x - xs[i]) * (next_y - prev_y))
+                if area > best_area:
+                    best_area = area
+                    best_index = i
+            previous = best_index
+            points_to_keep.append(previous)
+
+    points_to_keep.append(n - 1)
+    return points_to_keep
+
+DOWNSAMPLE_STRATEGIES = {
+    'smart': smart_keep_indices,
+    'lttb': lttb_keep_indices
+}
+
+def select_points(track, strategy='smart', **options):
+    """
+    Indices of the points to keep under the named strategy.
+
+    Options are passed through to the strategy (min_time_gap / pace_limit
+    for 'smart', target_points for 'lttb').
+    """
+    if strategy not in DOWNSAMPLE_STRATEGIES:
+        raise ValueError(f"Unknown downsampling strategy '{strategy}'")
+    return DOWNSAMPLE_STRATEGIES[strategy](track, **options)
+
+def downsample_settings(strategy=None, target_points=None):
+    """
+    DOWNSAMPLE_DEFAULTS overrides for an analysis request, or None if the
+    request keeps the defaults. Raises ValueError for an unknown strategy
+    or a target_points below 3.
+    """
+    settings = {}
+    if strategy:
+        if strategy not in DOWNSAMPLE_STRATEGIES:
+            raise ValueError(f"Unknown downsampling strategy '{strategy}'")
+        settings['strategy'] = strategy
+    if target_points is not None:
+        if target_points < 3:
+            raise ValueError("target_points must be at least 3")
+        settings['target_points'] = target_points
+    return settings or None
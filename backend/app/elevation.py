@@ -0,0 +1,124 @@
+"""
+Elevation smoothing, gain/loss and grade.
+
+Raw GPS (and to a lesser degree barometric) elevation is noisy: summing
+every positive step counts the noise as climbing. Elevations are converted
+to feet and smoothed with a short median or moving-average filter, then
+gain and loss are only counted once the elevation has moved a deadband away
+from the last counted level. The gain/loss credited at each point is kept as
+a column, so segment and split totals are differences of prefix sums like
+every other aggregate.
+"""
+from array import array
+from app.track import np, has_numpy
+
+FEET_PER_METER = 3.28084
+FEET_PER_MILE = 5280
+
+# filter: 'median', 'moving_average' or 'none'; window in points (odd);
+# deadband in feet
+ELEVATION_DEFAULTS = {
+    'filter': 'median',
+    'window': 5,
+    'deadband': 3.0
+}
+
+def smooth_elevation(elevations, filter='median', window=5):
+    """
+    Elevations smoothed with a centered window of `window` points. The
+    window shrinks at the ends of the track instead of padding.
+    """
+    n = len(elevations)
+    half = max(int(window), 1) // 2
+    if filter == 'none' or half == 0 or n < 3:
+        return elevations
+
+    if has_numpy:
+        values = np.asarray(elevations, dtype=np.float64)
+        if filter == 'moving_average':
+            sums = np.concatenate(([0.0], np.cumsum(values)))
+            index = np.arange(n)
+            lo = np.maximum(index - half, 0)
+            hi = np.minimum(index + half + 1, n)
+            return (sums[hi] - sums[lo]) / (hi - lo)
+        padded = np.pad(values, half, mode='constant', constant_values=np.nan)
+        windows = np.lib.stride_tricks.sliding_window_view(padded, 2 * half + 1)
+        return np.nanmedian(windows, axis=1)
+
+    values = list(elevations)
+    smoothed = array('d', bytes(8 * n))
+    for i in range(n):
+        chunk = values[max(i - half, 0):i + half + 1]
+        if filter == 'moving_average':
+            smoothed[i] = sum(chunk) / len(chunk)
+        else:
+            chunk.sort()
+            middle = len(chunk) // 2
+            smoothed[i] = chunk[middle] if len(chunk) % 2 else (chunk[middle - 1] + chunk[middle]) / 2
+    return smoothed
+
+def deadband_steps(elevations, deadband=3.0):
+    """
+    Gain and loss credited at each point.
+
+    A climb (or descent) is only counted once the elevation is at least
+    `deadband` above (below) the last counted level, and then in full from
+    that level, so wobbles smaller than the deadband add nothing. This is
+    one sequential pass; the rest of the stage works on whole columns.
+    """
+    n = len(elevations)
+    gains = [0.0] * n
+    losses = [0.0] * n
+    values = elevations.tolist() if has_numpy else list(elevations)
+    if n:
+        level = values[0]
+        for i in range(1, n):
+            change = values[i] - level
+            if change >= deadband:
+                gains[i] = change
+                level = values[i]
+            elif -change >= deadband:
+                losses[i] = -change
+                level = values[i]
+    return gains, losses
+
+def add_elevation_columns(track, filter='median', window=5, deadband=3.0):
+    """
+    Attach elevation_smooth (feet) and the per-point elevation_gain_step and
+    elevation_loss_step columns (feet) to a TrackArray
+    """
+    if has_numpy:
+        feet = np.asarray(track['elevation'], dtype=np.float64) * FEET_PER_METER
+    else:
+        feet = array('d', (value * FEET_PER_METER for value in track['elevation']))
+    smoothed = smooth_elevation(feet, filter, window)
+    gains, losses = deadband_steps(smoothed, deadband)
+    track.set_column('elevation_smooth', smoothed)
+    track.set_column('elevation_gain_step', gains)
+    track.set_column('elevation_loss_step', losses)
+    return track
+
+def segment_grades(track, starts, ends):
+    """
+    Net elevation change (feet) and average grade (percent) of each index
+    range [start, end) of a track with motion and elevation columns
+    """
+    if not starts:
+        return [], []
+    smoothed = track['elevation_smooth']
+    cum_distance = track['cum_distance']
+    if has_numpy:
+        first = np.asarray(starts, dtype=np.intp)
+        last = np.asarray(ends, dtype=np.intp) - 1
+        rise = smoothed[last] - smoothed[first]
+        run = (cum_distance[last] - cum_distance[first]) * FEET_PER_MILE
+        grades = np.where(run > 0, rise / np.where(run > 0, run, 1.0) * 100, 0.0)
+        return rise.tolist(), grades.tolist()
+
+    rises, grades = [], []
+    for start, end in zip(starts, ends):
+        rise = smoothed[end - 1] - smoothed[start]
+        run = (cum_distance[end - 1] - cum_distance[start]) * FEET_PER_MILE
+        rises.append(rise)
+        grades.append(rise / run * 100 if run > 0 else 0.0)
+    return rises, grades
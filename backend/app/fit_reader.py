@@ -0,0 +1,261 @@
+"""
+Streaming reader for Garmin FIT activity files.
+
+FIT is a compact binary format: a file header, then a stream of records,
+each either a definition message (the layout of a local message type) or a
+data message laid out by the last definition of its local type. Every
+definition is compiled into one struct.Struct that unpacks only the fields
+we use and skips the rest as padding, so a record costs a single unpack
+call. Records are read one at a time from the source; the file is never
+held in memory as a whole.
+
+Only 'record' messages (one per sample) become trackpoints; 'lap' messages
+give the lap start times. The CRCs are skipped rather than checked.
+"""
+import struct
+from array import array
+from app.track import TrackArray
+from app.gpx_reader import measure_points_per_minute
+
+FIT_SIGNATURE = b'.FIT'
+
+# Seconds between the Unix epoch and the FIT epoch (1989-12-31 00:00 UTC)
+FIT_EPOCH_OFFSET = 631065600
+
+SEMICIRCLES_TO_DEGREES = 180 / 2 ** 31
+
+FILE_ID_MESSAGE = 0
+LAP_MESSAGE = 19
+RECORD_MESSAGE = 20
+TIMESTAMP_FIELD = 253
+
+# Fields read per global message number
+MESSAGE_FIELDS = {
+    FILE_ID_MESSAGE: {1: 'manufacturer'},
+    LAP_MESSAGE: {2: 'start_time'},
+    RECORD_MESSAGE: {
+        TIMESTAMP_FIELD: 'time',
+        0: 'lat',
+        1: 'lon',
+        2: 'altitude',
+        78: 'enhanced_altitude',
+        3: 'hr',
+        4: 'cadence',
+        7: 'power'
+    }
+}
+
+# Base type -> (struct format, invalid value)
+BASE_TYPES = {
+    0x00: ('B', 0xFF),  # enum
+    0x01: ('b', 0x7F),  # sint8
+    0x02: ('B', 0xFF),  # uint8
+    0x83: ('h', 0x7FFF),  # sint16
+    0x84: ('H', 0xFFFF),  # uint16
+    0x85: ('i', 0x7FFFFFFF),  # sint32
+    0x86: ('I', 0xFFFFFFFF),  # uint32
+    0x88: ('f', None),  # float32
+    0x89: ('d', None),  # float64
+    0x0A: ('B', 0x00),  # uint8z
+    0x8B: ('H', 0x0000),  # uint16z
+    0x8C: ('I', 0x00000000),  # uint32z
+    0x8E: ('q', 0x7FFFFFFFFFFFFFFF),  # sint64
+    0x8F: ('Q', 0xFFFFFFFFFFFFFFFF),  # uint64
+    0x90: ('Q', 0)  # uint64z
+}
+
+# Sensor columns kept when the file records them
+SENSOR_FIELDS = ('cadence', 'power')
+
+MANUFACTURERS = {
+    1: 'Garmin',
+    15: 'Dynastream',
+    23: 'Suunto',
+    32: 'Wahoo',
+    95: 'Stryd',
+    123: 'Polar',
+    260: 'Zwift',
+    265: 'Strava',
+    294: 'Coros'
+}
+
+class FitError(ValueError):
+    """Raised for data that is not a readable FIT file"""
+
+def is_fit(head):
+    """True if the first bytes of a file are a FIT file header"""
+    return len(head) >= 12 and head[0] in (12, 14) and head[8:12] == FIT_SIGNATURE
+
+class MessageLayout:
+    """Compiled layout of one local message type"""
+
+    def __init__(self, global_number, little_endian, fields, developer_size=0):
+        # The timestamp of any message anchors the compressed timestamps after it
+        wanted = dict(MESSAGE_FIELDS.get(global_number, {}))
+        wanted.setdefault(TIMESTAMP_FIELD, 'time')
+        fmt = ['<' if little_endian else '>']
+        self.names = []
+        self.invalid = []
+        for number, size, base_type in fields:
+            name = wanted.get(number)
+            code, invalid = BASE_TYPES.get(base_type, (None, None))
+            if name and code and struct.calcsize(code) == size:
+                fmt.append(code)
+                self.names.append(name)
+                self.invalid.append(invalid)
+            elif size:
+                fmt.append(f'{size}x')
+        if developer_size:
+            fmt.append(f'{developer_size}x')
+        self.global_number = global_number
+        self.struct = struct.Struct(''.join(fmt))
+        self.size = self.struct.size
+
+    def decode(self, data):
+        """Dict of the wanted fields with a valid value"""
+        return {name: value for name, value, invalid in zip(self.names, self.struct.unpack(data), self.invalid)
+                if value != invalid}
+
+def _read_exact(source, size):
+    data = source.read(size)
+    if len(data) != size:
+        raise FitError("Truncated FIT file")
+    return data
+
+def iter_fit_messages(source):
+    """
+    Yield (global message number, fields dict) for the data messages of a
+    FIT stream, including chained files. Timestamps (field 253 and
+    compressed timestamp headers) are resolved to FIT epoch seconds.
+    """
+    while True:
+        header_size = source.read(1)
+        if not header_size:
+            return
+        header = header_size + _read_exact(source, header_size[0] - 1)
+        if not is_fit(header):
+            raise FitError("Not a FIT file")
+        remaining = struct.unpack('<I', header[4:8])[0]
+
+        layouts = {}
+        last_timestamp = None
+        while remaining > 0:
+            record_header = _read_exact(source, 1)[0]
+            remaining -= 1
+
+            if record_header & 0x80:
+                # Compressed timestamp header: 5 bits of offset from the last timestamp
+                local_type = (record_header >> 5) & 0x03
+                offset = record_header & 0x1F
+                if last_timestamp is not None:
+                    last_timestamp += (offset - (last_timestamp & 0x1F)) & 0x1F
+                layout = layouts.get(local_type)
+                if layout is None:
+                    raise FitError(f"Data message for undefined local type {local_type}")
+                fields = layout.decode(_read_exact(source, layout.size))
+                remaining -= layout.size
+                if last_timestamp is not None:
+                    fields['time'] = last_timestamp
+                yield layout.global_number, fields
+                continue
+
+            local_type = record_header & 0x0F
+            if record_header & 0x40:
+                # Definition message
+                fixed = _read_exact(source, 5)
+                little_endian = fixed[1] == 0
+                global_number = struct.unpack('<H' if little_endian else '>H', fixed[2:4])[0]
+                field_count = fixed[4]
+                raw_fields = _read_exact(source, 3 * field_count)
+                remaining -= 5 + 3 * field_count
+                fields = [(raw_fields[i], raw_fields[i + 1], raw_fields[i + 2]) for i in range(0, 3 * field_count, 3)]
+                developer_size = 0
+                if record_header & 0x20:
+                    developer_count = _read_exact(source, 1)[0]
+                    developer_fields = _read_exact(source, 3 * developer_count)
+                    remaining -= 1 + 3 * developer_count
+                    developer_size = sum(developer_fields[i + 1] for i in range(0, 3 * developer_count, 3))
+                layouts[local_type] = MessageLayout(global_number, little_endian, fields, developer_size)
+                continue
+
+            layout = layouts.get(local_type)
+            if layout is None:
+                raise FitError(f"Data message for undefined local type {local_type}")
+            fields = layout.decode(_read_exact(source, layout.size))
+            remaining -= layout.size
+            if 'time' in fields:
+                last_timestamp = fields['time']
+            yield layout.global_number, fields
+
+        source.read(2)  # File CRC
+
+def read_fit_track(source, sample_minutes=2):
+    """
+    Read the trackpoints of a FIT activity in a single streaming pass.
+
+    Args:
+        source: Path or binary file-like object containing a FIT file
+        sample_minutes: Length of the window used for frequency detection
+
+    Returns:
+        TrackArray like read_gpx_track's, with 'creator' (the device
+        manufacturer), 'points_per_minute' and 'lap_starts' (epoch start
+        time of every lap) in its metadata. Records
+        without a position are skipped, as GPX has no place for them.
+        Cadence and power columns are only present when the file records them.
+    """
+    if isinstance(source, str):
+        with open(source, 'rb') as handle:
+            return read_fit_track(handle, sample_minutes)
+
+    lats = array('d')
+    lons = array('d')
+    times = array('d')
+    elevations = array('d')
+    heart_rates = array('d')
+    sensors = {field: array('d') for field in SENSOR_FIELDS}
+    recorded = set()
+    lap_starts = []
+    creator = None
+    nan = float('nan')
+
+    for global_number, fields in iter_fit_messages(source):
+        if global_number == RECORD_MESSAGE:
+            if 'lat' not in fields or 'lon' not in fields or 'time' not in fields:
+                continue
+            lats.append(fields['lat'] * SEMICIRCLES_TO_DEGREES)
+            lons.append(fields['lon'] * SEMICIRCLES_TO_DEGREES)
+            times.append(fields['time'] + FIT_EPOCH_OFFSET)
+            altitude = fields.get('enhanced_altitude', fields.get('altitude'))
+            elevations.append(altitude / 5 - 500 if altitude is not None else 0)
+            heart_rates.append(fields.get('hr', nan))
+            for field, column in sensors.items():
+                value = fields.get(field)
+                if value is None:
+                    column.append(nan)
+                else:
+                    column.append(value)
+                    recorded.add(field)
+        elif global_number == LAP_MESSAGE and 'start_time' in fields:
+            lap_starts.append(float(fields['start_time'] + FIT_EPOCH_OFFSET))
+        elif global_number == FILE_ID_MESSAGE and creator is None:
+            manufacturer = fields.get('manufacturer')
+            if manufacturer is not None:
+                creator = MANUFACTURERS.get(manufacturer, f'FIT manufacturer {manufacturer}')
+
+    columns = {
+        'lat': lats,
+        'lon': lons,
+        'time': times,
+        'elevation': elevations,
+        'hr': heart_rates
+    }
+    for field in SENSOR_FIELDS:
+        if field in recorded:
+            columns[field] = sensors[field]
+    track = TrackArray(columns).freeze()
+
+    track.metadata['creator'] = creator
+    track.metadata['points_per_minute'] = measure_points_per_minute(track['time'], sample_minutes)
+    track.metadata['lap_starts'] = sorted(lap_starts)
+    return track
@@ -0,0 +1,122 @@
+"""
+Geodesic kernels for whole tracks.
+
+Each kernel works on complete columns at once. With NumPy installed the
+work is done in batched array operations; otherwise an equivalent pure-Python
+loop evaluating the same formula in the same order is used.
+"""
+from array import array
+from math import radians, sin, cos, sqrt, atan2, inf
+from app.track import np, has_numpy
+
+EARTH_RADIUS_MILES = 3956  # Radius of Earth in miles
+
+# Function to calculate distance using Haversine formula
+def haversine(lat1, lon1, lat2, lon2):
+    dlat = radians(lat2 - lat1)
+    dlon = radians(lon2 - lon1)
+    a = (sin(dlat / 2) ** 2 +
+         cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2)
+    c = 2 * atan2(sqrt(a), sqrt(1 - a))
+    return EARTH_RADIUS_MILES * c
+
+def step_distances(lats, lons):
+    """
+    Distance in miles from each point to the one before it.
+
+    The cosine of every latitude is computed once and shared by the two
+    pairs that use it. The first entry is always 0.
+    """
+    n = len(lats)
+    if has_numpy:
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        distances = np.zeros(n)
+        if n < 2:
+            return distances
+        cos_lat = np.cos(np.radians(lats))
+        a = (np.sin(np.radians(np.diff(lats)) / 2) ** 2 +
+             cos_lat[:-1] * cos_lat[1:] * np.sin(np.radians(np.diff(lons)) / 2) ** 2)
+        distances[1:] = EARTH_RADIUS_MILES * (2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a)))
+        return distances
+
+    distances = array('d', bytes(8 * n))
+    if n < 2:
+        return distances
+    cos_lat = [cos(radians(lat)) for lat in lats]
+    for i in range(1, n):
+        a = (sin(radians(lats[i] - lats[i - 1]) / 2) ** 2 +
+             cos_lat[i - 1] * cos_lat[i] * sin(radians(lons[i] - lons[i - 1]) / 2) ** 2)
+        distances[i] = EARTH_RADIUS_MILES * (2 * atan2(sqrt(a), sqrt(1 - a)))
+    return distances
+
+def time_steps(times):
+    """Seconds elapsed since the previous point (first entry is 0)"""
+    n = len(times)
+    if has_numpy:
+        steps = np.zeros(n)
+        if n > 1:
+            steps[1:] = np.diff(np.asarray(times, dtype=np.float64))
+        return steps
+
+    steps = array('d', bytes(8 * n))
+    for i in range(1, n):
+        steps[i] = times[i] - times[i - 1]
+    return steps
+
+def cumulative_sum(values):
+    """Running total of a column"""
+    if has_numpy:
+        return np.cumsum(np.asarray(values, dtype=np.float64))
+
+    totals = array('d', bytes(8 * len(values)))
+    total = 0.0
+    for i, value in enumerate(values):
+        total += value
+        totals[i] = total
+    return totals
+
+def instantaneous_pace(distances, steps, min_distance=0.0):
+    """
+    Pace in min/mile for every step.
+
+    Steps that do not move forward in time, or cover no more than
+    `min_distance` miles, get an infinite pace.
+    """
+    if has_numpy:
+        distances = np.asarray(distances, dtype=np.float64)
+        minutes = np.asarray(steps, dtype=np.float64) / 60
+        valid = (minutes > 0) & (distances > 0) & (distances >= min_distance)
+        paces = np.full(len(distances), inf)
+        paces[valid] = minutes[valid] / distances[valid]
+        return paces
+
+    paces = array('d', [inf]) * len(distances)
+    for i, distance in enumerate(distances):
+        minutes = steps[i] / 60
+        if minutes > 0 and distance > 0 and distance >= min_distance:
+            paces[i] = minutes / distance
+    return paces
+
+def add_motion_columns(track, min_distance=0.0):
+    """
+    Attach the derived motion columns to a TrackArray:
+
+    distance (miles from the previous point), cum_distance (miles),
+    time_step (seconds from the previous point), elapsed (seconds since the
+    first point) and pace (min/mile, see instantaneous_pace).
+    """
+    distances = step_distances(track['lat'], track['lon'])
+    steps = time_steps(track['time'])
+    times = track['time']
+    start = times[0] if len(times) else 0.0
+
+    track.set_column('distance', distances)
+    track.set_column('cum_distance', cumulative_sum(distances))
+    track.set_column('time_step', steps)
+    if has_numpy:
+        track.set_column('elapsed', np.asarray(times, dtype=np.float64) - start)
+    else:
+        track.set_column('elapsed', array('d', (t - start for t in times)))
+    track.set_column('pace', instantaneous_pace(distances, steps, min_distance))
+    return track
@@ -0,0 +1,210 @@
+"""
+GPS cleanup ahead of pace classification.
+
+Two stages. Before anything else, positions whose implied speed from both
+neighbours is impossible for a runner (a spike out and back) are dropped.
+After the motion columns are derived, steps that still imply an impossible
+speed (a jump that doesn't come back) don't count towards distance, and the
+speed is smoothed - a centered rolling window over time, or a
+constant-velocity Kalman filter - to give the pace used for classification.
+The smoothed pace is always finite: standing still is MAX_PACE.
+"""
+import bisect
+from array import array
+from app.track import np, has_numpy
+from app.geo import step_distances, time_steps, cumulative_sum
+
+METERS_PER_MILE = 1609.344
+
+# Pace given to points that are not moving at all (min/mile)
+MAX_PACE = 60.0
+
+# max_speed in mph (20 mph is 3:00 min/mile, the sanity bound the segment
+# validation uses); smoothing: 'rolling', 'kalman' or 'none'; window in
+# seconds for 'rolling'; process_noise (m/s^2) and measurement_noise (m)
+# for 'kalman'
+GPS_FILTER_DEFAULTS = {
+    'max_speed': 20.0,
+    'smoothing': 'rolling',
+    'window': 20,
+    'process_noise': 0.5,
+    'measurement_noise': 5.0
+}
+
+def step_speeds(distances, steps):
+    """Speed in mph of every step; steps that don't move forward in time get 0"""
+    if has_numpy:
+        distances = np.asarray(distances, dtype=np.float64)
+        steps = np.asarray(steps, dtype=np.float64)
+        return np.where(steps > 0, distances * 3600 / np.where(steps > 0, steps, 1.0), 0.0)
+    return array('d', (distance * 3600 / step if step > 0 else 0.0 for distance, step in zip(distances, steps)))
+
+def outlier_mask(track, max_speed=20.0, passes=3):
+    """
+    Per-point bools, False for position spikes: points reached and left
+    again at more than `max_speed` mph. The first and last point only have
+    one step, which must be too fast while the step next to it is not.
+    Each pass judges all points at once against their kept neighbours; a
+    few passes clear clusters of spikes.
+    """
+    n = len(track)
+    lats, lons, times = track['lat'], track['lon'], track['time']
+    if has_numpy:
+        keep = np.ones(n, dtype=bool)
+        for _ in range(passes):
+            kept = np.flatnonzero(keep)
+            if len(kept) < 3:
+                break
+            speeds = step_speeds(step_distances(lats[kept], lons[kept]), time_steps(times[kept]))
+            too_fast = speeds > max_speed
+            spikes = np.zeros(len(kept), dtype=bool)
+            spikes[1:-1] = too_fast[1:-1] & too_fast[2:]
+            spikes[0] = too_fast[1] and not too_fast[2]
+            spikes[-1] = too_fast[-1] and not too_fast[-2]
+            if not spikes.any():
+                break
+            keep[kept[spikes]] = False
+        return keep
+
+    keep = [True] * n
+    for _ in range(passes):
+        kept = [i for i in range(n) if keep[i]]
+        if len(kept) < 3:
+            break
+        speeds = step_speeds(step_distances([lats[i] for i in kept], [lons[i] for i in kept]),
+                             time_steps([times[i] for i in kept]))
+        too_fast = [speed > max_speed for speed in speeds]
+        spikes = [False] * len(kept)
+        for k in range(1, len(kept) - 1):
+            spikes[k] = too_fast[k] and too_fast[k + 1]
+        spikes[0] = too_fast[1] and not too_fast[2]
+        spikes[-1] = too_fast[-1] and not too_fast[-2]
+        if not any(spikes):
+            break
+        for k, spike in enumerate(spikes):
+            if spike:
+                keep[kept[k]] = False
+    return keep
+
+def reject_outliers(track, max_speed=20.0):
+    """Track without its position spikes, and the number of points dropped"""
+    keep = outlier_mask(track, max_speed)
+    if has_numpy:
+        rejected = len(track) - int(np.count_nonzero(keep))
+        indices = np.flatnonzero(keep)
+    else:
+        rejected = len(track) - sum(keep)
+        indices = [i for i, value in enumerate(keep) if value]
+    return (track.take(indices) if rejected else track), rejected
+
+def rolling_speed(cum_distance, times, window=20):
+    """
+    Speed (mph) at every point over a centered window of `window` seconds:
+    distance over time between the first and last point inside it. On
+    sparse tracks (smart recording, downsampled files) a point with no other
+    point inside its window gets the speed over the steps on either side of
+    it rather than 0.
+    """
+    n = len(times)
+    half = window / 2
+    if has_numpy:
+        times = np.asarray(times, dtype=np.float64)
+        lo = np.searchsorted(times, times - half, side='left')
+        hi = np.maximum(np.searchsorted(times, times + half, side='right') - 1, lo)
+        alone = hi == lo
+        if alone.any():
+            positions = np.arange(n)
+            lo = np.where(alone, np.maximum(positions - 1, 0), lo)
+            hi = np.where(alone, np.minimum(positions + 1, n - 1), hi)
+        span = times[hi] - times[lo]
+        return np.where(span > 0, (cum_distance[hi] - cum_distance[lo]) * 3600 / np.where(span > 0, span, 1.0), 0.0)
+
+    speeds = array('d', bytes(8 * n))
+    for i in range(n):
+        lo = bisect.bisect_left(times, times[i] - half)
+        hi = max(bisect.bisect_right(times, times[i] + half) - 1, lo)
+        if hi == lo:
+            lo, hi = max(i - 1, 0), min(i + 1, n - 1)
+        span = times[hi] - times[lo]
+        speeds[i] = (cum_distance[hi] - cum_distance[lo]) * 3600 / span if span > 0 else 0.0
+    return speeds
+
+def kalman_speed(cum_distance, times, process_noise=0.5, measurement_noise=5.0):
+    """
+    Speed (mph) from a constant-velocity Kalman filter over the cumulative
+    distance: the state is (position, velocity) in meters and seconds,
+    `process_noise` the acceleration noise (m/s^2) and `measurement_noise`
+    the distance error (m). The filter is a recursion, so this is one
+    sequential pass over scalars.
+    """
+    n = len(times)
+    if has_numpy:
+        cum_distance, times = cum_distance.tolist(), times.tolist()
+    positions = [value * METERS_PER_MILE for value in cum_distance]
+    speeds = [0.0] * n
+    if not n:
+        return speeds
+    q = process_noise ** 2
+    r = measurement_noise ** 2
+    position, velocity = positions[0], 0.0
+    p00, p01, p11 = r, 0.0, 25.0
+    for i in range(1, n):
+        dt = times[i] - times[i - 1]
+        if dt > 0:
+            # Predict
+            position += velocity * dt
+            p00 += dt * (2 * p01 + dt * p11) + q * dt ** 4 / 4
+            p01 += dt * p11 + q * dt ** 3 / 2
+            p11 += q * dt ** 2
+        # Update with the measured position
+        innovation = positions[i] - position
+        s = p00 + r
+        k0, k1 = p00 / s, p01 / s
+        position += k0 * innovation
+        velocity += k1 * innovation
+        p00, p01, p11 = (1 - k0) * p00, (1 - k0) * p01, p11 - k1 * p01
+        speeds[i] = max(velocity, 0.0) * 3600 / METERS_PER_MILE
+    return speeds
+
+def smooth_motion(track, max_speed=20.0, smoothing='rolling', window=20, process_noise=0.5, measurement_noise=5.0):
+    """
+    Clean the motion columns of a track from add_motion_columns in place.
+
+    Steps faster than `max_speed` mph are taken out of distance and
+    cum_distance. Adds a speed column (mph, smoothed as configured) and
+    replaces pace with the pace of that speed, capped at MAX_PACE.
+    Returns the number of steps taken out.
+    """
+    distances = track['distance']
+    raw_speeds = step_speeds(distances, track['time_step'])
+    if has_numpy:
+        jumps = raw_speeds > max_speed
+        jump_count = int(np.count_nonzero(jumps))
+        if jump_count:
+            distances = np.where(jumps, 0.0, distances)
+            raw_speeds = np.where(jumps, 0.0, raw_speeds)
+    else:
+        jumps = [speed > max_speed for speed in raw_speeds]
+        jump_count = sum(jumps)
+        if jump_count:
+            distances = array('d', (0.0 if jump else distance for distance, jump in zip(distances, jumps)))
+            raw_speeds = array('d', (0.0 if jump else speed for speed, jump in zip(raw_speeds, jumps)))
+    if jump_count:
+        track.set_column('distance', distances)
+        track.set_column('cum_distance', cumulative_sum(distances))
+
+    if smoothing == 'rolling':
+        speeds = rolling_speed(track['cum_distance'], track['time'], window)
+    elif smoothing == 'kalman':
+        speeds = kalman_speed(track['cum_distance'], track['time'], process_noise, measurement_noise)
+    else:
+        speeds = raw_speeds
+    track.set_column('speed', speeds)
+
+    floor = 60 / MAX_PACE
+    if has_numpy:
+        speeds = track['speed']
+        track.set_column('pace', np.where(speeds > floor, 60 / np.where(speeds > floor, speeds, 1.0), MAX_PACE))
+    else:
+        track.set_column('pace', array('d', (60 / speed if speed > floor else MAX_PACE for speed in track['speed'])))
+    return jump_count
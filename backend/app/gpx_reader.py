@@ -0,0 +1,189 @@
+import xml.etree.ElementTree as ET
+from array import array
+from app.track import TrackArray, np, has_numpy
+from app.timestamps import decode_timestamps
+
+GPX_NAMESPACE = 'http://www.topografix.com/GPX/1/1'
+
+TRKPT_TAG = f'{{{GPX_NAMESPACE}}}trkpt'
+TRKSEG_TAG = f'{{{GPX_NAMESPACE}}}trkseg'
+TIME_TAG = f'{{{GPX_NAMESPACE}}}time'
+ELE_TAG = f'{{{GPX_NAMESPACE}}}ele'
+
+# Sensor columns read from trackpoint extensions, keyed by the element local
+# names used by Garmin TrackPointExtension v1/v2, Strava, Coros and Suunto exports.
+# The device's own speed (m/s) is kept as 'device_speed', apart from the
+# smoothed 'speed' (mph) column the analysis derives
+EXTENSION_FIELDS = {
+    'hr': ('hr', 'heartrate', 'HeartRateBpm'),
+    'cadence': ('cad', 'cadence', 'RunCadence'),
+    'power': ('power', 'PowerInWatts', 'Watts'),
+    'temperature': ('atemp', 'wtemp', 'temp', 'Temperature'),
+    'device_speed': ('speed', 'Speed')
+}
+
+FIELD_BY_NAME = {name: field for field, names in EXTENSION_FIELDS.items() for name in names}
+
+class ExtensionExtractor:
+    """
+    Reads sensor values from trackpoint extensions with a direct child walk.
+
+    The first few trackpoints are searched in full to learn where each field
+    lives in this file (namespace and nesting). The paths are compiled into a
+    tag trie, so every later point only visits the children on those paths.
+    Fields that are still unknown are looked for again every
+    RELEARN_INTERVAL points, e.g. when a strap connects after the start.
+    """
+    LEARN_POINTS = 5
+    RELEARN_INTERVAL = 100
+
+    def __init__(self):
+        self.trie = {}
+        self.fields = set()
+        self.points_seen = 0
+
+    def extract(self, trkpt, values):
+        """Fill `values` (field -> text) for one trackpoint"""
+        self.points_seen += 1
+        if (self.points_seen <= self.LEARN_POINTS or
+                (len(self.fields) < len(EXTENSION_FIELDS) and
+                 self.points_seen % self.RELEARN_INTERVAL == 0)):
+            self._learn(trkpt, ())
+        self._walk(trkpt, self.trie, values)
+
+    def _walk(self, node, trie, values):
+        for child in node:
+            entry = trie.get(child.tag)
+            if entry is None:
+                continue
+            if isinstance(entry, str):
+                values[entry] = child.text
+            else:
+                self._walk(child, entry, values)
+
+    def _learn(self, node, path):
+        for child in node:
+            if child.tag in (TIME_TAG, ELE_TAG):
+                continue
+            field = FIELD_BY_NAME.get(child.tag.rpartition('}')[2])
+            if field is not None and field not in self.fields and child.text and child.text.strip():
+                self._add_path(path + (child.tag,), field)
+            elif len(child):
+                self._learn(child, path + (child.tag,))
+
+    def _add_path(self, path, field):
+        trie = self.trie
+        for tag in path[:-1]:
+            trie = trie.setdefault(tag, {})
+            if isinstance(trie, str):
+                return
+        trie[path[-1]] = field
+        self.fields.add(field)
+
+def read_gpx_track(source, sample_minutes=2):
+    """
+    Read every trackpoint of a GPX document in a single streaming pass.
+
+    The document is walked with ElementTree.iterparse and each trackpoint is
+    cleared (and detached from its segment) as soon as it has been read, so
+    the full XML tree is never built in memory. Sensor extensions (HR,
+    cadence, power, temperature, device speed) are read by an ExtensionExtractor.
+    Timestamps are collected as text and decoded in bulk once the walk is
+    done, after which the point frequency for the first `sample_minutes` of
+    activity is measured.
+
+    Args:
+        source: Path or binary file-like object containing GPX XML
+        sample_minutes: Length of the window used for frequency detection
+
+    Returns:
+        TrackArray with 'creator' and 'points_per_minute' (None if it could
+        not be measured) in its metadata. Sensor columns other than hr are
+        only present when the file records them.
+    """
+    lats = array('d')
+    lons = array('d')
+    elevations = array('d')
+    sensors = {field: array('d') for field in EXTENSION_FIELDS}
+    time_texts = []
+    extractor = ExtensionExtractor()
+    root = None
+    current_segment = None
+    nan = float('nan')
+
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            elif elem.tag == TRKSEG_TAG:
+                current_segment = elem
+            continue
+
+        if elem.tag == TRKSEG_TAG:
+            current_segment = None
+            continue
+        if elem.tag != TRKPT_TAG:
+            continue
+
+        try:
+            time_text = None
+            elevation = 0
+            for child in elem:
+                if child.tag == TIME_TAG:
+                    time_text = child.text
+                elif child.tag == ELE_TAG:
+                    elevation = float(child.text)
+
+            if time_text:
+                values = {}
+                extractor.extract(elem, values)
+
+                lats.append(float(elem.get('lat')))
+                lons.append(float(elem.get('lon')))
+                elevations.append(elevation)
+                for field, column in sensors.items():
+                    try:
+                        column.append(float(values[field]))
+                    except (KeyError, TypeError, ValueError):
+                        column.append(nan)
+                time_texts.append(time_text.strip())
+        except Exception as e:
+            print(f"Error processing point: {str(e)}")
+        finally:
+            # Free the element and everything below it
+            elem.clear()
+            if current_segment is not None:
+                current_segment.remove(elem)
+
+    columns = {
+        'lat': lats,
+        'lon': lons,
+        'time': decode_timestamps(time_texts),
+        'elevation': elevations,
+        'hr': sensors.pop('hr')
+    }
+    for field, column in sensors.items():
+        if field in extractor.fields:
+            columns[field] = column
+    track = TrackArray(columns).freeze()
+
+    track.metadata['creator'] = root.get('creator') if root is not None else None
+    track.metadata['points_per_minute'] = measure_points_per_minute(track['time'], sample_minutes)
+    return track
+
+def measure_points_per_minute(times, sample_minutes=2):
+    """Points per minute over the first `sample_minutes` of a time column"""
+    if len(times) < 2:
+        return None
+
+    # Calculate actual sample duration (in case activity is shorter than sample_minutes)
+    actual_minutes = min(sample_minutes, (times[-1] - times[0]) / 60)
+    if actual_minutes <= 0:
+        return None
+
+    cutoff_time = times[0] + sample_minutes * 60
+    if has_numpy:
+        points_in_window = int(np.count_nonzero(np.asarray(times) <= cutoff_time))
+    else:
+        points_in_window = sum(1 for time in times if time <= cutoff_time)
+    return points_in_window / actual_minutes
@@ -0,0 +1,180 @@
+"""
+Run file ingestion.
+
+Every supported format is registered with a sniffer, which recognizes the
+format from the first bytes of a file, and the dotted path of its reader.
+Readers are only imported the first time a file of their format comes in,
+so startup doesn't pay for parsers nobody uses. Whatever the format, the
+reader returns a TrackArray and the analysis takes it from there.
+
+Gzip-compressed files of any format are inflated while the reader parses
+them (see app.compression).
+"""
+import io
+import os
+import importlib
+from app.compression import COMPRESSED_EXTENSIONS, decompressed, peek
+
+# Bytes read from the start of a file to recognize its format
+SNIFF_BYTES = 4096
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+FORMATS = []
+_readers = {}
+
+def register_format(name, sniff, reader, extensions=()):
+    """
+    Register a run file format.
+
+    Args:
+        name: Short format name ('gpx', 'fit', ...)
+        sniff: Function taking the first SNIFF_BYTES bytes of a file and
+               returning True if the file is in this format
+        reader: 'module:function' path of the reader, which is called as
+                reader(source, sample_minutes=2) with a path or binary
+                file-like object and returns a TrackArray
+        extensions: Upload file name extensions of the format
+    """
+    FORMATS.append({'name': name, 'sniff': sniff, 'reader': reader, 'extensions': tuple(extensions)})
+
+def run_file_extensions():
+    """File name extensions of all registered formats, plain and compressed"""
+    extensions = tuple(extension for entry in FORMATS for extension in entry['extensions'])
+    return extensions + tuple(extension + suffix for suffix in COMPRESSED_EXTENSIONS for extension in extensions)
+
+def _xml_root_is(head, name):
+    """True if the first element of an XML document (any prefix) is `name`"""
+    position = 0
+    while True:
+        position = head.find(b'<', position)
+        if position < 0 or position + 1 >= len(head):
+            return False
+        if head[position + 1:position + 2] not in (b'?', b'!'):
+            end = position + 1
+            while end < len(head) and head[end:end + 1] not in b' \t\r\n/>':
+                end += 1
+            return head[position + 1:end].rpartition(b':')[2] == name
+        position += 1
+
+def sniff_fit(head):
+    # The FIT header check lives with the decoder; importing it here, not at
+    # module level, keeps the decoder out of startup like the other readers
+    from app.fit_reader import is_fit
+    return is_fit(head)
+
+def sniff_tcx(head):
+    return _xml_root_is(head, b'TrainingCenterDatabase')
+
+def sniff_gpx(head):
+    return _xml_root_is(head, b'gpx')
+
+register_format('fit', sniff_fit, 'app.fit_reader:read_fit_track', ('.fit',))
+register_format('tcx', sniff_tcx, 'app.tcx_reader:read_tcx_track', ('.tcx',))
+register_format('gpx', sniff_gpx, 'app.gpx_reader:read_gpx_track', ('.gpx',))
+
+def detect_format(head):
+    """Registry entry of the format the first bytes of a file belong to, or None"""
+    # A UTF-8 byte order mark doesn't change the format
+    if head.startswith(b'\xef\xbb\xbf'):
+        head = head[3:]
+    for entry in FORMATS:
+        if entry['sniff'](head):
+            return entry
+    return None
+
+def get_reader(entry):
+    """Reader function of a format, imported on first use"""
+    reader = _readers.get(entry['name'])
+    if reader is None:
+        module_name, _, function_name = entry['reader'].partition(':')
+        reader = getattr(importlib.import_module(module_name), function_name)
+        _readers[entry['name']] = reader
+    return reader
+
+class HashingReader(io.RawIOBase):
+    """
+    Read-only view of a seekable binary stream that feeds every byte read
+    through it to a hashlib object, once each: seeking back (as the format
+    sniffing does) doesn't hash bytes again, and bytes skipped by seeking
+    ahead are hashed before the read that follows.
+    """
+
+    def __init__(self, stream, digest):
+        self.stream = stream
+        self.digest = digest
+        self.position = stream.tell()
+        self.hashed = self.position
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self.position = self.stream.seek(offset, whence)
+        return self.position
+
+    def readinto(self, buffer):
+        if self.position > self.hashed:
+            self.stream.seek(self.hashed)
+            self.digest.update(self.stream.read(self.position - self.hashed))
+            self.hashed = self.stream.tell()
+        data = self.stream.read(len(buffer))
+        size = len(data)
+        buffer[:size] = data
+        end = self.position + size
+        if end > self.hashed:
+            self.digest.update(memoryview(data)[self.hashed - self.position:])
+            self.hashed = end
+        self.position = end
+        return size
+
+    def finish(self):
+        """Hash whatever the reader left unread"""
+        self.seek(self.hashed)
+        while self.read(HASH_CHUNK_SIZE):
+            pass
+
+def read_track(source, sample_minutes=2, digest=None):
+    """
+    Read a run file of any registered format into a TrackArray.
+
+    `source` can be a path, the raw file bytes or a binary file-like
+    object, gzip-compressed or not. The format is recognized from the
+    content, not the file name; the file is then read in one streaming pass
+    by the format's reader. The format name is kept in the track metadata.
+    If `digest` (a hashlib object) is given, it is fed the file content -
+    inflated, for compressed files - as the reader consumes it.
+    """
+    if isinstance(source, str):
+        if not os.path.exists(source):
+            raise FileNotFoundError(f"Run file not found at {source}")
+        with open(source, 'rb') as handle:
+            return read_track(handle, sample_minutes, digest)
+
+    # In-memory uploads are parsed straight from the buffer
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    elif not source.seekable():
+        source = io.BytesIO(source.read())
+
+    stream = decompressed(source)
+    compressed = stream is not source
+    if digest is not None:
+        stream = HashingReader(stream, digest)
+    head = peek(stream, SNIFF_BYTES)
+
+    entry = detect_format(head)
+    if entry is None:
+        raise ValueError("Unrecognized run file format (expected GPX, TCX or FIT)")
+    print(f"Detected {'compressed ' if compressed else ''}{entry['name'].upper()} file")
+    track = get_reader(entry)(stream, sample_minutes=sample_minutes)
+    if digest is not None:
+        stream.finish()
+    track.metadata['format'] = entry['name']
+    return track
@@ -0,0 +1,260 @@
+"""
+Interval (lap) detection.
+
+The moving part of a run is cut into bins of a few seconds of moving time,
+each with its average speed (distance over time, from the segment prefix
+sums). Work/rest boundaries are the change points of that speed series
+found with PELT: an optimal partition under a squared-error cost plus a
+penalty per lap, where candidate start points that can no longer win are
+pruned, which keeps the search close to linear. Laps are then labelled by
+splitting their speeds into a fast and a slow group.
+
+Binning bounds the series (a 5 s bin turns a 10k-point track into a few
+hundred values) and averages out GPS noise before the search. The search
+itself is a recursion over the bins; with NumPy each step scores all live
+candidates at once.
+
+Files that record laps (TCX, FIT) keep their own boundaries instead; see
+laps_from_starts.
+"""
+import math
+from bisect import bisect_right
+from app.track import np, has_numpy
+from app.segments import run_lengths
+
+# bin_seconds and min_lap_seconds are moving time; penalty scales the cost
+# of an extra lap (in units of the speed noise); laps only count as work
+# and rest when the two groups are min_contrast mph apart
+INTERVAL_DEFAULTS = {
+    'bin_seconds': 5,
+    'min_lap_seconds': 30,
+    'penalty': 3.0,
+    'min_contrast': 1.0
+}
+
+# Lower bound on the speed noise (mph), so a very even run isn't cut up
+MIN_SPEED_NOISE = 0.3
+
+def speed_bins(track, sums, bin_seconds=5):
+    """
+    Bins of `bin_seconds` moving time over a track with motion columns.
+
+    Returns (edges, speeds, seconds): bin k covers the prefix-sum range
+    (edges[k], edges[k + 1]] of point indices, with its average speed (mph)
+    and moving seconds.
+    """
+    moving_time = sums['moving_time']
+    if has_numpy:
+        bins = np.floor(moving_time / bin_seconds).astype(np.int64)
+    else:
+        bins = [int(value // bin_seconds) for value in moving_time]
+    ends = run_lengths(bins)[1]
+
+    distance = sums['distance']
+    edges = [0]
+    speeds = []
+    seconds = []
+    for end in ends:
+        last = end - 1
+        step_seconds = float(moving_time[last] - moving_time[edges[-1]])
+        if step_seconds <= 0:
+            continue
+        speeds.append(float(distance[last] - distance[edges[-1]]) * 3600 / step_seconds)
+        seconds.append(step_seconds)
+        edges.append(last)
+    return edges, speeds, seconds
+
+def speed_noise(speeds):
+    """Robust standard deviation (mph) of a speed series from its successive differences"""
+    if len(speeds) < 3:
+        return MIN_SPEED_NOISE
+    differences = sorted(abs(speeds[k] - speeds[k - 1]) for k in range(1, len(speeds)))
+    middle = len(differences) // 2
+    median = differences[middle] if len(differences) % 2 else (differences[middle - 1] + differences[middle]) / 2
+    return max(1.4826 * median / math.sqrt(2), MIN_SPEED_NOISE)
+
+def pelt(speeds, weights, penalty, min_weight):
+    """
+    Optimal change points of a weighted series (PELT).
+
+    The cost of a segment is the weighted squared deviation from its mean,
+    and every segment costs `penalty` extra; segments carry at least
+    `min_weight` total weight. Returns the segment end positions (the last
+    one is len(speeds)).
+    """
+    m = len(speeds)
+    w0, w1, w2 = [0.0], [0.0], [0.0]
+    for speed, weight in zip(speeds, weights):
+        w0.append(w0[-1] + weight)
+        w1.append(w1[-1] + weight * speed)
+        w2.append(w2[-1] + weight * speed * speed)
+
+    best_start = [0] * (m + 1)
+    if has_numpy:
+        w0, w1, w2 = np.array(w0), np.array(w1), np.array(w2)
+        total = np.full(m + 1, np.inf)
+        total[0] = -penalty
+        candidates = np.array([0], dtype=np.intp)
+        for t in range(1, m + 1):
+            admissible = w0[t] - w0[candidates] >= min_weight
+            keep = ~admissible
+            if admissible.any():
+                starts = candidates[admissible]
+                sum1 = w1[t] - w1[starts]
+                cost = total[starts] + (w2[t] - w2[starts]) - sum1 * sum1 / (w0[t] - w0[starts])
+                k = int(np.argmin(cost))
+                total[t] = cost[k] + penalty
+                best_start[t] = int(starts[k])
+                keep[admissible] = cost <= total[t]
+            candidates = np.append(candidates[keep], t)
+    else:
+        total = [math.inf] * (m + 1)
+        total[0] = -penalty
+        candidates = [0]
+        for t in range(1, m + 1):
+            costs = {}
+            for s in candidates:
+                if w0[t] - w0[s] >= min_weight:
+                    sum1 = w1[t] - w1[s]
+                    costs[s] = total[s] + (w2[t] - w2[s]) - sum1 * sum1 / (w0[t] - w0[s])
+            if costs:
+                start = min(costs, key=lambda s: (costs[s], s))
+                total[t] = costs[start] + penalty
+                best_start[t] = start
+            candidates = [s for s in candidates if s not in costs or costs[s] <= total[t]] + [t]
+
+    ends = []
+    t = m
+    while t > 0:
+        ends.append(t)
+        t = best_start[t]
+    return ends[::-1]
+
+def label_laps(speeds, seconds, min_contrast=1.0):
+    """
+    'work', 'rest' or 'steady' for laps with the given speeds (mph) and
+    durations: the split of the speeds into a fast and a slow group with the
+    least duration-weighted variance, unless the groups are less than
+    `min_contrast` mph apart
+    """
+    n = len(speeds)
+    if n < 2:
+        return ['steady'] * n
+    order = sorted(range(n), key=lambda i: speeds[i])
+    best = None
+    for cut in range(1, n):
+        groups = (order[:cut], order[cut:])
+        means = []
+        spread = 0.0
+        for group in groups:
+            weight = sum(seconds[i] for i in group)
+            mean = sum(speeds[i] * seconds[i] for i in group) / weight
+            spread += sum(seconds[i] * (speeds[i] - mean) ** 2 for i in group)
+            means.append(mean)
+        if best is None or spread < best[0]:
+            best = (spread, cut, means)
+    _, cut, (slow_mean, fast_mean) = best
+    if fast_mean - slow_mean < min_contrast:
+        return ['steady'] * n
+    fast = set(order[cut:])
+    return ['work' if i in fast else 'rest' for i in range(n)]
+
+def _hr_values(hr, start, end):
+    values = hr[start:end]
+    if has_numpy:
+        return values[values == values].tolist()
+    return [value for value in values if value == value]
+
+def detect_laps(track, sums, bin_seconds=5, min_lap_seconds=30, penalty=3.0, min_contrast=1.0):
+    """
+    Laps of a track with smoothed motion columns and its segment prefix
+    sums.
+
+    Each lap has its number, type ('work', 'rest', 'warmup', 'cooldown' or
+    'steady' when the run has no intervals), the index range [start_idx,
+    end_idx), epoch start/end times, distance (miles), moving time
+    (minutes), pace (min/mile), average and max HR and, for a rest lap right
+    after a work lap, the lowest HR in it (recovery_hr) and how far HR fell
+    from the end of the work lap (hr_drop).
+    """
+    edges, speeds, seconds = speed_bins(track, sums, bin_seconds)
+    if not speeds:
+        return []
+    noise = speed_noise(speeds)
+    cost = penalty * noise * noise * bin_seconds * math.log(max(len(speeds), 2))
+    ends = pelt(speeds, seconds, cost, min_lap_seconds)
+    return build_laps(track, sums, [edges[0]] + [edges[end] for end in ends], min_contrast)
+
+def laps_from_starts(track, sums, lap_starts, min_contrast=1.0):
+    """
+    Laps of a track cut at the lap start times recorded in the file (epoch
+    seconds), as detect_laps returns them. A lap starts at the last point
+    at or before its start time; laps without moving time are merged into
+    the next one.
+    """
+    times = track['time']
+    n = len(track)
+    if n < 2:
+        return []
+    if has_numpy:
+        starts = (np.searchsorted(times, np.asarray(lap_starts, dtype=float), side='right') - 1).tolist()
+    else:
+        starts = [bisect_right(times, start) - 1 for start in lap_starts]
+
+    moving_time = sums['moving_time']
+    boundaries = [0]
+    # The last point closes the last lap whenever any moving time follows
+    # the last usable start
+    for boundary in sorted(starts) + [n - 1]:
+        if boundary > boundaries[-1] and moving_time[boundary] > moving_time[boundaries[-1]]:
+            boundaries.append(boundary)
+    return build_laps(track, sums, boundaries, min_contrast)
+
+def build_laps(track, sums, boundaries, min_contrast=1.0):
+    """
+    Laps between consecutive prefix-sum boundaries: lap k covers the points
+    (boundaries[k], boundaries[k + 1]], like a segment. Laps are labelled
+    with label_laps; see detect_laps for the fields.
+    """
+    times = track['time']
+    hr = track['hr']
+    laps = []
+    for first, last in zip(boundaries, boundaries[1:]):
+        distance = float(sums['distance'][last] - sums['distance'][first])
+        moving_seconds = float(sums['moving_time'][last] - sums['moving_time'][first])
+        hr_count = sums['hr_count'][last] - sums['hr_count'][first]
+        heart_rates = _hr_values(hr, first + 1, last + 1)
+        laps.append({
+            'lap': len(laps) + 1,
+            'start_idx': first,
+            'end_idx': last + 1,
+            'start_time': float(times[first]),
+            'end_time': float(times[last]),
+            'distance': distance,
+            'moving_time_minutes': moving_seconds / 60,
+            'pace': moving_seconds / 60 / distance if distance > 0 else 0,
+            'avg_hr': float(sums['total_hr'][last] - sums['total_hr'][first]) / hr_count if hr_count > 0 else 0,
+            'max_hr': max(heart_rates) if heart_rates else 0,
+            'end_hr': heart_rates[-1] if heart_rates else 0,
+            'recovery_hr': None,
+            'hr_drop': None,
+            'speed': distance * 3600 / moving_seconds if moving_seconds > 0 else 0
+        })
+
+    if not laps:
+        return []
+    types = label_laps([lap['speed'] for lap in laps], [lap['moving_time_minutes'] for lap in laps], min_contrast)
+    if 'work' in types:
+        first_work = types.index('work')
+        last_work = len(types) - 1 - types[::-1].index('work')
+        types = ['warmup' if i < first_work else 'cooldown' if i > last_work else kind
+                 for i, kind in enumerate(types)]
+    for i, (lap, kind) in enumerate(zip(laps, types)):
+        lap['type'] = kind
+        del lap['speed']
+        if kind == 'rest' and i > 0 and types[i - 1] == 'work':
+            heart_rates = _hr_values(hr, lap['start_idx'] + 1, lap['end_idx'])
+            if heart_rates and laps[i - 1]['end_hr']:
+                lap['recovery_hr'] = min(heart_rates)
+                lap['hr_drop'] = laps[i - 1]['end_hr'] - lap['recovery_hr']
+    return laps
@@ -0,0 +1,311 @@
+"""
+Background analysis jobs.
+
+Uploads are queued in a `jobs` table of the main database and picked up by
+a pool of worker processes (started by one of the web workers from the
+gunicorn post_worker_init hook), so an upload request only has to store
+the file. Workers
+claim jobs in a write transaction, which also enforces a global limit on
+jobs running at once across every web worker. Failed jobs are retried with
+a growing delay until they run out of attempts; jobs whose worker stopped
+sending progress are handed to another worker.
+"""
+import io
+import os
+import json
+import time
+import uuid
+import sqlite3
+import traceback
+import threading
+import multiprocessing
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, every process runs its own pool
+    fcntl = None
+from app.running import analyze_run_file, read_run_track
+from app.database import RunDatabase, safe_json_dumps
+from app.track_store import RunTrackStore
+from app.pace_distribution import PaceHistogramStore
+from app.best_efforts import BestEffortStore
+
+JOB_CONCURRENCY = int(os.environ.get('JOB_CONCURRENCY', 2))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+JOB_STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', 600))
+JOB_POLL_INTERVAL = 1.0
+JOB_RETRY_DELAY = 5  # Seconds before the first retry; doubles per attempt
+
+JOB_COLUMNS = ('id', 'user_id', 'batch_id', 'status', 'stage', 'progress', 'attempts', 'max_attempts',
+               'run_id', 'error', 'filename', 'created_at', 'updated_at')
+
+def ensure_jobs_table(conn):
+    """Create the jobs table if it doesn't exist"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',  /* queued, running, done, failed */
+            stage TEXT DEFAULT 'queued',
+            progress REAL DEFAULT 0,
+            attempts INTEGER DEFAULT 0,
+            max_attempts INTEGER DEFAULT 3,
+            payload BLOB,
+            params TEXT,
+            filename TEXT,
+            batch_id TEXT,  /* bulk imports: the jobs of one request */
+            run_id INTEGER,
+            error TEXT,
+            worker TEXT,
+            available_at REAL DEFAULT 0,
+            created_at REAL,
+            updated_at REAL,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    ''')
+    try:
+        conn.execute('SELECT batch_id FROM jobs LIMIT 1')
+    except sqlite3.OperationalError:
+        print("Adding batch_id column to jobs table")
+        conn.execute('ALTER TABLE jobs ADD COLUMN batch_id TEXT')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, available_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs (batch_id)')
+
+class JobQueue:
+    """Queue operations on the jobs table"""
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+        with self._connect() as conn:
+            ensure_jobs_table(conn)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_name, timeout=30)
+
+    def enqueue(self, user_id, payload, params, filename=None, max_attempts=JOB_MAX_ATTEMPTS, batch_id=None):
+        """Store an upload for analysis and return the job id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('''
+                INSERT INTO jobs (id, user_id, batch_id, status, stage, payload, params, filename,
+                                  max_attempts, available_at, created_at, updated_at)
+                VALUES (?, ?, ?, 'queued', 'queued', ?, ?, ?, ?, ?, ?, ?)
+            ''', (job_id, user_id, batch_id, sqlite3.Binary(payload), json.dumps(params), filename,
+                  max_attempts, now, now, now))
+        print(f"Queued analysis job {job_id} for user {user_id}")
+        return job_id
+
+    def claim(self, worker, concurrency=JOB_CONCURRENCY):
+        """
+        Take the oldest runnable job, or None.
+
+        Abandoned jobs (running without an update for JOB_STALE_SECONDS) are
+        put back in the queue first. Nothing is claimed while `concurrency`
+        jobs are already running. Single uploads go before bulk import
+        jobs, so a large import doesn't hold them up.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.isolation_level = None
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('''
+                UPDATE jobs SET status = 'queued', stage = 'requeued', worker = NULL
+                WHERE status = 'running' AND updated_at < ?
+            ''', (now - JOB_STALE_SECONDS,))
+
+            running = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'running'").fetchone()[0]
+            if running >= concurrency:
+                conn.execute('COMMIT')
+                return None
+
+            row = conn.execute('''
+                SELECT id, user_id, payload, params, filename, attempts, max_attempts FROM jobs
+                WHERE status = 'queued' AND available_at <= ?
+                ORDER BY batch_id IS NOT NULL, created_at LIMIT 1
+            ''', (now,)).fetchone()
+            if not row:
+                conn.execute('COMMIT')
+                return None
+
+            conn.execute('''
+                UPDATE jobs SET status = 'running', stage = 'starting', progress = 0,
+                                attempts = attempts + 1, worker = ?, updated_at = ?
+                WHERE id = ?
+            ''', (worker, now, row[0]))
+            conn.execute('COMMIT')
+            return {
+                'id': row[0],
+                'user_id': row[1],
+                'payload': bytes(row[2]),
+                'params': json.loads(row[3] or '{}'),
+                'filename': row[4],
+                'attempts': row[5] + 1,
+                'max_attempts': row[6]
+            }
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def update_progress(self, job_id, stage, progress):
+        """Record the stage a running job is in (also serves as its heartbeat)"""
+        with self._connect() as conn:
+            conn.execute('UPDATE jobs SET stage = ?, progress = ?, updated_at = ? WHERE id = ?',
+                         (stage, progress, time.time(), job_id))
+
+    def complete(self, job_id, run_id):
+        """Mark a job done and drop its stored upload"""
+        with self._connect() as conn:
+            conn.execute('''
+                UPDATE jobs SET status = 'done', stage = 'done', progress = 1, run_id = ?,
+                                payload = NULL, error = NULL, updated_at = ?
+                WHERE id = ?
+            ''', (run_id, time.time(), job_id))
+
+    def fail(self, job_id, error, attempts, max_attempts):
+        """Queue a failed job for another attempt, or mark it failed for good"""
+        now = time.time()
+        with self._connect() as conn:
+            if attempts < max_attempts:
+                delay = JOB_RETRY_DELAY * (2 ** (attempts - 1))
+                conn.execute('''
+                    UPDATE jobs SET status = 'queued', stage = 'retrying', error = ?, worker = NULL,
+                                    available_at = ?, updated_at = ?
+                    WHERE id = ?
+                ''', (error, now + delay, now, job_id))
+                print(f"Job {job_id} failed (attempt {attempts}/{max_attempts}), retrying in {delay}s")
+            else:
+                conn.execute('''
+                    UPDATE jobs SET status = 'failed', stage = 'failed', error = ?, payload = NULL,
+                                    updated_at = ?
+                    WHERE id = ?
+                ''', (error, now, job_id))
+                print(f"Job {job_id} failed permanently: {error}")
+
+    def get(self, job_id, user_id=None):
+        """Job status as a dict (without the upload), or None"""
+        query = f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?"
+        args = [job_id]
+        if user_id is not None:
+            query += ' AND user_id = ?'
+            args.append(user_id)
+        with self._connect() as conn:
+            row = conn.execute(query, args).fetchone()
+        return dict(zip(JOB_COLUMNS, row)) if row else None
+
+    def batch(self, batch_id, user_id):
+        """Statuses of the jobs of a bulk import, oldest first"""
+        with self._connect() as conn:
+            rows = conn.execute(f'''
+                SELECT {', '.join(JOB_COLUMNS)} FROM jobs
+                WHERE batch_id = ? AND user_id = ?
+                ORDER BY created_at, rowid
+            ''', (batch_id, user_id)).fetchall()
+        return [dict(zip(JOB_COLUMNS, row)) for row in rows]
+
+def run_job(queue, database, job):
+    """Analyze a claimed job's upload and save the run"""
+    params = job['params']
+    pace_limit = params.pop('pace_limit')
+    run_date = params.pop('run_date')
+
+    def progress(stage, fraction):
+        queue.update_progress(job['id'], stage, fraction)
+
+    track = read_run_track(io.BytesIO(job['payload']))
+    raw_track = track.to_bytes()
+    result = analyze_run_file(track, pace_limit, progress=progress, **params)
+    result['run_date'] = run_date
+
+    progress('saving', 0.95)
+    run_id = database.add_run(
+        user_id=job['user_id'],
+        date=run_date,
+        data=safe_json_dumps(result),
+        total_distance=result['total_distance'],
+        avg_pace=result.get('overall_avg_pace', 0),
+        avg_hr=result.get('avg_hr_all', 0),
+        pace_limit=pace_limit,
+        elevation_gain=result.get('elevation_gain'),
+        elevation_loss=result.get('elevation_loss')
+    )
+    if run_id is None:
+        raise Exception("Failed to save run")
+    RunTrackStore(queue.db_name).save(run_id, job['user_id'], raw_track, params)
+    PaceHistogramStore(queue.db_name).save(run_id, job['user_id'], run_date, result.get('pace_histogram'))
+    BestEffortStore(queue.db_name).save(run_id, job['user_id'], run_date, result.get('best_efforts'))
+    return run_id
+
+def worker_loop(db_name, worker, concurrency=JOB_CONCURRENCY, poll_interval=JOB_POLL_INTERVAL):
+    """Claim and run jobs forever (entry point of a worker process)"""
+    queue = JobQueue(db_name)
+    database = RunDatabase(db_name)
+    print(f"Job worker {worker} started")
+    while True:
+        try:
+            job = queue.claim(worker, concurrency)
+        except Exception as e:
+            print(f"Job worker {worker} could not claim a job: {str(e)}")
+            job = None
+        if not job:
+            time.sleep(poll_interval)
+            continue
+
+        print(f"Job worker {worker} running job {job['id']} (attempt {job['attempts']})")
+        try:
+            run_id = run_job(queue, database, job)
+            queue.complete(job['id'], run_id)
+        except Exception as e:
+            traceback.print_exc()
+            queue.fail(job['id'], str(e), job['attempts'], job['max_attempts'])
+
+_workers = []
+_workers_lock = threading.Lock()
+_pool_lock = None
+
+def _own_pool(db_name):
+    """
+    True if this process runs the job pool for `db_name`. The first web
+    worker to ask takes an exclusive lock on a file next to the database and
+    keeps it for life; the others leave the jobs to its pool. The lock is
+    released when that process (and the workers it forked) exits, and the
+    next enqueue elsewhere takes over.
+    """
+    global _pool_lock
+    if _pool_lock is not None or fcntl is None:
+        return True
+    handle = open(f"{db_name}.jobs.lock", 'a')
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return False
+    _pool_lock = handle
+    return True
+
+def start_workers(db_name, count=JOB_CONCURRENCY):
+    """
+    Start the job workers (daemon processes that end with this process)
+    unless another web worker already runs them, so there is one pool per
+    database however many gunicorn workers there are. Safe to call on every
+    enqueue.
+
+    The pool is forked from the calling process, so it should first be
+    started before that process runs other threads: gunicorn.conf.py does
+    it from post_worker_init. The call on enqueue is a fallback for the
+    development server and for taking the pool over when the web worker
+    that ran it has been restarted.
+    """
+    with _workers_lock:
+        if not _own_pool(db_name):
+            return
+        alive = [process for process in _workers if process.is_alive()]
+        _workers[:] = alive
+        for _ in range(count - len(alive)):
+            worker = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+            process = multiprocessing.Process(target=worker_loop, args=(db_name, worker, count), daemon=True)
+            process.start()
+            _workers.append(process)
@@ -0,0 +1,256 @@
+"""
+Distance, time and heart rate by pace for whole runs.
+
+During analysis every moving point's distance, time step and HR are binned
+into fixed pace buckets (5 s/mile wide, 3:00 to 20:00 min/mile, plus one
+bucket for anything slower). Because the grid is the same for every run,
+histograms of many runs can simply be added up. The fast/slow split at any
+pace limit is a binary search over the cumulative bucket totals, and within
+the bucket that straddles the limit the totals are interpolated linearly.
+
+Note that the split is per point: it answers "how far did I run at or under
+this pace", without the segment building and filtering the full analysis
+does for its fast/slow segments.
+"""
+import json
+import math
+import bisect
+import sqlite3
+from app.track import np, has_numpy
+
+PACE_BUCKET_START = 3.0  # min/mile
+PACE_BUCKET_WIDTH = 5 / 60  # 5 seconds per mile
+PACE_BUCKET_COUNT = 204  # Up to 20:00 min/mile; one more bucket holds slower paces
+
+HISTOGRAM_FIELDS = ('distance', 'time', 'hr_sum', 'hr_count')
+
+def pace_bucket_indices(paces):
+    """
+    Bucket of every pace. Bucket i holds paces in (start + i*width,
+    start + (i+1)*width]; bucket 0 also takes anything faster and bucket
+    PACE_BUCKET_COUNT anything slower than the grid (including infinity).
+    """
+    if has_numpy:
+        paces = np.asarray(paces, dtype=np.float64)
+        finite = np.isfinite(paces)
+        positions = np.where(finite, (paces - PACE_BUCKET_START) / PACE_BUCKET_WIDTH, PACE_BUCKET_COUNT + 1)
+        return np.clip(np.ceil(positions - 1e-9) - 1, 0, PACE_BUCKET_COUNT).astype(np.intp)
+
+    indices = []
+    for pace in paces:
+        if math.isinf(pace):
+            indices.append(PACE_BUCKET_COUNT)
+        else:
+            index = math.ceil((pace - PACE_BUCKET_START) / PACE_BUCKET_WIDTH - 1e-9) - 1
+            indices.append(min(max(index, 0), PACE_BUCKET_COUNT))
+    return indices
+
+def build_pace_histogram(track, moving):
+    """
+    Pace histogram of a track with motion columns, over its moving points.
+
+    Returns a dict with the grid ('start', 'width', 'count') and, for the
+    buckets from 'first' to the last one used, per-bucket lists of distance
+    (miles), time (seconds), hr_sum and hr_count (valid HR samples).
+    """
+    size = PACE_BUCKET_COUNT + 1
+    hr = track['hr']
+    if has_numpy:
+        moving = np.asarray(moving, dtype=bool)
+        buckets = pace_bucket_indices(track['pace'][moving])
+        hr = hr[moving]
+        valid_hr = (hr == hr) & (hr != 0)
+        totals = {
+            'distance': np.bincount(buckets, weights=track['distance'][moving], minlength=size),
+            'time': np.bincount(buckets, weights=track['time_step'][moving], minlength=size),
+            'hr_sum': np.bincount(buckets, weights=np.where(valid_hr, hr, 0.0), minlength=size),
+            'hr_count': np.bincount(buckets, weights=valid_hr.astype(np.float64), minlength=size)
+        }
+        totals = {field: values.tolist() for field, values in totals.items()}
+    else:
+        totals = {field: [0.0] * size for field in HISTOGRAM_FIELDS}
+        points = [i for i, keep in enumerate(moving) if keep]
+        paces = track['pace']
+        distances = track['distance']
+        steps = track['time_step']
+        for i, bucket in zip(points, pace_bucket_indices([paces[i] for i in points])):
+            totals['distance'][bucket] += distances[i]
+            totals['time'][bucket] += steps[i]
+            if hr[i] == hr[i] and hr[i] != 0:
+                totals['hr_sum'][bucket] += hr[i]
+                totals['hr_count'][bucket] += 1
+
+    used = [i for i in range(size) if totals['time'][i] > 0 or totals['distance'][i] > 0]
+    first, last = (used[0], used[-1] + 1) if used else (0, 0)
+    return {
+        'start': PACE_BUCKET_START,
+        'width': PACE_BUCKET_WIDTH,
+        'count': PACE_BUCKET_COUNT,
+        'first': first,
+        'distance': [round(value, 5) for value in totals['distance'][first:last]],
+        'time': [round(value, 2) for value in totals['time'][first:last]],
+        'hr_sum': [round(value, 1) for value in totals['hr_sum'][first:last]],
+        'hr_count': [int(value) for value in totals['hr_count'][first:last]]
+    }
+
+def merge_histograms(histograms):
+    """Sum of pace histograms on the same grid (e.g. every run in a period)"""
+    histograms = [histogram for histogram in histograms if histogram and histogram['distance']]
+    if not histograms:
+        return empty_histogram()
+    first = min(histogram['first'] for histogram in histograms)
+    last = max(histogram['first'] + len(histogram['distance']) for histogram in histograms)
+    merged = empty_histogram()
+    merged['first'] = first
+    for field in HISTOGRAM_FIELDS:
+        values = [0] * (last - first)
+        for histogram in histograms:
+            offset = histogram['first'] - first
+            for i, value in enumerate(histogram[field]):
+                values[offset + i] += value
+        merged[field] = values
+    return merged
+
+def empty_histogram():
+    """Histogram without any samples"""
+    histogram = {'start': PACE_BUCKET_START, 'width': PACE_BUCKET_WIDTH, 'count': PACE_BUCKET_COUNT, 'first': 0}
+    histogram.update({field: [] for field in HISTOGRAM_FIELDS})
+    return histogram
+
+def bucket_upper_edges(histogram):
+    """Upper pace bound of each stored bucket (infinity for the overflow bucket)"""
+    start, width, count = histogram['start'], histogram['width'], histogram['count']
+    return [start + (bucket + 1) * width if bucket < count else math.inf
+            for bucket in range(histogram['first'], histogram['first'] + len(histogram['distance']))]
+
+def cumulative_totals(histogram):
+    """Running totals of every field over the stored buckets, fastest first"""
+    totals = {}
+    for field in HISTOGRAM_FIELDS:
+        running = 0
+        totals[field] = []
+        for value in histogram[field]:
+            running += value
+            totals[field].append(running)
+    return totals
+
+def _side(distance, seconds, hr_sum, hr_count):
+    return {
+        'distance': distance,
+        'time_minutes': seconds / 60,
+        'avg_pace': (seconds / 60 / distance) if distance > 0 else 0,
+        'avg_hr': (hr_sum / hr_count) if hr_count > 0 else 0
+    }
+
+def pace_split(histogram, pace_limit, edges=None, totals=None):
+    """
+    Fast/slow distance, time, pace and HR of a histogram at a pace limit.
+
+    Buckets entirely at or under the limit count as fast; the bucket the
+    limit falls in is split in proportion to where the limit lies in it.
+    `edges` and `totals` (from bucket_upper_edges/cumulative_totals) can be
+    passed in when one histogram is queried repeatedly.
+    """
+    edges = edges if edges is not None else bucket_upper_edges(histogram)
+    totals = totals if totals is not None else cumulative_totals(histogram)
+    if not edges:
+        fast = {field: 0 for field in HISTOGRAM_FIELDS}
+        overall = dict(fast)
+    else:
+        limit = float(pace_limit)
+        width = histogram['width']
+        k = bisect.bisect_left(edges, limit)
+        fast = {field: (totals[field][k - 1] if k > 0 else 0) for field in HISTOGRAM_FIELDS}
+        if k < len(edges) and not math.isinf(edges[k]):
+            lower = max(edges[k] - width, histogram['start'])
+            fraction = min(max((limit - lower) / (edges[k] - lower), 0.0), 1.0)
+            for field in HISTOGRAM_FIELDS:
+                fast[field] += fraction * histogram[field][k]
+        overall = {field: totals[field][-1] for field in HISTOGRAM_FIELDS}
+
+    slow = {field: overall[field] - fast[field] for field in HISTOGRAM_FIELDS}
+    total_distance = overall['distance']
+    return {
+        'pace_limit': float(pace_limit),
+        'fast': _side(fast['distance'], fast['time'], fast['hr_sum'], fast['hr_count']),
+        'slow': _side(slow['distance'], slow['time'], slow['hr_sum'], slow['hr_count']),
+        'percentage_fast': (fast['distance'] / total_distance * 100) if total_distance > 0 else 0,
+        'total_distance': total_distance
+    }
+
+def pace_curve(histogram):
+    """
+    Cumulative curve for charting: for every bucket edge, the distance
+    (miles) and time (minutes) run at or under that pace
+    """
+    totals = cumulative_totals(histogram)
+    return [
+        {'pace': edge, 'distance': distance, 'time_minutes': seconds / 60}
+        for edge, distance, seconds in zip(bucket_upper_edges(histogram), totals['distance'], totals['time'])
+        if not math.isinf(edge)
+    ]
+
+def ensure_pace_histograms_table(conn):
+    """Create the run_pace_histograms table if it doesn't exist"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS run_pace_histograms (
+            run_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            date TEXT,
+            histogram TEXT NOT NULL,
+            FOREIGN KEY (run_id) REFERENCES runs(id)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_run_pace_histograms_user ON run_pace_histograms (user_id, date)')
+
+class PaceHistogramStore:
+    """Storage operations on the run_pace_histograms table"""
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+        with self._connect() as conn:
+            ensure_pace_histograms_table(conn)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_name, timeout=30)
+
+    def save(self, run_id, user_id, date, histogram):
+        """Store (or replace) the pace histogram of a run"""
+        if not histogram:
+            return
+        with self._connect() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO run_pace_histograms (run_id, user_id, date, histogram)
+                VALUES (?, ?, ?, ?)
+            ''', (run_id, user_id, date, json.dumps(histogram)))
+
+    def get(self, run_id, user_id=None):
+        """Pace histogram of a run, or None"""
+        query = 'SELECT histogram FROM run_pace_histograms WHERE run_id = ?'
+        args = [run_id]
+        if user_id is not None:
+            query += ' AND user_id = ?'
+            args.append(user_id)
+        with self._connect() as conn:
+            row = conn.execute(query, args).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def for_user(self, user_id, start_date=None, end_date=None):
+        """(run_id, date, histogram) of a user's runs, optionally within a date range, oldest first"""
+        query = 'SELECT run_id, date, histogram FROM run_pace_histograms WHERE user_id = ?'
+        args = [user_id]
+        if start_date:
+            query += ' AND date >= ?'
+            args.append(start_date)
+        if end_date:
+            query += ' AND date <= ?'
+            args.append(end_date)
+        query += ' ORDER BY date, run_id'
+        with self._connect() as conn:
+            rows = conn.execute(query, args).fetchall()
+        return [(run_id, date, json.loads(histogram)) for run_id, date, histogram in rows]
+
+    def delete(self, run_id):
+        """Drop the pace histogram of a run"""
+        with self._connect() as conn:
+            conn.execute('DELETE FROM run_pace_histograms WHERE run_id = ?', (run_id,))
@@ -0,0 +1,63 @@
+"""
+Auto-pause: stopped intervals in a track.
+
+A step (the interval from one point to the next) is stopped when the
+smoothed speed is under a threshold, or when it is a recording gap longer
+than `max_gap` seconds that covers hardly any ground (a watch that paused
+itself). Stopped steps only become a pause once they add up to
+`min_pause` seconds in a row, so a slow corner doesn't count. Paused points
+are marked in a 'paused' column, which moving_mask honours, so they drop
+out of segmentation, splits, zone time and the moving time.
+"""
+from app.track import np, has_numpy
+from app.segments import run_lengths
+
+# stop_speed in mph (1.5 mph is a 40 min/mile shuffle), max_gap and
+# min_pause in seconds
+PAUSE_DEFAULTS = {
+    'stop_speed': 1.5,
+    'max_gap': 30,
+    'min_pause': 10
+}
+
+def stopped_steps(track, stop_speed=1.5, max_gap=30):
+    """Per-point bools for a track with smoothed motion columns: True where the step into the point is stopped"""
+    speeds = track['speed']
+    steps = track['time_step']
+    distances = track['distance']
+    if has_numpy:
+        gap_stop = (steps > max_gap) & (distances * 3600 < stop_speed * steps)
+        return (steps > 0) & ((speeds < stop_speed) | gap_stop)
+    return [step > 0 and (speed < stop_speed or (step > max_gap and distance * 3600 < stop_speed * step))
+            for speed, step, distance in zip(speeds, steps, distances)]
+
+def detect_pauses(track, stop_speed=1.5, max_gap=30, min_pause=10):
+    """
+    Mark the paused points of a track with smoothed motion columns (see
+    gps_filter.smooth_motion) in a 'paused' column (1.0 paused, 0.0 not).
+
+    Returns the pauses as dicts with the index range [start_idx, end_idx)
+    of the paused points and the pause duration in seconds.
+    """
+    stopped = stopped_steps(track, stop_speed, max_gap)
+    times = track['time']
+    starts, ends, flags = run_lengths(stopped)
+    pauses = []
+    for start, end, flag in zip(starts, ends, flags):
+        # Point `start` is reached from point start - 1, so that is where the stop begins
+        if flag and start > 0:
+            duration = float(times[end - 1] - times[start - 1])
+            if duration >= min_pause:
+                pauses.append({'start_idx': start, 'end_idx': end, 'duration': duration})
+
+    if has_numpy:
+        paused = np.zeros(len(track))
+        for pause in pauses:
+            paused[pause['start_idx']:pause['end_idx']] = 1.0
+    else:
+        paused = [0.0] * len(track)
+        for pause in pauses:
+            for i in range(pause['start_idx'], pause['end_idx']):
+                paused[i] = 1.0
+    track.set_column('paused', paused)
+    return pauses
@@ -0,0 +1,128 @@
+"""
+Content-addressed cache of analysis results.
+
+An upload is hashed while the parser reads it (inflated, so a .gpx.gz and
+its .gpx hash the same), and the result of analyzing it is stored under a
+key built from that hash, the pace limit, the profile settings the analysis
+uses, ANALYSIS_ENGINE_VERSION and the user, so entries are private to
+the user who uploaded the file. Uploading the same file with the same
+settings again returns the stored result without analyzing it again.
+Entries are evicted least recently used first once the cache grows past
+ANALYSIS_CACHE_MAX_BYTES, and entries of another engine version are dropped
+when the cache is opened.
+"""
+import os
+import json
+import time
+import hashlib
+import sqlite3
+from app.running import ANALYSIS_ENGINE_VERSION
+
+ANALYSIS_CACHE_MAX_BYTES = int(os.environ.get('ANALYSIS_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+def content_digest():
+    """
+    Hash object for an upload's content: pass it to read_run_track(...,
+    digest=) and its hexdigest() is the content hash once the file is parsed
+    """
+    return hashlib.sha256()
+
+def cache_key(content_hash, pace_limit, options, user_id):
+    """
+    Cache key for a user's file hash, pace limit and analysis options
+    (user_age, resting_hr, weight, gender, tz_name, ...). Results are never
+    shared between users, so a cache hit can't reveal that someone else
+    uploaded the same file.
+    """
+    settings = {
+        'user_id': user_id,
+        'content_hash': content_hash,
+        'pace_limit': float(pace_limit),
+        'engine_version': ANALYSIS_ENGINE_VERSION,
+        'options': options
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def ensure_cache_table(conn):
+    """Create the analysis_cache table if it doesn't exist"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS analysis_cache (
+            key TEXT PRIMARY KEY,
+            content_hash TEXT NOT NULL,
+            engine_version INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            user_id INTEGER,
+            run_id INTEGER,
+            created_at REAL,
+            last_used REAL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_analysis_cache_last_used ON analysis_cache (last_used)')
+
+class AnalysisCache:
+    """Cache operations on the analysis_cache table"""
+
+    def __init__(self, db_name, max_bytes=ANALYSIS_CACHE_MAX_BYTES):
+        self.db_name = db_name
+        self.max_bytes = max_bytes
+        with self._connect() as conn:
+            ensure_cache_table(conn)
+            dropped = conn.execute('DELETE FROM analysis_cache WHERE engine_version != ?',
+                                   (ANALYSIS_ENGINE_VERSION,)).rowcount
+        if dropped:
+            print(f"Analysis cache: dropped {dropped} results of other engine versions")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_name, timeout=30)
+
+    def get(self, key):
+        """
+        Cached entry as a dict with the encoded result in 'data' and the
+        run it was last saved as ('user_id', 'run_id'), or None
+        """
+        with self._connect() as conn:
+            row = conn.execute('''
+                SELECT data, user_id, run_id FROM analysis_cache
+                WHERE key = ? AND engine_version = ?
+            ''', (key, ANALYSIS_ENGINE_VERSION)).fetchone()
+            if not row:
+                return None
+            conn.execute('UPDATE analysis_cache SET last_used = ? WHERE key = ?', (time.time(), key))
+        return {'data': row[0], 'user_id': row[1], 'run_id': row[2]}
+
+    def put(self, key, content_hash, data, user_id=None, run_id=None):
+        """Store an encoded result, then evict old entries beyond the size limit"""
+        size = len(data.encode('utf-8'))
+        if size > self.max_bytes:
+            print(f"Analysis cache: result of {size} bytes is larger than the cache, not stored")
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO analysis_cache
+                    (key, content_hash, engine_version, data, size, user_id, run_id, created_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (key, content_hash, ANALYSIS_ENGINE_VERSION, data, size, user_id, run_id, now, now))
+        self.evict()
+
+    def link_run(self, key, user_id, run_id):
+        """Record the run a cached result was most recently saved as"""
+        with self._connect() as conn:
+            conn.execute('UPDATE analysis_cache SET user_id = ?, run_id = ? WHERE key = ?',
+                         (user_id, run_id, key))
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        with self._connect() as conn:
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM analysis_cache').fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            evicted = []
+            for key, size in conn.execute('SELECT key, size FROM analysis_cache ORDER BY last_used'):
+                if total <= self.max_bytes:
+                    break
+                evicted.append((key,))
+                total -= size
+            conn.executemany('DELETE FROM analysis_cache WHERE key = ?', evicted)
+        print(f"Analysis cache: evicted {len(evicted)} entries")
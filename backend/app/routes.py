@@ -6,7 +6,7 @@ import math
 from datetime import datetime
 from flask import jsonify, request, send_from_directory
 from app import app
-from app.running import analyze_run_file, needs_downsampling, downsample_gpx_smart
+from app.running import analyze_run_file
 from app.auth import authenticate_user, register_user, check_auth
 from app.database import get_db
 
@@ -37,6 +37,7 @@ def analyze():
         resting_hr = request.form.get('restingHR', None)
         weight = request.form.get('weight', None)
         gender = request.form.get('gender', None)
+        tz_name = request.form.get('timezone', None)
         
         # Convert to correct types
         pace_limit = float(pace_limit)
@@ -58,19 +59,8 @@ def analyze():
             
         print(f"Analysis parameters: pace_limit={pace_limit}, age={age}, resting_hr={resting_hr}")
         
-        # Check if this is a high-frequency file
-        is_high_frequency = needs_downsampling(file_path)
-        print(f"File detection: is_high_frequency={is_high_frequency}")
-        
-        if is_high_frequency:
-            print("Detected high-frequency file, downsampling...")
-            downsampled_path = os.path.join(temp_dir, "downsampled_" + file.filename)
-            downsample_gpx_smart(file_path, downsampled_path)
-            file_path = downsampled_path
-            print(f"Downsampling complete, using {file_path}")
-        
-        # Analyze the run
-        results = analyze_run_file(file_path, pace_limit, age, resting_hr, weight, gender)
+        # Analyze the run (high-frequency files are downsampled in memory)
+        results = analyze_run_file(file_path, pace_limit, age, resting_hr, weight, gender, tz_name)
         
         # Clean up the temp file
         shutil.rmtree(temp_dir)
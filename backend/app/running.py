@@ -1,654 +1,343 @@
-import xml.etree.ElementTree as ET
-from datetime import datetime, timedelta
-from math import radians, sin, cos, sqrt, atan2, isnan
+from datetime import datetime
+from math import isnan
 import traceback
 import os
 import glob
 import json
-from tzlocal import get_localzone
-import pytz
 import math
-
-# Add these constants at the top
-TRAINING_ZONES = {
-    'Zone 1': {
-        'name': 'Recovery',
-        'range': (0.30, 0.40),  # 30-40% of HRR
-        'description': 'Very light intensity, active recovery, improves basic endurance',
-        'color': '#7FB3D5'  # Light blue
-    },
-    'Zone 2': {
-        'name': 'Aerobic',
-        'range': (0.40, 0.60),  # 40-60% of HRR
-        'description': 'Light aerobic, fat burning, builds endurance',
-        'color': '#2ECC71'  # Green
-    },
-    'Zone 3': {
-        'name': 'Tempo',
-        'range': (0.60, 0.70),  # 60-70% of HRR
-        'description': 'Moderate intensity, improves efficiency and aerobic capacity',
-        'color': '#F4D03F'  # Yellow
-    },
-    'Zone 4': {
-        'name': 'Threshold',
-        'range': (0.70, 0.85),  # 70-85% of HRR
-        'description': 'Hard intensity, increases lactate threshold and speed',
-        'color': '#E67E22'  # Orange
-    },
-    'Zone 5': {
-        'name': 'VO2 Max',
-        'range': (0.85, 1.00),  # 85-100% of HRR
-        'description': 'Maximum effort, improves speed and power',
-        'color': '#E74C3C'  # Red
-    }
-}
-
-# Function to calculate distance using Haversine formula
-def haversine(lat1, lon1, lat2, lon2):    
-    R = 3956  # Radius of Earth in miles   
-    dlat = radians(lat2 - lat1)    
-    dlon = radians(lon2 - lon1)    
-    a = (sin(dlat / 2) ** 2 +         
-         cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2)    
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))    
-    return R * c
+from app.ingest import read_track, run_file_extensions
+from app.track import TrackArray
+from app.timestamps import parse_timestamp, get_timezone
+from app.geo import add_motion_columns
+from app.downsample import DOWNSAMPLE_DEFAULTS, select_points
+from app.segments import (classify_by_pace, classify_with_hysteresis, HYSTERESIS_DEFAULTS,
+                          true_indices, segment_prefix_sums, build_segments, segment_endpoints, pack_track)
+from app.zones import compute_training_zones, hr_sample_durations
+from app.pace_distribution import build_pace_histogram
+from app.splits import compute_unit_splits, as_mile_splits
+from app.elevation import ELEVATION_DEFAULTS, add_elevation_columns, segment_grades
+from app.best_efforts import find_best_efforts, riegel_predictions
+from app.gps_filter import GPS_FILTER_DEFAULTS, reject_outliers, smooth_motion
+from app.pauses import PAUSE_DEFAULTS, detect_pauses
+from app.intervals import INTERVAL_DEFAULTS, detect_laps, laps_from_starts
+
+# Version of the analysis output. Bump it whenever a change alters the
+# results for the same file and settings; cached results of other versions
+# are discarded.
+ANALYSIS_ENGINE_VERSION = 10
 
 # Parse datetime from ISO format
-def parse_time(time_str):
-    # Parse UTC time from GPX
-    utc_time = datetime.strptime(time_str, "%Y-%m-%dT%H:%M:%SZ")
-    utc_time = pytz.utc.localize(utc_time)
-    # Convert to local time
-    local_tz = get_localzone()
-    return utc_time.astimezone(local_tz)
+def parse_time(time_str, tz_name=None):
+    # Parse UTC time from GPX and convert to the requested (or server local) zone
+    return datetime.fromtimestamp(parse_timestamp(time_str), get_timezone(tz_name))
 
 # Add new downsampling functions
-def needs_downsampling(gpx_file, threshold_points_per_minute=20, sample_minutes=2):
+def needs_downsampling(track, threshold_points_per_minute=20):
     """
-    Determines if a GPX file needs downsampling by analyzing point frequency
-    in the first few minutes of activity.
+    Determines if a parsed track needs downsampling from the point frequency
+    measured in the first few minutes of activity by the file reader.
     
     Returns: (bool) True if downsampling is recommended
     """
-    try:
-        tree = ET.parse(gpx_file)
-        root = tree.getroot()
-        
-        namespaces = {
-            'gpx': 'http://www.topografix.com/GPX/1/1'
-        }
-        
-        # Get all trackpoints
-        track_points = root.findall('.//gpx:trkpt', namespaces)
-        
-        # Not enough points to worry about
-        if len(track_points) < 50:
-            return False
-            
-        # Get the timestamps from points
-        times = []
-        for point in track_points:
-            time_elem = point.find('./gpx:time', namespaces)
-            if time_elem is not None:
-                try:
-                    timestamp = datetime.strptime(time_elem.text, "%Y-%m-%dT%H:%M:%SZ")
-                    times.append(timestamp)
-                except (ValueError, TypeError):
-                    continue
-        
-        # Not enough timestamped points
-        if len(times) < 2:
-            return False
-            
-        # Sort times (they should already be sorted, but just to be safe)
-        times.sort()
-        
-        # Calculate the activity start time
-        start_time = times[0]
-        
-        # Calculate the cutoff time (start_time + sample_minutes)
-        cutoff_time = start_time + timedelta(minutes=sample_minutes)
-        
-        # Count points in the sample window
-        points_in_window = sum(1 for t in times if t <= cutoff_time)
-        
-        # Calculate actual sample duration (in case activity is shorter than sample_minutes)
-        actual_minutes = min(
-            sample_minutes,
-            (times[-1] - times[0]).total_seconds() / 60
-        )
-        
-        # Calculate points per minute
-        if actual_minutes > 0:
-            points_per_minute = points_in_window / actual_minutes
-            print(f"GPX file has {points_per_minute:.1f} points per minute")
-            
-            # Return True if points per minute exceeds threshold
-            return points_per_minute > threshold_points_per_minute
-        
+    # Not enough points to worry about
+    if len(track) < 50:
         return False
-    except Exception as e:
-        print(f"Error checking if file needs downsampling: {str(e)}")
+    
+    points_per_minute = track.metadata.get('points_per_minute')
+    if not points_per_minute:
         return False
+    
+    print(f"GPX file has {points_per_minute:.1f} points per minute")
+    
+    # Return True if points per minute exceeds threshold
+    return points_per_minute > threshold_points_per_minute
 
-def downsample_gpx_smart(input_gpx_file, output_gpx_file, min_time_gap=3, pace_limit=None):
+def downsample_track(track, min_time_gap=3, pace_limit=None, strategy='smart', target_points=None):
     """
     Smart downsampling that preserves heart rate trends and pace transition points.
     
     Args:
-        input_gpx_file: Original GPX file path
-        output_gpx_file: Path to save downsampled GPX
+        track: TrackArray as produced by read_run_track
         min_time_gap: Minimum seconds between points (default 3)
         pace_limit: Target pace threshold to preserve transition points around
+        strategy: 'smart' (time gap, HR change and pace transition rules) or
+                  'lttb' (shape-preserving, needs target_points)
+        target_points: Point budget for the 'lttb' strategy
+    
+    Returns:
+        TrackArray holding only the points to keep, in their original order
     """
-    try:
-        tree = ET.parse(input_gpx_file)
-        root = tree.getroot()
-        
-        namespaces = {
-            'gpx': 'http://www.topografix.com/GPX/1/1',
-            'gpxtpx': 'http://www.garmin.com/xmlschemas/TrackPointExtension/v1',
-            'gpxx': 'http://www.garmin.com/xmlschemas/GpxExtensions/v3'
-        }
-        
-        # Find all trackpoints
-        track_points = []
-        for trk in root.findall('.//gpx:trk', namespaces):
-            for trkseg in trk.findall('.//gpx:trkseg', namespaces):
-                for trkpt in trkseg.findall('.//gpx:trkpt', namespaces):
-                    track_points.append(trkpt)
-        
-        if len(track_points) < 100:  # Only downsample files with lots of points
-            print(f"Not enough trackpoints ({len(track_points)}) to downsample")
-            return False
-        
-        print(f"Original file has {len(track_points)} trackpoints")
-        
+    n = len(track)
+    if n < 100:  # Only downsample files with lots of points
+        print(f"Not enough trackpoints ({n}) to downsample")
+        return track
+    
+    print(f"Original file has {n} trackpoints")
+    
+    if strategy == 'lttb':
+        points_to_keep = select_points(track, 'lttb', target_points=target_points or 1000)
+    else:
         # Adjust min_time_gap based on file frequency
         # If extremely high frequency (more than 1 point per second), be more aggressive
-        points_per_minute = len(track_points) / 30  # Estimate for first 30 minutes
+        points_per_minute = n / 30  # Estimate for first 30 minutes
         if points_per_minute > 60:  # More than 1 point per second
             min_time_gap = max(min_time_gap, 5)  # Increase minimum time gap
             print(f"High frequency file detected, increasing minimum time gap to {min_time_gap} seconds")
         
-        # Extract data for all points with pace calculation
-        point_data = []
-        previous_point = None
-        
-        for i, point in enumerate(track_points):
-            # Extract lat/lon
-            lat = float(point.get('lat'))
-            lon = float(point.get('lon'))
-            
-            # Extract time
-            time_elem = point.find('./gpx:time', namespaces)
-            if time_elem is None:
-                continue
-            current_time = datetime.strptime(time_elem.text, "%Y-%m-%dT%H:%M:%SZ")
-            
-            # Extract heart rate
-            hr_elem = None
-            for path in ['.//gpxtpx:TrackPointExtension/gpxtpx:hr', './/gpx:extensions//hr', './/extensions//hr', './/hr']:
-                try:
-                    hr_elem = point.find(path, namespaces)
-                    if hr_elem is not None:
-                        break
-                except:
-                    continue
-                    
-            current_hr = int(hr_elem.text) if hr_elem is not None else None
-            
-            # Calculate time difference, distance, and pace if not first point
-            time_diff = 0
-            distance = 0
-            pace = 0
-            is_pace_transition = False
-            current_pace_status = None
-            
-            if previous_point:
-                time_diff = (current_time - previous_point['time']).total_seconds()
-                
-                # Calculate distance using Haversine
-                if time_diff > 0:
-                    distance = haversine(
-                        previous_point['lat'], previous_point['lon'], 
-                        lat, lon
-                    )
-                    
-                    # Calculate pace (min/mile)
-                    if distance > 0:
-                        pace = (time_diff / 60) / distance
-                        
-                        # Check if this point represents a pace transition
-                        if pace_limit:
-                            current_pace_status = pace <= float(pace_limit)
-                            
-                            if previous_point.get('pace_status') is not None:
-                                previous_pace_status = previous_point['pace_status']
-                                
-                                # Detect crossing the pace threshold
-                                if current_pace_status != previous_pace_status:
-                                    is_pace_transition = True
-            
-            # Calculate heart rate change if possible
-            hr_change = 0
-            if previous_point and previous_point['hr'] and current_hr:
-                hr_change = abs(current_hr - previous_point['hr'])
-                
-            # Create point data entry
-            point_item = {
-                'index': i,
-                'lat': lat,
-                'lon': lon,
-                'time': current_time,
-                'time_diff': time_diff,
-                'hr': current_hr,
-                'hr_change': hr_change,
-                'distance': distance, 
-                'pace': pace,
-                'is_pace_transition': is_pace_transition,
-                'pace_status': current_pace_status
-            }
-            
-            point_data.append(point_item)
-            previous_point = point_item
-        
-        # Always keep first and last points
-        points_to_keep = [0]
-        if len(track_points) > 1:
-            points_to_keep.append(len(track_points) - 1)
-        
-        # First pass: keep points based on time interval
-        current_index = 0
-        while current_index < len(point_data) - 1:  # Skip last point as we always keep it
-            next_index = current_index + 1
-            while next_index < len(point_data) - 1:
-                if point_data[next_index]['time_diff'] >= min_time_gap:
-                    points_to_keep.append(point_data[next_index]['index'])
-                    current_index = next_index
-                    break
-                next_index += 1
-            
-            if next_index >= len(point_data) - 1:
-                break
-        
-        # Second pass: add points with significant heart rate changes
-        significant_hr_change = 5
-        current_kept_point = 0
-        
-        for i in range(1, len(point_data) - 1):
-            if point_data[i]['index'] in points_to_keep:
-                current_kept_point = i
-                continue
-                
-            # Check if significant HR change from last kept point
-            if (point_data[i]['hr'] is not None and 
-                point_data[current_kept_point]['hr'] is not None and
-                abs(point_data[i]['hr'] - point_data[current_kept_point]['hr']) > significant_hr_change):
-                points_to_keep.append(point_data[i]['index'])
-                current_kept_point = i
-        
-        # Third pass: add points that mark pace transitions
         if pace_limit:
             print(f"Looking for pace transitions around {pace_limit} min/mile")
-            transition_points_added = 0
-            
-            for i in range(1, len(point_data) - 1):
-                if point_data[i]['is_pace_transition']:
-                    # Keep transition point and one point before and after
-                    if i > 0 and point_data[i-1]['index'] not in points_to_keep:
-                        points_to_keep.append(point_data[i-1]['index'])
-                        transition_points_added += 1
-                    
-                    if point_data[i]['index'] not in points_to_keep:
-                        points_to_keep.append(point_data[i]['index'])
-                        transition_points_added += 1
-                    
-                    if i < len(point_data)-1 and point_data[i+1]['index'] not in points_to_keep:
-                        points_to_keep.append(point_data[i+1]['index'])
-                        transition_points_added += 1
-            
-            print(f"Added {transition_points_added} points to preserve pace transitions")
-        
-        # Sort indices to keep original order
-        points_to_keep = sorted(set(points_to_keep))
-        
-        # For extremely high-frequency files, add further filtering 
-        # if we're still keeping too many points
-        if len(points_to_keep) > len(track_points) * 0.5:  # If keeping more than 50% of points
-            print("Still keeping too many points, applying additional filtering")
-            filtered_points = [points_to_keep[0]]  # Always keep first point
-            
-            # Keep only every Nth point except for pace transitions
-            keep_every_n = 2
-            transition_points = set()
-            
-            # Identify transition points
-            for i in range(1, len(point_data) - 1):
-                if point_data[i]['is_pace_transition']:
-                    transition_points.add(point_data[i]['index'])
-                    if i > 0:
-                        transition_points.add(point_data[i-1]['index'])
-                    if i < len(point_data)-1:
-                        transition_points.add(point_data[i+1]['index'])
-            
-            # Filter points, keeping important ones
-            for i in range(1, len(points_to_keep)-1):  # Skip first and last
-                idx = points_to_keep[i]
-                if idx in transition_points or i % keep_every_n == 0:
-                    filtered_points.append(idx)
-            
-            # Always keep last point
-            filtered_points.append(points_to_keep[-1])
-            points_to_keep = filtered_points
-        
-        # Create a new GPX tree with only the kept points
-        new_root = ET.Element(root.tag, root.attrib)
-        
-        # Copy all direct children except track
-        for child in root:
-            if child.tag.endswith('trk'):
-                continue
-            new_root.append(ET.Element(child.tag, child.attrib))
-            for subchild in child:
-                new_child = ET.SubElement(new_root.find(child.tag), subchild.tag, subchild.attrib)
-                new_child.text = subchild.text
-        
-        # Create new track element
-        for trk in root.findall('.//gpx:trk', namespaces):
-            new_trk = ET.SubElement(new_root, trk.tag, trk.attrib)
-            
-            # Copy track name and other track metadata
-            for child in trk:
-                if child.tag.endswith('trkseg'):
-                    continue
-                new_trk_child = ET.SubElement(new_trk, child.tag, child.attrib)
-                new_trk_child.text = child.text
-            
-            # Create new track segment
-            for trkseg in trk.findall('.//gpx:trkseg', namespaces):
-                new_trkseg = ET.SubElement(new_trk, trkseg.tag, trkseg.attrib)
-                
-                # Only add the track points we want to keep
-                track_points_in_segment = trkseg.findall('.//gpx:trkpt', namespaces)
-                segment_indices = range(len(track_points_in_segment))
-                
-                for i, trkpt in zip(segment_indices, track_points_in_segment):
-                    if i in points_to_keep:
-                        # Deep copy the track point with all its children
-                        new_trkpt = ET.SubElement(new_trkseg, trkpt.tag, trkpt.attrib)
-                        
-                        # Copy all children of the track point
-                        for child in trkpt:
-                            new_child = ET.SubElement(new_trkpt, child.tag, child.attrib)
-                            new_child.text = child.text
-                            
-                            # If this is an extensions element, copy all its children
-                            if child.tag.endswith('extensions'):
-                                for ext_child in child:
-                                    new_ext_child = ET.SubElement(new_child, ext_child.tag, ext_child.attrib)
-                                    new_ext_child.text = ext_child.text
-                                    
-                                    # Handle TrackPointExtension specifically
-                                    if ext_child.tag.endswith('TrackPointExtension'):
-                                        for tpx_child in ext_child:
-                                            new_tpx_child = ET.SubElement(new_ext_child, tpx_child.tag, tpx_child.attrib)
-                                            new_tpx_child.text = tpx_child.text
-        
-        # Write the new tree to file
-        tree = ET.ElementTree(new_root)
-        tree.write(output_gpx_file)
-        
-        # Count points in the new file
-        new_tree = ET.parse(output_gpx_file)
-        new_root = new_tree.getroot()
-        new_points = new_root.findall('.//gpx:trkpt', namespaces)
-        print(f"Downsampled file has {len(new_points)} trackpoints (reduced by {(1 - len(new_points)/len(track_points))*100:.1f}%)")
-        
-        return True
-    except Exception as e:
-        print(f"Error downsampling GPX file: {str(e)}")
-        traceback.print_exc()
-        return False
+        points_to_keep = select_points(track, strategy, min_time_gap=min_time_gap, pace_limit=pace_limit)
+    
+    print(f"Downsampled track has {len(points_to_keep)} trackpoints (reduced by {(1 - len(points_to_keep)/n)*100:.1f}%)")
+    
+    return track.take(points_to_keep)
+
+def prepare_track(track, pace_limit, gps_filter=None, downsample=None):
+    """
+    The points a run is analyzed on: `track` without its GPS outliers and,
+    for high-frequency files, downsampled with the `downsample` settings.
+    
+    Returns: (TrackArray, int, bool) the prepared track, the number of
+    outliers dropped and whether the file was high-frequency
+    """
+    # Drop position spikes before anything looks at the points
+    filter_settings = dict(GPS_FILTER_DEFAULTS, **(gps_filter or {}))
+    track, rejected_points = reject_outliers(track, filter_settings['max_speed'])
+    if rejected_points:
+        print(f"Rejected {rejected_points} GPS outliers (over {filter_settings['max_speed']} mph)")
+    
+    # Check if file needs downsampling
+    is_high_frequency = needs_downsampling(track, threshold_points_per_minute=20)
+    print(f"High-frequency detection result: {is_high_frequency}")
+    
+    if is_high_frequency:
+        print("High-frequency file detected, downsampling...")
+        # Pass the pace_limit to the downsampling function
+        downsample_settings = dict(DOWNSAMPLE_DEFAULTS, **(downsample or {}))
+        track = downsample_track(
+            track,
+            min_time_gap=downsample_settings['min_time_gap'],
+            pace_limit=pace_limit,
+            strategy=downsample_settings['strategy'],
+            target_points=downsample_settings['target_points']
+        )
+    return track, rejected_points, is_high_frequency
+
+def route_track(track, results, options=None):
+    """
+    The lat, lon and elevation columns that the index ranges in `results`
+    refer to, rebuilt from the raw track of the run (as stored with it) and
+    the options it was analyzed with. Passed to materialize_route, as the
+    results themselves don't carry the track.
+    """
+    options = options or {}
+    prepared, _, _ = prepare_track(track, results.get('pace_limit'), options.get('gps_filter'), options.get('downsample'))
+    return pack_track(prepared)
+
+# Upload file names accepted as runs; the format itself is detected from the content
+RUN_FILE_EXTENSIONS = run_file_extensions()
+
+def read_run_track(file_path, digest=None):
+    """
+    Parse a GPX, TCX or FIT run into a TrackArray.
+    
+    `file_path` can be a path, the raw file bytes or a binary file-like
+    object. The format is detected from the first bytes, not the file
+    name (see app.ingest). Every format is read in one streaming pass;
+    frequency detection happens during the same pass, and so does hashing
+    the content into `digest` if one is given.
+    """
+    return read_track(file_path, sample_minutes=2, digest=digest)
 
 # Function to parse GPX data and calculate distance under specified pace
-def analyze_run_file(file_path, pace_limit, user_age=None, resting_hr=None, weight=None, gender=None):
+def analyze_run_file(file_path, pace_limit, user_age=None, resting_hr=None, weight=None, gender=None, tz_name=None,
+                     classification=None, hysteresis=None, zone_model='hrr', lthr=None, elevation=None,
+                     gps_filter=None, auto_pause=None, intervals=None, downsample=None, progress=None):
+    """
+    Analyze a GPX, TCX or FIT run against a pace limit.
+    
+    `file_path` can be a path, the raw file bytes or a binary file-like
+    object such as an upload stream, so requests never need a temp file.
+    It can also be a track already read by read_run_track (e.g. one stored
+    with a run), which skips parsing. `elevation` overrides the
+    ELEVATION_DEFAULTS smoothing settings, `gps_filter` the
+    GPS_FILTER_DEFAULTS outlier and speed smoothing settings, `auto_pause`
+    the PAUSE_DEFAULTS stop detection settings, `intervals` the
+    INTERVAL_DEFAULTS lap detection settings (used when the file doesn't
+    record its own laps) and `downsample` the DOWNSAMPLE_DEFAULTS settings
+    for high-frequency files (e.g. {'strategy': 'lttb', 'target_points': 500}).
+    `progress`, if given, is called as progress(stage, fraction) as the
+    analysis moves through its stages.
+    """
+    def report(stage, fraction):
+        if progress:
+            progress(stage, fraction)
+    
     try:
         print(f"\n=== Starting Run Analysis ===")
-        print(f"File path: {file_path}")
+        print(f"File path: {file_path if isinstance(file_path, str) else type(file_path).__name__}")
         print(f"Pace limit: {pace_limit} min/mile")
         print(f"User metrics - Age: {user_age}, Resting HR: {resting_hr}")
         print(f"Additional metrics - Weight: {weight} (entered in lbs), Gender: {gender}")
+        print(f"Timezone: {tz_name or 'server local'}")
         
-        # Check if file needs downsampling
-        is_high_frequency = needs_downsampling(file_path, threshold_points_per_minute=20, sample_minutes=2)
-        print(f"High-frequency detection result: {is_high_frequency}")
+        report('parsing', 0.1)
+        if isinstance(file_path, TrackArray):
+            track = file_path
+            print("Using previously parsed track")
+        else:
+            track = read_run_track(file_path)
+            print("Successfully parsed GPX file")
         
-        if is_high_frequency:
-            print("High-frequency file detected, downsampling...")
-            downsampled_path = f"{file_path}_downsampled.gpx"
-            
-            # Pass the pace_limit to the downsampling function
-            success = downsample_gpx_smart(
-                file_path, 
-                downsampled_path, 
-                min_time_gap=3,
-                pace_limit=pace_limit
-            )
-            
-            if success:
-                print(f"Using downsampled file: {downsampled_path}")
-                file_path = downsampled_path
-            else:
-                print("Downsampling failed, using original file")
+        filter_settings = dict(GPS_FILTER_DEFAULTS, **(gps_filter or {}))
+        track, rejected_points, is_high_frequency = prepare_track(track, pace_limit, gps_filter, downsample)
+        
+        report('segmenting', 0.4)
         
         # Convert from lbs to kg
         weight_in_kg = weight * 0.453592
         
-        # Verify file exists
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"GPX file not found at {file_path}")
-        
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-        
-        print("Successfully parsed GPX file")
-        
-        ns = {
-            'gpx': 'http://www.topografix.com/GPX/1/1',
-            'ns3': 'http://www.garmin.com/xmlschemas/TrackPointExtension/v1'
-        }
-        
         # Add creator information from GPX metadata
-        creator = root.get('creator')
+        creator = track.metadata.get('creator')
         print(f"GPX creator: {creator}")
         
         # Initialize variables
-        total_distance_all = 0
-        total_hr = 0
-        total_hr_count = 0
-        point_segments = []
         fast_segments = []
         slow_segments = []
         total_fast_distance = 0
         total_slow_distance = 0
-        elevation_data = []
         
-        # Mile split tracking
-        current_mile = 0
-        mile_splits = []
-        accumulated_distance = 0
-        mile_start_time = None
-        mile_hr_values = []   # Separate list for mile splits
+        # Zone used when presenting segment times
+        local_tz = get_timezone(tz_name)
         
-        # Get local timezone
-        local_tz = get_localzone()
+        n = len(track)
+        print(f"Found {n} trackpoints ({track.nbytes / 1024:.1f} KB of track columns)")
         
-        # Extract trackpoints
-        trkpt_list = root.findall('.//gpx:trkpt', ns)
-        print(f"Found {len(trkpt_list)} trackpoints")
-        
-        if not trkpt_list:
+        if not n:
             print("No trackpoints found in GPX file")
             raise Exception("No trackpoints found in GPX file")
         
-        # Add this to track all heart rates
-        all_heart_rates = []  # Track all heart rates for the entire run
+        # Track all heart rates for the entire run
+        all_heart_rates = track.heart_rates()
+        
+        # First pass: derive per-point distance (miles), time step and pace in one batch,
+        # then drop impossible jumps from the distance and classify on smoothed speed
+        add_motion_columns(track)
+        jump_steps = smooth_motion(track, **filter_settings)
+        if jump_steps:
+            print(f"Ignored the distance of {jump_steps} steps over {filter_settings['max_speed']} mph")
+        times = track['time']
+        total_distance_all = float(track['cum_distance'][-1])
+        
+        # Auto-pause: stops (traffic lights, water stops, ...) drop out of
+        # segmentation, splits, zone time and the moving time
+        pause_settings = dict(PAUSE_DEFAULTS, **(auto_pause or {}))
+        pauses = detect_pauses(track, **pause_settings)
+        paused_seconds = sum(pause['duration'] for pause in pauses)
+        print(f"Auto-pause: {len(pauses)} pauses, {paused_seconds / 60:.1f} minutes ({pause_settings})")
+        
+        # Smoothed elevation (feet) with gain/loss counted past a noise deadband
+        elevation_settings = dict(ELEVATION_DEFAULTS, **(elevation or {}))
+        add_elevation_columns(track, **elevation_settings)
+        
+        # Points that moved forward in time take part in segmentation.
+        # Noisy high-frequency files are classified with hysteresis and a
+        # minimum dwell, so GPS jitter around the limit doesn't split the run
+        # into hundreds of tiny segments
+        if classification is None:
+            classification = 'hysteresis' if is_high_frequency else 'threshold'
+        if classification == 'hysteresis':
+            settings = dict(HYSTERESIS_DEFAULTS, **(hysteresis or {}))
+            print(f"Classifying with hysteresis: {settings}")
+            moving, is_fast = classify_with_hysteresis(track, pace_limit, **settings)
+        else:
+            moving, is_fast = classify_by_pace(track, pace_limit)
+        moving_points = true_indices(moving)
         
-        # First pass: Process all points and create basic segments
-        prev_point = None
-        for trkpt in trkpt_list:
-            try:
-                lat = float(trkpt.get('lat'))
-                lon = float(trkpt.get('lon'))
-                time_elem = trkpt.find('.//gpx:time', ns)
-                
-                # Get elevation
-                ele_elem = trkpt.find('.//gpx:ele', ns)
-                elevation = float(ele_elem.text) if ele_elem is not None else 0
-                
-                # Get heart rate
-                hr = None
-                for path in ['.//ns3:TrackPointExtension/ns3:hr', './/gpx:extensions//hr', './/extensions//hr', './/hr']:
-                    try:
-                        hr_elem = trkpt.find(path, ns)
-                        if hr_elem is not None:
-                            hr = int(hr_elem.text)
-                            all_heart_rates.append(hr)
-                            break
-                    except:
-                        continue
-                
-                if time_elem is not None:
-                    utc_time = datetime.strptime(time_elem.text, '%Y-%m-%dT%H:%M:%SZ')
-                    utc_time = pytz.utc.localize(utc_time)
-                    time = utc_time.astimezone(local_tz)
-                    
-                    if prev_point:
-                        distance = haversine(prev_point['lat'], prev_point['lon'], lat, lon)
-                        time_diff = (time - prev_point['time']).total_seconds() / 60
-                        total_distance_all += distance
-                        
-                        if time_diff > 0:
-                            # Calculate pace with safeguards for high-frequency files
-                            if is_high_frequency and distance < 0.001:
-                                # For very small distances in high-frequency files,
-                                # use a moving average or skip individual pace calculations
-                                pace = float('inf')  # We'll calculate this later in aggregation
-                            else:
-                                pace = time_diff / distance if distance > 0 else float('inf')
-                            
-                            point_segment = {
-                                'lat': lat,
-                                'lon': lon,
-                                'elevation': elevation,
-                                'time': time,
-                                'hr': hr,
-                                'distance': distance,
-                                'pace': pace,
-                                'is_fast': pace <= float(pace_limit) if pace != float('inf') else False,
-                                'prev_point': prev_point
-                            }
-                            point_segments.append(point_segment)
-                    
-                    prev_point = {
-                        'lat': lat,
-                        'lon': lon,
-                        'time': time,
-                        'hr': hr,
-                        'elevation': elevation
-                    }
-                
-            except Exception as e:
-                print(f"Error processing point: {str(e)}")
-                continue
+        # Distance/time/HR by pace bucket, so any other pace limit can be
+        # answered later without analyzing the run again
+        pace_histogram = build_pace_histogram(track, moving)
         
-        # Create continuous segments
+        # Create continuous segments from runs of equal classification
         segments = []
-        current_segment = None
-        
-        for i, point in enumerate(point_segments):
-            if not current_segment:
-                # Start new segment with proper coordinate format
-                current_segment = {
-                    'points': [point['prev_point']],
-                    'is_fast': point['is_fast'],
-                    'start_time': point['prev_point']['time'],
-                    'distance': 0,
-                    'total_hr': 0,
-                    'hr_count': 0,
-                    'coordinates': []  # Initialize empty coordinates array
-                }
-                # Add first coordinate
-                current_segment['coordinates'].append([
-                    float(point['prev_point']['lat']),
-                    float(point['prev_point']['lon'])
-                ])
-            
-            # Add current point to segment with proper coordinate format
-            current_segment['points'].append(point)
-            current_segment['coordinates'].append([
-                float(point['lat']),
-                float(point['lon'])
-            ])
-            current_segment['distance'] += point['distance']
-            if point['hr']:
-                current_segment['total_hr'] += point['hr']
-                current_segment['hr_count'] += 1
-            
-            # Check if we need to end current segment
-            next_point = point_segments[i + 1] if i < len(point_segments) - 1 else None
-            if next_point and next_point['is_fast'] != current_segment['is_fast']:
-                # Ensure the segment has valid coordinates
-                if len(current_segment['coordinates']) >= 2:
-                    finalized_segment = finalize_segment(current_segment)
-                    if finalized_segment:  # Only add if finalize_segment returns a valid result
-                        segments.append(finalized_segment)
-                current_segment = None
-        
-        # Add final segment if it has enough points
-        if current_segment and len(current_segment['coordinates']) >= 2:
-            finalized_segment = finalize_segment(current_segment)
+        sums = segment_prefix_sums(track, moving)
+        for segment in build_segments(track, is_fast, moving, sums):
+            segment['start_point'], segment['end_point'] = segment_endpoints(track, segment)
+            finalized_segment = finalize_segment(segment, local_tz)
             if finalized_segment:  # Only add if finalize_segment returns a valid result
                 segments.append(finalized_segment)
         
-        # Split into fast and slow segments, ensuring each has valid coordinates
-        fast_segments = [s for s in segments if s['is_fast'] and len(s['coordinates']) >= 2]
-        slow_segments = [s for s in segments if not s['is_fast'] and len(s['coordinates']) >= 2]
-        
-        # Aggregating segments for high-frequency files
-        if is_high_frequency:
-            print("High-frequency file confirmed, aggregating short segments...")
-            try:
-                fast_segments = aggregate_short_segments(fast_segments, min_distance_threshold=0.01, min_time_threshold=5)
-                slow_segments = aggregate_short_segments(slow_segments, min_distance_threshold=0.01, min_time_threshold=5)
-                print(f"After aggregation: {len(fast_segments)} fast segments, {len(slow_segments)} slow segments")
-            except Exception as agg_error:
-                print(f"Error during segment aggregation: {str(agg_error)}")
-                print(f"Continuing with original segments")
-                traceback.print_exc()
-        
-        # Filter out unreasonable paces (likely GPS errors)
+        # Net elevation change and average grade of every segment
+        elevation_changes, grades = segment_grades(track, [s['start_idx'] for s in segments],
+                                                   [s['end_idx'] for s in segments])
+        for segment, elevation_change, grade in zip(segments, elevation_changes, grades):
+            segment['elevation_change'] = elevation_change
+            segment['grade'] = grade
+        
+        # Mile and kilometer splits from the same prefix sums
+        splits = compute_unit_splits(track, sums)
+        splits['mile'] = as_mile_splits(splits['mile'])
+        print(f"Splits: {len(splits['mile'])} mile, {len(splits['km'])} km")
+        
+        # Fastest continuous 400m, 1k, mile, 5k and 10k
+        best_efforts = find_best_efforts(track, sums['distance'])
+        print("Best efforts: " + ", ".join(f"{e['name']} {e['time_seconds']:.0f}s" for e in best_efforts))
+        
+        # Laps recorded by the watch, else work/rest laps from change points of the binned speed
+        lap_settings = dict(INTERVAL_DEFAULTS, **(intervals or {}))
+        lap_starts = track.metadata.get('lap_starts') or []
+        if len(lap_starts) >= 2:
+            laps = laps_from_starts(track, sums, lap_starts, lap_settings['min_contrast'])
+            laps_source = 'file'
+        else:
+            laps = detect_laps(track, sums, **lap_settings)
+            laps_source = 'detected'
+        for lap in laps:
+            lap['start_time'] = datetime.fromtimestamp(lap['start_time'], local_tz)
+            lap['end_time'] = datetime.fromtimestamp(lap['end_time'], local_tz)
+        print("Laps: " + ", ".join(f"{lap['type']} {lap['distance']:.2f}mi@{lap['pace']:.2f}" for lap in laps))
+        
+        # Split into fast and slow segments
+        fast_segments = [s for s in segments if s['is_fast']]
+        slow_segments = [s for s in segments if not s['is_fast']]
+        print(f"Segmentation ({classification}): {len(fast_segments)} fast segments, {len(slow_segments)} slow segments")
+        
+        # Filter out unreasonable paces (likely GPS errors) and recategorize the
+        # remaining segments based on the pace_limit in a single pass.
         # World record mile pace is around 3:43, so we'll use 3:00 as a lower bound
         # And 20:00 as an upper bound for reasonable running/walking
         print("Validating pace data...")
-        original_fast_count = len(fast_segments)
-        original_slow_count = len(slow_segments)
-        
-        # Keep only segments with reasonable paces
-        reasonable_segments = []
+        reasonable_fast = []
+        reasonable_slow = []
         for segment in fast_segments + slow_segments:
-            if 3.0 <= segment['pace'] <= 20.0:
-                reasonable_segments.append(segment)
-            else:
+            if not 3.0 <= segment['pace'] <= 20.0:
                 print(f"Filtering out segment with unrealistic pace: {segment['pace']:.2f} min/mile")
-        
-        # Recategorize segments based on the pace_limit
-        fast_segments = [s for s in reasonable_segments if s['pace'] <= float(pace_limit)]
-        slow_segments = [s for s in reasonable_segments if s['pace'] > float(pace_limit)]
+            elif segment['pace'] <= float(pace_limit):
+                reasonable_fast.append(segment)
+            else:
+                reasonable_slow.append(segment)
+        fast_segments = reasonable_fast
+        slow_segments = reasonable_slow
         
         print(f"After filtering and recategorization: {len(fast_segments)} fast segments, {len(slow_segments)} slow segments")
         
+        # Elevation profile with one entry per kept segment, in time order
+        kept = {id(s) for s in fast_segments + slow_segments}
+        smoothed_elevations = track['elevation_smooth']
+        elevation_data = [{
+            'start_time': s['start_time'],
+            'elevation': float(smoothed_elevations[s['start_idx']]),
+            'distance': s['distance'],
+            'elevation_gain': s['elevation_gain'],
+            'elevation_loss': s['elevation_loss'],
+            'grade': s['grade']
+        } for s in segments if id(s) in kept]
+        total_elevation_gain = float(sums['elevation_gain'][-1])
+        total_elevation_loss = float(sums['elevation_loss'][-1])
+        print(f"Elevation: +{total_elevation_gain:.0f} ft / -{total_elevation_loss:.0f} ft ({elevation_settings})")
+        
+        report('summarizing', 0.6)
+        
         # Calculate totals
         total_fast_distance = sum(s['distance'] for s in fast_segments)
         total_slow_distance = sum(s['distance'] for s in slow_segments)
@@ -687,10 +376,13 @@ def analyze_run_file(file_path, pace_limit, user_age=None, resting_hr=None, weig
         else:
             avg_hr_slow = 0
         
-        # Calculate total run time and overall average pace
-        if point_segments:
-            total_run_time_minutes = (point_segments[-1]['time'] - point_segments[0]['time']).total_seconds() / 60
-            overall_avg_pace = total_run_time_minutes / total_distance_all if total_distance_all > 0 else 0
+        # Total run time is the moving time and the overall average pace the
+        # moving pace; the wall-clock time is reported as elapsed time
+        elapsed_time_minutes = (times[-1] - times[0]) / 60
+        moving_distance = float(sums['distance'][-1])
+        if moving_points:
+            total_run_time_minutes = float(sums['moving_time'][-1]) / 60
+            overall_avg_pace = total_run_time_minutes / moving_distance if moving_distance > 0 else 0
         else:
             total_run_time_minutes = 0
             overall_avg_pace = 0
@@ -701,7 +393,7 @@ def analyze_run_file(file_path, pace_limit, user_age=None, resting_hr=None, weig
         # Debug output
         print(f"\nAnalysis complete:")
         print(f"Total distance: {total_distance_all:.2f} miles")
-        print(f"Total time: {total_run_time_minutes:.2f} minutes")
+        print(f"Moving time: {total_run_time_minutes:.2f} minutes (elapsed: {elapsed_time_minutes:.2f} minutes)")
         print(f"Overall average pace: {overall_avg_pace:.2f} min/mile")
         print(f"Fast distance: {total_fast_distance:.2f} miles (time: {total_fast_time_minutes:.2f} min)")
         print(f"Fast average pace: {avg_pace_fast:.2f} min/mile")
@@ -711,13 +403,16 @@ def analyze_run_file(file_path, pace_limit, user_age=None, resting_hr=None, weig
         print(f"Average HR (Fast): {avg_hr_fast:.0f} bpm")
         print(f"Average HR (Slow): {avg_hr_slow:.0f} bpm")
         
-        # Format route data for mapping with proper coordinate format
+        # Format route data for mapping. Entries reference the stored track by
+        # index range; materialize_route fills in coordinates for clients
+        # from the points rebuilt by route_track
         route_data = []
         for segment in segments:
-            if segment and segment['coordinates'] and len(segment['coordinates']) >= 2:
+            if segment:
                 segment_data = {
                     'type': 'fast' if segment['is_fast'] else 'slow',
-                    'coordinates': segment['coordinates'],
+                    'start_idx': segment['start_idx'],
+                    'end_idx': segment['end_idx'],
                     'pace': segment['pace'],
                     'distance': segment['distance'],
                     'start_time': segment['start_time'],
@@ -729,26 +424,19 @@ def analyze_run_file(file_path, pace_limit, user_age=None, resting_hr=None, weig
         print("\nRoute Data Check:")
         print(f"Number of route segments: {len(route_data)}")
         for i, seg in enumerate(route_data):
-            print(f"Segment {i}: {seg['type']}, {len(seg['coordinates'])} points")
-            print(f"First coordinate: {seg['coordinates'][0]}")
-            print(f"Last coordinate: {seg['coordinates'][-1]}")
+            print(f"Segment {i}: {seg['type']}, points {seg['start_idx']}-{seg['end_idx'] - 1}")
 
-        # Calculate training zones
-        # Calculate the average time between heart rate samples in seconds
-        if len(point_segments) >= 2:
-            total_time_seconds = (point_segments[-1]['time'] - point_segments[0]['time']).total_seconds()
-            hr_sample_interval = total_time_seconds / len(all_heart_rates) if all_heart_rates else 1.0
-            print(f"Heart rate sampling interval: {hr_sample_interval:.2f} seconds")
-        else:
-            hr_sample_interval = 1.0  # Default to 1 second if we can't calculate
-            
-        training_zones = calculate_training_zones(all_heart_rates, user_age, resting_hr, hr_sample_interval)
+        # Calculate training zones from the real time each HR sample covers
+        zone_heart_rates, zone_durations = hr_sample_durations(track)
+        report('zones', 0.7)
+        training_zones = calculate_training_zones(zone_heart_rates, user_age, resting_hr,
+                                                  durations=zone_durations, model=zone_model, lthr=lthr)
         print("\nTraining Zones Result:")
         print(json.dumps(training_zones, indent=2))
 
         # Calculate additional metrics
         max_hr = max(all_heart_rates) if all_heart_rates else None
-        duration_minutes = (point_segments[-1]['time'] - point_segments[0]['time']).total_seconds() / 60
+        duration_minutes = total_run_time_minutes
         avg_hr = sum(all_heart_rates) / len(all_heart_rates) if all_heart_rates else None
         
         print("\nCalculating advanced metrics:")
@@ -756,6 +444,8 @@ def analyze_run_file(file_path, pace_limit, user_age=None, resting_hr=None, weig
         print(f"Duration: {duration_minutes} minutes")
         print(f"Average HR: {avg_hr}")
         
+        report('metrics', 0.85)
+        
         # Calculate VO2 Max
         vo2max = estimate_vo2max(
             age=user_age,
@@ -784,16 +474,23 @@ def analyze_run_file(file_path, pace_limit, user_age=None, resting_hr=None, weig
         )
         print(f"Calculated Recovery Time: {recovery_time}")
         
-        # Predict race times
+        # Predict race times from the best efforts (fast segment paces only
+        # when the run is too short for any of them)
         race_predictions = predict_race_times(
-            [s['pace'] for s in fast_segments if s['pace'] != float('inf')]
+            [s['pace'] for s in fast_segments if s['pace'] != float('inf')],
+            best_efforts=best_efforts
         )
         print(f"Calculated Race Predictions: {race_predictions}")
 
         return {
             'total_distance': total_distance_all,
             'total_time_minutes': total_run_time_minutes,
+            'moving_time_minutes': total_run_time_minutes,
+            'elapsed_time_minutes': elapsed_time_minutes,
+            'paused_time_minutes': paused_seconds / 60,
+            'pause_count': len(pauses),
             'overall_avg_pace': overall_avg_pace,
+            'moving_pace': overall_avg_pace,
             'fast_distance': total_fast_distance,
             'fast_time_minutes': total_fast_time_minutes,
             'slow_distance': total_slow_distance,
@@ -808,8 +505,15 @@ def analyze_run_file(file_path, pace_limit, user_age=None, resting_hr=None, weig
             'fast_segments': fast_segments,
             'slow_segments': slow_segments,
             'route_data': route_data,
+            'pace_histogram': pace_histogram,
             'elevation_data': elevation_data,
-            'mile_splits': mile_splits,
+            'elevation_gain': total_elevation_gain,
+            'elevation_loss': total_elevation_loss,
+            'mile_splits': splits['mile'],
+            'splits': splits,
+            'best_efforts': best_efforts,
+            'laps': laps,
+            'laps_source': laps_source,
             'training_zones': training_zones,
             'pace_recommendations': get_pace_recommendations([s['pace'] for s in fast_segments if s['pace'] != float('inf')]),
             'pace_limit': float(pace_limit),
@@ -819,6 +523,7 @@ def analyze_run_file(file_path, pace_limit, user_age=None, resting_hr=None, weig
             'race_predictions': race_predictions,
             'max_hr': max_hr,
             'creator': creator,
+            'gps_outliers': rejected_points + jump_steps,
             'is_high_frequency': is_high_frequency
         }
         
@@ -829,14 +534,13 @@ def analyze_run_file(file_path, pace_limit, user_age=None, resting_hr=None, weig
         traceback.print_exc()
         raise Exception(f"Failed to analyze run: {str(e)}")
 
-def finalize_segment(segment, minimum_pace=3.0, maximum_pace=20.0):
+def finalize_segment(segment, local_tz, minimum_pace=3.0, maximum_pace=20.0):
     """Helper function to calculate segment statistics"""
-    points = segment['points']
-    time_diff = (points[-1]['time'] - segment['start_time']).total_seconds() / 60
+    time_diff = (segment['end_time'] - segment['start_time']) / 60
     
-    # Ensure coordinates are valid
-    if not segment['coordinates'] or len(segment['coordinates']) < 2:
-        print(f"Warning: Invalid coordinates in segment")
+    # A segment needs at least two points
+    if segment['end_idx'] - segment['start_idx'] < 2:
+        print(f"Warning: Segment has fewer than two points")
         return None
     
     # Calculate pace directly from total time and total distance
@@ -859,20 +563,23 @@ def finalize_segment(segment, minimum_pace=3.0, maximum_pace=20.0):
         avg_hr = segment['avg_hr']
     
     # Create the segment with properly handling Infinity values
+    # Epoch times are converted to local datetimes only here, once per segment
     result = {
         'is_fast': segment['is_fast'],  # Keep original classification
-        'start_time': segment['start_time'],
-        'end_time': points[-1]['time'],
+        'start_time': datetime.fromtimestamp(segment['start_time'], local_tz),
+        'end_time': datetime.fromtimestamp(segment['end_time'], local_tz),
         'distance': segment['distance'],
         'avg_hr': avg_hr,
         'total_hr': segment.get('total_hr', 0),
         'hr_count': segment.get('hr_count', 0),
-        'coordinates': segment['coordinates'],
+        'start_idx': segment['start_idx'],  # Range [start_idx, end_idx) into the analyzed track (route_track)
+        'end_idx': segment['end_idx'],
         'time_diff': time_diff,
         'pace': pace,
-        'elevation_points': [float(p.get('elevation', 0)) for p in points if isinstance(p, dict)],
-        'start_point': segment['coordinates'][0],
-        'end_point': segment['coordinates'][-1]
+        'elevation_gain': segment.get('elevation_gain', 0),
+        'elevation_loss': segment.get('elevation_loss', 0),
+        'start_point': segment['start_point'],
+        'end_point': segment['end_point']
     }
     
     # Recalculate is_fast based on the final calculated pace
@@ -883,120 +590,6 @@ def finalize_segment(segment, minimum_pace=3.0, maximum_pace=20.0):
     
     return result
 
-def aggregate_short_segments(segments, min_distance_threshold=0.01, min_time_threshold=5):
-    """
-    Aggregate short segments into more meaningful chunks.
-    
-    Args:
-        segments: List of segment dictionaries
-        min_distance_threshold: Minimum distance in miles for a segment (default 0.01 mile)
-        min_time_threshold: Minimum time in seconds for a segment (default 5 seconds)
-    
-    Returns:
-        List of aggregated segments
-    """
-    if not segments:
-        return []
-    
-    print(f"Aggregating segments. Input: {len(segments)} segments")
-    
-    # Initialize with the first segment
-    aggregated = []
-    current = segments[0].copy()
-    
-    # Ensure required fields exist in the current segment
-    if 'total_hr' not in current:
-        current['total_hr'] = current.get('avg_hr', 0) * current.get('hr_count', 1)
-    if 'hr_count' not in current:
-        current['hr_count'] = 1 if current.get('avg_hr', 0) > 0 else 0
-    
-    # Track cumulative data for pace calculation
-    cumulative_distance = current['distance']
-    cumulative_time_seconds = (current['end_time'] - current['start_time']).total_seconds()
-    
-    for i in range(1, len(segments)):
-        next_segment = segments[i]
-        
-        # Check if current segment is too short
-        current_distance = current['distance']
-        current_time_diff = (current['end_time'] - current['start_time']).total_seconds()
-        
-        if current_distance < min_distance_threshold or current_time_diff < min_time_threshold:
-            # Merge the next segment into the current one
-            current['end_time'] = next_segment['end_time']
-            current['distance'] += next_segment['distance']
-            current['coordinates'].extend(next_segment['coordinates'][1:])  # Avoid duplicating the connecting point
-            
-            # Update cumulative data for pace calculation
-            cumulative_distance += next_segment['distance']
-            segment_time = (next_segment['end_time'] - next_segment['start_time']).total_seconds()
-            cumulative_time_seconds += segment_time
-            
-            # Safely merge HR data
-            next_total_hr = 0
-            next_hr_count = 0
-            
-            # Calculate next segment's total HR if needed
-            if 'total_hr' in next_segment:
-                next_total_hr = next_segment['total_hr']
-            elif 'avg_hr' in next_segment and next_segment['avg_hr'] > 0:
-                next_hr_count = next_segment.get('hr_count', 1)
-                next_total_hr = next_segment['avg_hr'] * next_hr_count
-            
-            # Update current segment's HR data
-            current['total_hr'] += next_total_hr
-            current['hr_count'] += next_segment.get('hr_count', next_hr_count)
-            
-            # Update time difference
-            current['time_diff'] = cumulative_time_seconds / 60  # Convert seconds to minutes
-            
-            # Recalculate pace from cumulative data
-            if cumulative_distance > 0:
-                current['pace'] = (cumulative_time_seconds / 60) / cumulative_distance
-                current['best_pace'] = current['pace']
-            
-            # Update end point
-            current['end_point'] = next_segment['end_point']
-        else:
-            # Current segment is large enough, save it and start a new one
-            aggregated.append(current)
-            current = next_segment.copy()
-            
-            # Reset cumulative tracking for new segment
-            cumulative_distance = current['distance']
-            cumulative_time_seconds = (current['end_time'] - current['start_time']).total_seconds()
-            
-            # Ensure required fields exist in the new current segment
-            if 'total_hr' not in current:
-                current['total_hr'] = current.get('avg_hr', 0) * current.get('hr_count', 1)
-            if 'hr_count' not in current:
-                current['hr_count'] = 1 if current.get('avg_hr', 0) > 0 else 0
-    
-    # Add the last segment
-    if current:
-        current_distance = current['distance']
-        current_time_diff = (current['end_time'] - current['start_time']).total_seconds()
-        
-        # Only add if it meets the thresholds
-        if current_distance >= min_distance_threshold and current_time_diff >= min_time_threshold:
-            aggregated.append(current)
-    
-    # Final pass: calculate avg_hr for all segments and validate paces
-    for segment in aggregated:
-        if segment['hr_count'] > 0:
-            segment['avg_hr'] = segment['total_hr'] / segment['hr_count']
-        
-        # Validate pace - ensure it's not unreasonably fast
-        if segment['pace'] < 3.0:  # Faster than 3:00/mile is likely an error
-            # Recalculate from time and distance
-            time_minutes = (segment['end_time'] - segment['start_time']).total_seconds() / 60
-            if segment['distance'] > 0 and time_minutes > 0:
-                segment['pace'] = time_minutes / segment['distance']
-                segment['best_pace'] = segment['pace']
-    
-    print(f"Aggregation complete. Output: {len(aggregated)} segments")
-    return aggregated
-
 def list_gpx_files(directory="~/Downloads"):
     # Expand the ~ to full home directory path
     directory = os.path.expanduser(directory)
@@ -1097,105 +690,25 @@ def save_run_results(file_path, pace_limit, results):
     
     return run_data
 
-def calculate_training_zones(heart_rates, user_age, resting_hr, hr_sample_interval=1.0):
+def calculate_training_zones(heart_rates, user_age, resting_hr, hr_sample_interval=1.0, durations=None,
+                             model='hrr', max_hr=None, lthr=None):
+    """
+    Time spent in each training zone (see app.zones.compute_training_zones).
+    
+    `durations` holds the real seconds each HR sample stands for; without it
+    every sample counts for `hr_sample_interval` seconds.
+    """
     print("\nCalculating training zones:")
     print(f"Heart rates: {len(heart_rates)} values")
     print(f"User age: {user_age}")
     print(f"Resting HR: {resting_hr}")
-    print(f"HR sample interval: {hr_sample_interval:.2f} seconds")
-    
-    if not heart_rates or not user_age or not resting_hr:
-        print("Missing required data for training zones")
-        return None
     
-    # Remove outlier heart rates (values that are too low or too high)
-    filtered_heart_rates = []
-    if heart_rates:
-        avg_hr = sum(heart_rates) / len(heart_rates)
-        std_dev = (sum((hr - avg_hr) ** 2 for hr in heart_rates) / len(heart_rates)) ** 0.5
-        filtered_heart_rates = [hr for hr in heart_rates if abs(hr - avg_hr) <= 2.5 * std_dev]
-        
-        # If filtering removed too many values, revert to original
-        if len(filtered_heart_rates) < len(heart_rates) * 0.8:
-            filtered_heart_rates = heart_rates
-            print(f"Heart rate filtering reverted - too many outliers")
-        else:
-            print(f"Filtered heart rates: removed {len(heart_rates) - len(filtered_heart_rates)} outliers")
-    
-    # Use filtered values
-    heart_rates = filtered_heart_rates if filtered_heart_rates else heart_rates
-        
-    # Calculate max HR using common formula (Tanaka formula is more accurate for older adults)
-    if user_age >= 40:
-        max_hr = 208 - (0.7 * user_age)  # Tanaka formula
-    else:
-        max_hr = 220 - user_age  # Traditional formula
-    
-    # If we have enough HR data, use the 95th percentile as max HR instead of formula
-    if len(heart_rates) > 100:  # Only if we have sufficient data
-        measured_max_hr = sorted(heart_rates)[-int(len(heart_rates) * 0.05)]  # 95th percentile
-        # Only use measured if it's reasonable
-        if measured_max_hr > max_hr * 0.9 and measured_max_hr < max_hr * 1.1:
-            max_hr = measured_max_hr
-            print(f"Using measured max HR: {max_hr}")
-    
-    heart_rate_reserve = max_hr - resting_hr
-    
-    print(f"Max HR: {max_hr}")
-    print(f"Heart Rate Reserve: {heart_rate_reserve}")
-    
-    # Initialize zones with time spent
-    zones = TRAINING_ZONES.copy()
-    for zone in zones.values():
-        zone['time_spent'] = 0
-        zone['count'] = 0
-        # Calculate actual heart rate ranges
-        zone['hr_range'] = (
-            int(resting_hr + (zone['range'][0] * heart_rate_reserve)),
-            int(resting_hr + (zone['range'][1] * heart_rate_reserve))
-        )
-        print(f"Calculated HR range: {zone['hr_range']} for zone with HRR range {zone['range']}")
-    
-    # Count time spent in each zone
-    for hr in heart_rates:
-        hrr_percentage = (hr - resting_hr) / heart_rate_reserve
-        
-        # Handle values outside the normal range
-        if hrr_percentage < 0:
-            hrr_percentage = 0
-        elif hrr_percentage > 1:
-            hrr_percentage = 1
-            
-        found_zone = False
-        for zone_name, zone_data in zones.items():
-            if zone_data['range'][0] <= hrr_percentage <= zone_data['range'][1]:
-                zone_data['time_spent'] += hr_sample_interval
-                zone_data['count'] += 1
-                found_zone = True
-                break
-        
-        # Handle the case where the HR doesn't fall into any zone
-        if not found_zone:
-            # Find the closest zone
-            closest_zone = min(zones.items(), 
-                            key=lambda x: min(abs(x[1]['range'][0] - hrr_percentage), 
-                                            abs(x[1]['range'][1] - hrr_percentage)))
-            zones[closest_zone[0]]['time_spent'] += hr_sample_interval
-            zones[closest_zone[0]]['count'] += 1
-    
-    # Convert seconds to minutes and calculate percentages
-    total_time = sum(zone['time_spent'] for zone in zones.values())
-    print(f"Total time: {total_time:.2f} seconds ({total_time/60:.2f} minutes)")
-    
-    for zone in zones.values():
-        zone['time_spent'] = zone['time_spent'] / 60  # Convert to minutes
-        zone['percentage'] = (zone['count'] / len(heart_rates) * 100) if heart_rates else 0
-        zone.pop('count', None)  # Remove the count field
-    
-    # Add total duration for reference
-    total_minutes = total_time / 60
-    print(f"Total duration in all zones: {total_minutes:.2f} minutes")
+    if durations is None:
+        print(f"HR sample interval: {hr_sample_interval:.2f} seconds")
+        durations = [hr_sample_interval] * len(heart_rates)
     
+    zones = compute_training_zones(heart_rates, durations, user_age=user_age, resting_hr=resting_hr,
+                                   model=model, max_hr=max_hr, lthr=lthr)
     print("Calculated zones:", zones)
     return zones
 
@@ -1276,25 +789,20 @@ def calculate_pace_zones(recent_runs):
         }
     }
 
-def analyze_elevation_impact(point_segments):
-    """Analyze how elevation affects pace"""
+def analyze_elevation_impact(segments):
+    """
+    Analyze how elevation affects pace: the grade, net elevation change
+    (feet) and pace of every segment that has a grade and a finite pace
+    """
     elevation_pace_data = []
-    for i in range(len(point_segments) - 1):
-        current = point_segments[i]
-        next_point = point_segments[i + 1]
-        
-        # Get elevation from start_point and end_point
-        current_elevation = float(current.get('elevation', 0))
-        next_elevation = float(next_point.get('elevation', 0))
-        
-        elevation_change = next_elevation - current_elevation
-        pace = float(current.get('pace', 0))
-        
-        if not isnan(pace) and not isnan(elevation_change):
+    for segment in segments:
+        pace = float(segment.get('pace', 0))
+        if 'grade' in segment and not isnan(pace) and pace != float('inf'):
             elevation_pace_data.append({
-                'elevation_change': elevation_change,
+                'grade': segment['grade'],
+                'elevation_change': segment.get('elevation_change', 0),
                 'pace': pace,
-                'distance': float(current.get('distance', 0))
+                'distance': float(segment.get('distance', 0))
             })
     
     return elevation_pace_data
@@ -1348,13 +856,15 @@ def recommend_recovery_time(training_load, resting_hr, age):
     hr_factor = 1 + max(0, (resting_hr - 60) * 0.01)
     return base_recovery * age_factor * hr_factor
 
-def predict_race_times(recent_paces, distances=[5, 10, 21.1, 42.2]):
+def predict_race_times(recent_paces, distances=[5, 10, 21.1, 42.2], best_efforts=None):
     """Predict race times using Riegel formula"""
+    if best_efforts:
+        return riegel_predictions(best_efforts, distances)
     if not recent_paces:
         return None
         
     best_pace = min(recent_paces)
-    base_time = best_pace * 5  # Use 5k as base
+    base_time = best_pace * 5 / 1.609344  # Use 5k as base (pace is per mile)
     
     predictions = {}
     for distance in distances:
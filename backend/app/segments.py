@@ -0,0 +1,344 @@
+"""
+Fast/slow segmentation over whole tracks.
+
+A per-point classification mask is run-length encoded into segments. Each
+segment is an index range into the track, and its aggregates (distance,
+duration, HR sum/count, elevation gain) are differences of prefix sums, so
+no per-point work is repeated for each segment.
+"""
+from array import array
+from app.track import np, has_numpy
+from app.geo import cumulative_sum
+
+def run_lengths(values):
+    """
+    Run-length encode a sequence.
+
+    Returns (starts, ends, run_values) where run k covers
+    values[starts[k]:ends[k]] and every value in it equals run_values[k].
+    """
+    n = len(values)
+    if not n:
+        return [], [], []
+    if has_numpy:
+        values = np.asarray(values)
+        changes = np.flatnonzero(values[1:] != values[:-1]) + 1
+        starts = np.concatenate(([0], changes))
+        ends = np.concatenate((changes, [n]))
+        return starts.tolist(), ends.tolist(), values[starts].tolist()
+
+    starts = [0]
+    run_values = [values[0]]
+    for i in range(1, n):
+        if values[i] != values[i - 1]:
+            starts.append(i)
+            run_values.append(values[i])
+    return starts, starts[1:] + [n], run_values
+
+def moving_mask(track):
+    """
+    Per-point bools for a track with motion columns: True where the time
+    step is positive and the point is not in a pause (see detect_pauses)
+    """
+    paused = track['paused'] if 'paused' in track else None
+    if has_numpy:
+        if paused is not None:
+            return (track['time_step'] > 0) & (paused == 0)
+        return track['time_step'] > 0
+    if paused is not None:
+        return [step > 0 and not stop for step, stop in zip(track['time_step'], paused)]
+    return [step > 0 for step in track['time_step']]
+
+def classify_by_pace(track, pace_limit):
+    """
+    Per-point masks (moving, is_fast) for a track with motion columns.
+
+    A point is moving when its time step is positive, and fast when it is
+    moving with a pace at or under `pace_limit` (an infinite pace never is).
+    """
+    limit = float(pace_limit)
+    moving = moving_mask(track)
+    if has_numpy:
+        return moving, moving & (track['pace'] <= limit)
+    return moving, [keep and pace <= limit for keep, pace in zip(moving, track['pace'])]
+
+# Default hysteresis settings: the band is in min/mile around the pace limit,
+# the dwell limits match the thresholds the old short-segment aggregation used
+HYSTERESIS_DEFAULTS = {
+    'band': 0.25,
+    'min_dwell_seconds': 5,
+    'min_dwell_distance': 0.01
+}
+
+def classify_with_hysteresis(track, pace_limit, band=0.25, min_dwell_seconds=5, min_dwell_distance=0.01):
+    """
+    Per-point masks (moving, is_fast) that are stable against GPS jitter.
+
+    A moving point only switches the state to fast at a pace of at most
+    `pace_limit - band`, and back to slow above `pace_limit + band`; paces in
+    between keep the current state. A run of one state only stands on its own
+    if it lasts at least `min_dwell_seconds` and covers `min_dwell_distance`
+    miles. Shorter runs are pooled until the pool is that long and then
+    classified by its overall pace, so segmentation yields stable segments
+    directly.
+    """
+    limit = float(pace_limit)
+    enter_fast = limit - band
+    exit_fast = limit + band
+    moving = classify_by_pace(track, pace_limit)[0]
+    moving_points = true_indices(moving)
+    if not moving_points:
+        return moving, moving
+
+    # Hysteresis over the moving points: forward-fill the last decisive state
+    paces = track['pace']
+    initial = paces[moving_points[0]] <= limit
+    if has_numpy:
+        moving_paces = paces[moving_points]
+        decided = (moving_paces <= enter_fast) | (moving_paces > exit_fast)
+        last_decided = np.maximum.accumulate(np.where(decided, np.arange(len(moving_points)), -1))
+        states = np.where(last_decided >= 0, moving_paces[np.maximum(last_decided, 0)] <= enter_fast, initial).tolist()
+    else:
+        states = []
+        state = initial
+        for i in moving_points:
+            if paces[i] <= enter_fast:
+                state = True
+            elif paces[i] > exit_fast:
+                state = False
+            states.append(state)
+
+    # Minimum dwell. Runs that are long enough keep their state. Consecutive
+    # short runs are pooled into a block until the block itself lasts long
+    # enough; the block then gets the state its overall pace calls for
+    # (again with hysteresis against the state before it).
+    times = track['time']
+    cum_distance = track['cum_distance']
+
+    def extent(start, end):
+        first = moving_points[start] - 1
+        last = moving_points[end - 1]
+        return times[last] - times[first], cum_distance[last] - cum_distance[first]
+
+    def settle(flag, start, end):
+        if merged and merged[-1][0] == flag:
+            merged[-1][2] = end
+        else:
+            merged.append([flag, start, end])
+
+    merged = []  # [state, start, end] over positions in moving_points
+    pending = None  # [start, end] of pooled short runs
+    starts, ends, flags = run_lengths(states)
+    for start, end, flag in zip(starts, ends, flags):
+        seconds, miles = extent(start, end)
+        if seconds >= min_dwell_seconds and miles >= min_dwell_distance:
+            if pending:
+                # An immature block joins the state before it
+                settle(merged[-1][0] if merged else flag, pending[0], pending[1])
+                pending = None
+            settle(flag, start, end)
+            continue
+
+        if pending:
+            pending[1] = end
+        else:
+            pending = [start, end]
+        seconds, miles = extent(pending[0], pending[1])
+        if seconds >= min_dwell_seconds and miles >= min_dwell_distance:
+            pace = seconds / 60 / miles
+            if pace <= enter_fast:
+                block_state = True
+            elif pace > exit_fast:
+                block_state = False
+            else:
+                block_state = merged[-1][0] if merged else pace <= limit
+            settle(block_state, pending[0], pending[1])
+            pending = None
+    if pending:
+        settle(merged[-1][0] if merged else bool(flags[-1]), pending[0], pending[1])
+
+    if has_numpy:
+        is_fast = np.zeros(len(track), dtype=bool)
+        moving_points = np.asarray(moving_points)
+        for flag, start, end in merged:
+            if flag:
+                is_fast[moving_points[start:end]] = True
+    else:
+        is_fast = [False] * len(track)
+        for flag, start, end in merged:
+            if flag:
+                for i in moving_points[start:end]:
+                    is_fast[i] = True
+    return moving, is_fast
+
+def true_indices(mask):
+    """Indices of the True entries of a mask, as a list"""
+    if has_numpy:
+        return np.flatnonzero(mask).tolist()
+    return [i for i, value in enumerate(mask) if value]
+
+def _masked(values, mask):
+    """Copy of a column with the entries outside `mask` set to 0"""
+    if has_numpy:
+        return np.where(mask, values, 0.0)
+    return array('d', (value if keep else 0.0 for value, keep in zip(values, mask)))
+
+def raw_elevation_steps(elevations):
+    """Per-point climb and descent from the previous point, unsmoothed"""
+    n = len(elevations)
+    if has_numpy:
+        changes = np.zeros(n)
+        changes[1:] = np.diff(elevations)
+        return np.maximum(changes, 0), np.maximum(-changes, 0)
+    gains = array('d', bytes(8 * n))
+    losses = array('d', bytes(8 * n))
+    for i in range(1, n):
+        change = elevations[i] - elevations[i - 1]
+        gains[i] = max(change, 0.0)
+        losses[i] = max(-change, 0.0)
+    return gains, losses
+
+def segment_prefix_sums(track, moving):
+    """
+    Prefix sums over the moving points of a track with motion columns.
+
+    Entry k holds the total over points 0..k, so a segment covering the
+    points (start, end] has total sums[end] - sums[start]. Sums are kept
+    for distance, moving_time (seconds), total_hr, hr_count,
+    elevation_gain and elevation_loss. Elevation uses the columns from
+    add_elevation_columns when the track has them, and raw elevation steps
+    otherwise.
+    """
+    n = len(track)
+    hr = track['hr']
+    if 'elevation_gain_step' in track:
+        gain_steps, loss_steps = track['elevation_gain_step'], track['elevation_loss_step']
+    else:
+        gain_steps, loss_steps = raw_elevation_steps(track['elevation'])
+    if has_numpy:
+        valid_hr = moving & (hr == hr) & (hr != 0)
+        ones = np.ones(n)
+    else:
+        valid_hr = [keep and value == value and value != 0 for value, keep in zip(hr, moving)]
+        ones = array('d', [1.0]) * n
+
+    return {
+        'distance': cumulative_sum(_masked(track['distance'], moving)),
+        'moving_time': cumulative_sum(_masked(track['time_step'], moving)),
+        'total_hr': cumulative_sum(_masked(hr, valid_hr)),
+        'hr_count': cumulative_sum(_masked(ones, valid_hr)),
+        'elevation_gain': cumulative_sum(_masked(gain_steps, moving)),
+        'elevation_loss': cumulative_sum(_masked(loss_steps, moving))
+    }
+
+def build_segments(track, is_fast, moving, sums=None):
+    """
+    Split a track into alternating fast/slow segments.
+
+    Only moving points (those that advance in time) are classified; a run of
+    moving points with the same `is_fast` value becomes one segment that
+    starts at the point just before the first of them. A pause (the
+    'paused' column) always ends a segment, so no segment spans one. Each
+    segment is a
+    dict with the index range [start_idx, end_idx) into the track, the epoch
+    start/end times and its aggregates. Points that do not move forward in
+    time are inside the range but not part of the aggregates.
+
+    Args:
+        track: TrackArray with the columns from add_motion_columns
+        is_fast: Per-point classification (bools)
+        moving: Per-point bools, True where the time step is positive
+        sums: segment_prefix_sums(track, moving), if already computed
+    """
+    # Runs are keyed by classification and by the number of pauses so far
+    paused = track['paused'] if 'paused' in track else None
+    if has_numpy:
+        moving = np.asarray(moving, dtype=bool)
+        moving_points = np.flatnonzero(moving)
+        keys = np.asarray(is_fast, dtype=bool)[moving_points].astype(np.int64)
+        if paused is not None:
+            pause_starts = np.concatenate(([0.0], np.diff(paused) > 0))
+            keys += 2 * np.cumsum(pause_starts).astype(np.int64)[moving_points]
+    else:
+        moving_points = true_indices(moving)
+        keys = [int(bool(is_fast[i])) for i in moving_points]
+        if paused is not None:
+            blocks = [0] * len(paused)
+            count = 0
+            for i in range(1, len(paused)):
+                if paused[i] > paused[i - 1]:
+                    count += 1
+                blocks[i] = count
+            keys = [key + 2 * blocks[i] for key, i in zip(keys, moving_points)]
+
+    starts, ends, flags = run_lengths(keys)
+    if not starts:
+        return []
+
+    if sums is None:
+        sums = segment_prefix_sums(track, moving)
+    times = track['time']
+
+    segments = []
+    for start, end, flag in zip(starts, ends, flags):
+        first = int(moving_points[start]) - 1
+        last = int(moving_points[end - 1])
+        segments.append({
+            'is_fast': bool(flag % 2),
+            'start_idx': first,
+            'end_idx': last + 1,
+            'start_time': float(times[first]),
+            'end_time': float(times[last]),
+            'distance': float(sums['distance'][last] - sums['distance'][first]),
+            'moving_time': float(sums['moving_time'][last] - sums['moving_time'][first]),
+            'total_hr': int(round(sums['total_hr'][last] - sums['total_hr'][first])),
+            'hr_count': int(round(sums['hr_count'][last] - sums['hr_count'][first])),
+            'elevation_gain': float(sums['elevation_gain'][last] - sums['elevation_gain'][first]),
+            'elevation_loss': float(sums['elevation_loss'][last] - sums['elevation_loss'][first])
+        })
+    return segments
+
+def segment_endpoints(track, segment):
+    """[lat, lon] of the first and last point of a segment"""
+    lats, lons = track['lat'], track['lon']
+    first, last = segment['start_idx'], segment['end_idx'] - 1
+    return [float(lats[first]), float(lons[first])], [float(lats[last]), float(lons[last])]
+
+def pack_track(track):
+    """
+    The columns needed to draw a run: plain lists of lat, lon and
+    elevation. Segments and route entries only hold [start_idx, end_idx)
+    ranges into these.
+    """
+    return {
+        'lat': track['lat'].tolist(),
+        'lon': track['lon'].tolist(),
+        'elevation': track['elevation'].tolist()
+    }
+
+def materialize_route(results, track=None):
+    """
+    Copy of analysis results for a client that draws the route.
+
+    Every route_data entry gets its 'coordinates' sliced out of `track`
+    (pack_track columns, e.g. from running.route_track); results saved
+    while the track was kept in the run data use their own. Without a
+    track the results are returned as they are, and so are results saved
+    before segments were index ranges, which already carry coordinates.
+    """
+    if track is None:
+        track = results.get('track') if isinstance(results, dict) else None
+    if not track:
+        return results
+
+    lats, lons = track['lat'], track['lon']
+    materialized = {key: value for key, value in results.items() if key != 'track'}
+    route_data = []
+    for entry in results.get('route_data', []):
+        entry = dict(entry)
+        if 'coordinates' not in entry and 'start_idx' in entry:
+            start, end = entry['start_idx'], entry['end_idx']
+            entry['coordinates'] = [list(point) for point in zip(lats[start:end], lons[start:end])]
+        route_data.append(entry)
+    materialized['route_data'] = route_data
+    return materialized
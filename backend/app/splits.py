@@ -0,0 +1,134 @@
+"""
+Distance splits (miles, kilometers or any interval).
+
+Split boundaries are located on the cumulative moving distance by binary
+search, and the elapsed time, moving time, HR sums and elevation gain at
+each boundary are interpolated between the two points around it. A set of
+splits therefore costs one search per boundary on top of the prefix sums,
+which segmentation builds anyway.
+"""
+import bisect
+from app.track import np, has_numpy
+from app.geo import add_motion_columns
+from app.segments import moving_mask, segment_prefix_sums
+from app.elevation import add_elevation_columns
+from app.gps_filter import reject_outliers, smooth_motion
+from app.pauses import detect_pauses
+
+MILES_PER_KM = 1 / 1.609344
+
+# Split lengths in miles for the units computed with every analysis
+SPLIT_UNITS = {
+    'mile': 1.0,
+    'km': MILES_PER_KM
+}
+
+# A trailing partial split shorter than this (miles) is left out
+MIN_PARTIAL_SPLIT = 0.01
+
+INTERPOLATED_SUMS = ('moving_time', 'total_hr', 'hr_count', 'elevation_gain', 'elevation_loss')
+
+def values_at_distances(cum_distance, columns, targets):
+    """
+    Values of each column at the given cumulative distances, interpolated
+    linearly between the two points around each one.
+
+    Args:
+        cum_distance: Non-decreasing cumulative distance per point
+        columns: Dict of per-point columns (times, prefix sums, ...)
+        targets: Distances to look up, ascending
+
+    Returns:
+        Dict with a list of values per column
+    """
+    n = len(cum_distance)
+    if has_numpy:
+        targets = np.asarray(targets, dtype=np.float64)
+        upper = np.clip(np.searchsorted(cum_distance, targets, side='left'), 1, n - 1)
+        lower = upper - 1
+        span = cum_distance[upper] - cum_distance[lower]
+        fraction = np.where(span > 0, (targets - cum_distance[lower]) / np.where(span > 0, span, 1.0), 1.0)
+        fraction = np.clip(fraction, 0.0, 1.0)
+        return {name: (values[lower] + fraction * (values[upper] - values[lower])).tolist()
+                for name, values in columns.items()}
+
+    result = {name: [] for name in columns}
+    for target in targets:
+        upper = min(max(bisect.bisect_left(cum_distance, target), 1), n - 1)
+        lower = upper - 1
+        span = cum_distance[upper] - cum_distance[lower]
+        fraction = (target - cum_distance[lower]) / span if span > 0 else 1.0
+        fraction = min(max(fraction, 0.0), 1.0)
+        for name, values in columns.items():
+            result[name].append(values[lower] + fraction * (values[upper] - values[lower]))
+    return result
+
+def compute_splits(track, sums, interval):
+    """
+    Splits of `interval` miles over a track with motion columns.
+
+    `sums` are the prefix sums from segment_prefix_sums. Each split reports
+    its number, distance (in units of the interval, below 1 for the final
+    partial split), elapsed and moving time (minutes), pace (moving minutes
+    per interval), average HR and elevation gain and loss.
+    """
+    cum_distance = sums['distance']
+    if len(track) < 2 or interval <= 0:
+        return []
+    total = float(cum_distance[-1])
+    full_splits = int((total + 1e-9) // interval)
+    boundaries = [k * interval for k in range(full_splits + 1)]
+    if total - boundaries[-1] >= MIN_PARTIAL_SPLIT:
+        boundaries.append(total)
+    if len(boundaries) < 2:
+        return []
+
+    columns = {name: sums[name] for name in INTERPOLATED_SUMS}
+    columns['time'] = track['time']
+    at = values_at_distances(cum_distance, columns, boundaries)
+
+    splits = []
+    for k in range(1, len(boundaries)):
+        length = (boundaries[k] - boundaries[k - 1]) / interval
+        moving_minutes = (at['moving_time'][k] - at['moving_time'][k - 1]) / 60
+        hr_count = at['hr_count'][k] - at['hr_count'][k - 1]
+        splits.append({
+            'split': k,
+            'distance': length,
+            'elapsed_time_minutes': (at['time'][k] - at['time'][k - 1]) / 60,
+            'moving_time_minutes': moving_minutes,
+            'pace': moving_minutes / length if length > 0 else 0,
+            'avg_hr': (at['total_hr'][k] - at['total_hr'][k - 1]) / hr_count if hr_count > 0 else 0,
+            'elevation_gain': at['elevation_gain'][k] - at['elevation_gain'][k - 1],
+            'elevation_loss': at['elevation_loss'][k] - at['elevation_loss'][k - 1],
+            'partial': k > full_splits
+        })
+    return splits
+
+def compute_unit_splits(track, sums, intervals=None):
+    """Splits for every unit in `intervals` (name -> miles; default SPLIT_UNITS)"""
+    return {name: compute_splits(track, sums, interval)
+            for name, interval in (intervals or SPLIT_UNITS).items()}
+
+def splits_for_track(track, interval):
+    """
+    Splits of `interval` miles for a track straight from read_run_track
+    (e.g. a stored one), at its full resolution, cleaned up with the
+    default GPS filter and auto-pause settings
+    """
+    # Tracks stored before the device speed column was renamed carry it as
+    # 'speed' (m/s), so smoothing follows the motion columns rather than
+    # the presence of a 'speed' column
+    if 'time_step' not in track:
+        track = reject_outliers(track)[0]
+        add_motion_columns(track)
+        smooth_motion(track)
+    if 'paused' not in track:
+        detect_pauses(track)
+    if 'elevation_gain_step' not in track:
+        add_elevation_columns(track)
+    return compute_splits(track, segment_prefix_sums(track, moving_mask(track)), interval)
+
+def as_mile_splits(splits):
+    """Mile splits with the 'mile' and 'split_pace' fields the charts read"""
+    return [dict(split, mile=split['split'], split_pace=split['pace']) for split in splits]
@@ -0,0 +1,132 @@
+"""
+Streaming reader for Garmin Training Center (TCX) files.
+
+TCX nests trackpoints in laps: Activity > Lap > Track > Trackpoint. The
+document is walked with ElementTree.iterparse like a GPX file, every
+trackpoint is dropped as soon as it has been read, and the start time of
+each lap is kept so the lap boundaries recorded by the watch can be used
+instead of detected ones.
+"""
+import xml.etree.ElementTree as ET
+from array import array
+from app.track import TrackArray
+from app.timestamps import decode_timestamps
+from app.gpx_reader import measure_points_per_minute
+
+# Trackpoint children (by local name) read into sensor columns. Cadence is
+# the bike/foot-pod cadence, RunCadence and Watts come from the
+# ActivityExtension TPX element
+SENSOR_NAMES = {
+    'Cadence': 'cadence',
+    'RunCadence': 'cadence',
+    'Watts': 'power'
+}
+
+def _local(tag):
+    return tag.rpartition('}')[2]
+
+def _read_trackpoint(trackpoint):
+    """Dict of the values of one Trackpoint element"""
+    values = {}
+    for child in trackpoint.iter():
+        name = _local(child.tag)
+        text = child.text
+        if not text or not text.strip():
+            continue
+        if name == 'Time':
+            values['time'] = text.strip()
+        elif name == 'LatitudeDegrees':
+            values['lat'] = float(text)
+        elif name == 'LongitudeDegrees':
+            values['lon'] = float(text)
+        elif name == 'AltitudeMeters':
+            values['elevation'] = float(text)
+        elif name == 'Value':
+            values['hr'] = float(text)
+        elif name in SENSOR_NAMES:
+            values[SENSOR_NAMES[name]] = float(text)
+    return values
+
+def read_tcx_track(source, sample_minutes=2):
+    """
+    Read every trackpoint of a TCX document in a single streaming pass.
+
+    Args:
+        source: Path or binary file-like object containing TCX XML
+        sample_minutes: Length of the window used for frequency detection
+
+    Returns:
+        TrackArray like read_gpx_track's, with 'creator' (the device name),
+        'points_per_minute' and 'lap_starts' (epoch start time of every lap)
+        in its metadata. Trackpoints without a position are skipped.
+        Cadence and power columns are only present when the file records them.
+    """
+    lats = array('d')
+    lons = array('d')
+    elevations = array('d')
+    heart_rates = array('d')
+    sensors = {'cadence': array('d'), 'power': array('d')}
+    recorded = set()
+    time_texts = []
+    lap_start_texts = []
+    creator = None
+    path = []
+    current_track = None
+    nan = float('nan')
+
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        name = _local(elem.tag)
+        if event == 'start':
+            path.append(name)
+            if name == 'Track':
+                current_track = elem
+            elif name == 'Lap' and elem.get('StartTime'):
+                lap_start_texts.append(elem.get('StartTime').strip())
+            continue
+        path.pop()
+
+        if name == 'Trackpoint':
+            try:
+                values = _read_trackpoint(elem)
+                if 'time' in values and 'lat' in values and 'lon' in values:
+                    lats.append(values['lat'])
+                    lons.append(values['lon'])
+                    elevations.append(values.get('elevation', 0))
+                    heart_rates.append(values.get('hr', nan))
+                    for field, column in sensors.items():
+                        if field in values:
+                            column.append(values[field])
+                            recorded.add(field)
+                        else:
+                            column.append(nan)
+                    time_texts.append(values['time'])
+            except Exception as e:
+                print(f"Error processing point: {str(e)}")
+            finally:
+                # Free the element and everything below it
+                elem.clear()
+                if current_track is not None:
+                    current_track.remove(elem)
+        elif name == 'Track':
+            current_track = None
+        elif name == 'Lap':
+            elem.clear()
+        elif name == 'Name' and path[-2:] == ['Activity', 'Creator'] and creator is None:
+            creator = (elem.text or '').strip() or None
+
+    columns = {
+        'lat': lats,
+        'lon': lons,
+        'time': decode_timestamps(time_texts),
+        'elevation': elevations,
+        'hr': heart_rates
+    }
+    for field in ('cadence', 'power'):
+        if field in recorded:
+            columns[field] = sensors[field]
+    track = TrackArray(columns).freeze()
+
+    track.metadata['creator'] = creator
+    track.metadata['points_per_minute'] = measure_points_per_minute(track['time'], sample_minutes)
+    track.metadata['lap_starts'] = [float(start) for start in decode_timestamps(lap_start_texts)] if lap_start_texts else []
+    return track
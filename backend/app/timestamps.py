@@ -0,0 +1,162 @@
+"""
+Timestamp decoding and timezone lookup.
+
+Track times are kept as UTC epoch seconds throughout the analysis. They are
+only turned into zone-aware datetimes when results are presented, using the
+zone objects cached by get_timezone.
+"""
+from array import array
+from calendar import timegm
+from datetime import datetime, timezone
+from functools import lru_cache
+import pytz
+from tzlocal import get_localzone
+from app.track import np, has_numpy
+
+class TimestampDecoder:
+    """
+    Decode ISO-8601 timestamps ('2025-03-29T12:13:39Z', '...39.250Z',
+    '...39+02:00') into UTC epoch seconds.
+
+    Fields are sliced at fixed positions instead of going through strptime,
+    and the epoch of each calendar day is computed once and cached, so a
+    whole track costs a handful of int() calls per point. Anything that does
+    not fit the fast path goes through datetime.fromisoformat.
+    """
+    MAX_CACHED_DAYS = 1024
+
+    def __init__(self):
+        self.days = {}
+
+    def __call__(self, text):
+        text = text.strip()
+        try:
+            if text[4] != '-' or text[7] != '-' or text[10] not in 'Tt ' or text[13] != ':' or text[16] != ':':
+                raise ValueError(text)
+
+            day = self.days.get(text[:10])
+            if day is None:
+                if len(self.days) >= self.MAX_CACHED_DAYS:
+                    self.days.clear()
+                day = timegm((int(text[:4]), int(text[5:7]), int(text[8:10]), 0, 0, 0))
+                self.days[text[:10]] = day
+
+            seconds = day + int(text[11:13]) * 3600 + int(text[14:16]) * 60 + int(text[17:19])
+
+            # Fractional seconds
+            end = 19
+            if end < len(text) and text[end] in '.,':
+                end += 1
+                while end < len(text) and text[end].isdigit():
+                    end += 1
+                seconds += float('0.' + text[20:end])
+
+            # Zone designator: none or Z means UTC, otherwise +HH:MM / +HHMM / +HH
+            zone = text[end:]
+            if zone and zone not in ('Z', 'z'):
+                if zone[0] not in '+-':
+                    raise ValueError(text)
+                digits = zone[1:].replace(':', '')
+                offset = int(digits[:2]) * 3600 + int(digits[2:4] or 0) * 60
+                seconds -= offset if zone[0] == '+' else -offset
+            return seconds
+        except (ValueError, IndexError):
+            return self._fallback(text)
+
+    def _fallback(self, text):
+        if text.endswith(('Z', 'z')):
+            text = text[:-1] + '+00:00'
+        parsed = datetime.fromisoformat(text)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+
+# Shared decoder for one-off conversions
+parse_timestamp = TimestampDecoder()
+
+def decode_timestamps(texts):
+    """
+    Decode a sequence of ISO-8601 timestamps into an epoch-seconds column.
+
+    Tracks written by one device use a single fixed-width UTC format, which
+    NumPy can decode for all points at once; otherwise each timestamp goes
+    through TimestampDecoder.
+    """
+    if has_numpy and texts:
+        times = _decode_fixed_width(texts)
+        if times is not None:
+            return times
+        return np.fromiter(map(TimestampDecoder(), texts), dtype=np.float64, count=len(texts))
+    return array('d', map(TimestampDecoder(), texts))
+
+# Layout of 'YYYY-MM-DDTHH:MM:SS[.fff]Z'
+_SEPARATORS = {4: ord('-'), 7: ord('-'), 10: ord('T'), 13: ord(':'), 16: ord(':')}
+_DIGITS = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]
+
+def _decode_fixed_width(texts):
+    """Vectorized decode of same-width UTC timestamps, or None if they don't qualify"""
+    width = len(texts[0])
+    if width < 20 or not texts[0].endswith('Z') or (width > 20 and texts[0][19] != '.'):
+        return None
+    if any(len(text) != width for text in texts):
+        return None
+    try:
+        raw = np.frombuffer(''.join(texts).encode('ascii'), dtype=np.uint8).reshape(len(texts), width)
+    except UnicodeEncodeError:
+        return None
+
+    # Every row must have the separators in the same places
+    fixed = dict(_SEPARATORS)
+    fixed[width - 1] = ord('Z')
+    if width > 20:
+        fixed[19] = ord('.')
+    if not (raw[:, list(fixed)] == np.array(list(fixed.values()), dtype=np.uint8)).all():
+        return None
+    digit_columns = _DIGITS + list(range(20, width - 1))
+    digits = raw[:, digit_columns].astype(np.int64) - ord('0')
+    if ((digits < 0) | (digits > 9)).any():
+        return None
+
+    def field(start, length):
+        value = digits[:, start]
+        for k in range(1, length):
+            value = value * 10 + digits[:, start + k]
+        return value
+
+    year, month, day = field(0, 4), field(4, 2), field(6, 2)
+    hour, minute, second = field(8, 2), field(10, 2), field(12, 2)
+
+    # Days since 1970-01-01 for a proleptic Gregorian date (H. Hinnant's days_from_civil)
+    year = year - (month <= 2)
+    era = np.floor_divide(year, 400)
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    days = era * 146097 + day_of_era - 719468
+
+    times = (days * 86400 + hour * 3600 + minute * 60 + second).astype(np.float64)
+    fraction_digits = width - 21
+    if fraction_digits > 0:
+        fraction = field(14, fraction_digits).astype(np.float64) / (10 ** fraction_digits)
+        times += fraction
+    return times
+
+@lru_cache(maxsize=1)
+def _server_timezone():
+    return get_localzone()
+
+@lru_cache(maxsize=64)
+def get_timezone(name=None):
+    """
+    Cached timezone registry.
+
+    Returns the tz object for an IANA zone name (e.g. a user's
+    'America/Detroit'), falling back to the server's local zone when no
+    name, or an unknown one, is given.
+    """
+    if name:
+        try:
+            return pytz.timezone(name)
+        except pytz.UnknownTimeZoneError:
+            print(f"Unknown timezone '{name}', using server local time")
+    return _server_timezone()
@@ -0,0 +1,116 @@
+from array import array
+import sys
+import json
+import zlib
+
+# NumPy is optional - fall back to the stdlib array module without it
+try:
+    import numpy as np
+    has_numpy = True
+except ImportError:
+    np = None
+    has_numpy = False
+
+class TrackArray:
+    """
+    Columnar container for a parsed track.
+
+    Every column is a contiguous float64 array of the same length: a NumPy
+    array when NumPy is installed, a stdlib array('d') otherwise. Times are
+    UTC epoch seconds and missing samples (e.g. heart rate) are NaN.
+
+    Base columns are filled by the file readers; stages of the analysis
+    pipeline add derived columns (distance, pace, ...) with set_column.
+    File-level details (creator, sampling frequency, ...) live in metadata.
+    """
+    BASE_COLUMNS = ('lat', 'lon', 'time', 'elevation', 'hr')
+
+    def __init__(self, columns=None, metadata=None):
+        self.metadata = dict(metadata or {})
+        if columns is None:
+            columns = {name: array('d') for name in self.BASE_COLUMNS}
+        self.columns = dict(columns)
+
+    def freeze(self):
+        """Switch the columns to NumPy arrays (zero-copy) once building is done"""
+        if has_numpy:
+            for name, values in self.columns.items():
+                if isinstance(values, array):
+                    self.columns[name] = np.frombuffer(values, dtype=np.float64)
+        return self
+
+    def __len__(self):
+        return len(self.columns['time'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def set_column(self, name, values):
+        """Store a derived column, converting it to the track's array type"""
+        if has_numpy:
+            self.columns[name] = np.asarray(values, dtype=np.float64)
+        else:
+            self.columns[name] = values if isinstance(values, array) else array('d', values)
+
+    def take(self, indices):
+        """Return a new track holding only the points at the given indices"""
+        if has_numpy:
+            idx = np.asarray(indices, dtype=np.intp)
+            columns = {name: values[idx] for name, values in self.columns.items()}
+        else:
+            columns = {name: array('d', (values[i] for i in indices))
+                       for name, values in self.columns.items()}
+        return TrackArray(columns, metadata=self.metadata)
+
+    def heart_rates(self):
+        """Heart rate samples as a list of ints, skipping missing values"""
+        return [int(hr) for hr in self.columns['hr'] if hr == hr]
+
+    @property
+    def nbytes(self):
+        return sum(len(values) * 8 for values in self.columns.values())
+
+    def to_bytes(self, names=None):
+        """
+        Compact serialized form of the track: a JSON header (length, column
+        names, metadata) followed by the little-endian float64 columns, all
+        zlib-compressed. `names` limits the columns stored.
+        """
+        names = [name for name in (names or self.columns) if name in self.columns]
+        header = json.dumps({'length': len(self), 'columns': names, 'metadata': self.metadata})
+        parts = [header.encode('utf-8'), b'\n']
+        for name in names:
+            values = self.columns[name]
+            if has_numpy:
+                parts.append(np.asarray(values, dtype='<f8').tobytes())
+            else:
+                values = array('d', values)
+                if sys.byteorder != 'little':
+                    values.byteswap()
+                parts.append(values.tobytes())
+        return zlib.compress(b''.join(parts), 6)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Rebuild a track stored with to_bytes"""
+        raw = zlib.decompress(data)
+        split = raw.index(b'\n')
+        header = json.loads(raw[:split].decode('utf-8'))
+        n = header['length']
+        columns = {}
+        offset = split + 1
+        for name in header['columns']:
+            chunk = raw[offset:offset + 8 * n]
+            offset += 8 * n
+            if has_numpy:
+                columns[name] = np.frombuffer(chunk, dtype='<f8').astype(np.float64)
+            else:
+                values = array('d')
+                values.frombytes(chunk)
+                if sys.byteorder != 'little':
+                    values.byteswap()
+                columns[name] = values
+        return cls(columns, metadata=header['metadata'])
@@ -0,0 +1,83 @@
+"""
+Raw tracks kept with saved runs.
+
+The parsed track of every analyzed upload is stored in compact form
+(TrackArray.to_bytes) in a `run_tracks` table next to the settings it was
+analyzed with, so a run can be analyzed again - e.g. at another pace
+limit - without the GPX file being uploaded and parsed again.
+"""
+import json
+import time
+import sqlite3
+from app.track import TrackArray
+
+def ensure_run_tracks_table(conn):
+    """Create the run_tracks table if it doesn't exist"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS run_tracks (
+            run_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            track BLOB NOT NULL,
+            options TEXT,
+            created_at REAL,
+            FOREIGN KEY (run_id) REFERENCES runs(id)
+        )
+    ''')
+
+class RunTrackStore:
+    """Storage operations on the run_tracks table"""
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+        with self._connect() as conn:
+            ensure_run_tracks_table(conn)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_name, timeout=30)
+
+    def save(self, run_id, user_id, track, options=None):
+        """
+        Store the raw track of a run (a TrackArray or bytes from to_bytes)
+        with the analysis options (user_age, resting_hr, ...) it was used with
+        """
+        data = track.to_bytes() if isinstance(track, TrackArray) else track
+        with self._connect() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO run_tracks (run_id, user_id, track, options, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (run_id, user_id, sqlite3.Binary(data), json.dumps(options or {}), time.time()))
+        print(f"Stored raw track for run {run_id} ({len(data) / 1024:.1f} KB)")
+
+    def get(self, run_id, user_id=None):
+        """
+        {'track': TrackArray, 'options': dict} for a run, or None when the
+        run has no stored track (or belongs to another user)
+        """
+        raw = self.get_raw(run_id, user_id)
+        if not raw:
+            return None
+        return {'track': TrackArray.from_bytes(raw['track']), 'options': raw['options']}
+
+    def get_raw(self, run_id, user_id=None):
+        """Like get, with the track left as the stored bytes"""
+        query = 'SELECT track, options FROM run_tracks WHERE run_id = ?'
+        args = [run_id]
+        if user_id is not None:
+            query += ' AND user_id = ?'
+            args.append(user_id)
+        with self._connect() as conn:
+            row = conn.execute(query, args).fetchone()
+        if not row:
+            return None
+        return {'track': bytes(row[0]), 'options': json.loads(row[1] or '{}')}
+
+    def update_options(self, run_id, options):
+        """Record the options a run's stored analysis was made with"""
+        with self._connect() as conn:
+            conn.execute('UPDATE run_tracks SET options = ? WHERE run_id = ?',
+                         (json.dumps(options or {}), run_id))
+
+    def delete(self, run_id):
+        """Drop the stored track of a run"""
+        with self._connect() as conn:
+            conn.execute('DELETE FROM run_tracks WHERE run_id = ?', (run_id,))
@@ -0,0 +1,232 @@
+"""
+Heart rate training zones.
+
+Time in zone is the sum of the real durations of the HR samples that fall
+in it: samples are binned with searchsorted and the durations summed with
+bincount. Zone definitions are read-only templates; every call builds its
+own result dicts.
+"""
+import bisect
+import heapq
+from app.track import np, has_numpy
+
+# Heart rate reserve (Karvonen) zones - the default model
+TRAINING_ZONES = {
+    'Zone 1': {
+        'name': 'Recovery',
+        'range': (0.30, 0.40),  # 30-40% of HRR
+        'description': 'Very light intensity, active recovery, improves basic endurance',
+        'color': '#7FB3D5'  # Light blue
+    },
+    'Zone 2': {
+        'name': 'Aerobic',
+        'range': (0.40, 0.60),  # 40-60% of HRR
+        'description': 'Light aerobic, fat burning, builds endurance',
+        'color': '#2ECC71'  # Green
+    },
+    'Zone 3': {
+        'name': 'Tempo',
+        'range': (0.60, 0.70),  # 60-70% of HRR
+        'description': 'Moderate intensity, improves efficiency and aerobic capacity',
+        'color': '#F4D03F'  # Yellow
+    },
+    'Zone 4': {
+        'name': 'Threshold',
+        'range': (0.70, 0.85),  # 70-85% of HRR
+        'description': 'Hard intensity, increases lactate threshold and speed',
+        'color': '#E67E22'  # Orange
+    },
+    'Zone 5': {
+        'name': 'VO2 Max',
+        'range': (0.85, 1.00),  # 85-100% of HRR
+        'description': 'Maximum effort, improves speed and power',
+        'color': '#E74C3C'  # Red
+    }
+}
+
+def _with_ranges(ranges):
+    """Copy of TRAINING_ZONES with the fractional ranges replaced"""
+    return {name: dict(zone, range=ranges[i]) for i, (name, zone) in enumerate(TRAINING_ZONES.items())}
+
+# Zone models. 'range' is a fraction of the model's reference:
+#   hrr   - heart rate reserve above resting HR (Karvonen)
+#   hrmax - maximum heart rate
+#   lthr  - lactate threshold heart rate (Friel's running zones)
+ZONE_MODELS = {
+    'hrr': TRAINING_ZONES,
+    'hrmax': _with_ranges([(0.50, 0.60), (0.60, 0.70), (0.70, 0.80), (0.80, 0.90), (0.90, 1.00)]),
+    'lthr': _with_ranges([(0.00, 0.85), (0.85, 0.90), (0.90, 0.95), (0.95, 1.00), (1.00, 1.06)])
+}
+
+def kth_largest(values, k):
+    """k-th largest value (1-based) by selection rather than a full sort"""
+    if has_numpy:
+        values = np.asarray(values)
+        return np.partition(values, len(values) - k)[len(values) - k].item()
+    return heapq.nlargest(k, values)[-1]
+
+def percentile(values, q):
+    """
+    The q-th percentile (0-100) as the old sorted-list lookup took it:
+    sorted(values)[-int(n * (100 - q) / 100)].
+    """
+    k = max(int(len(values) * (100 - q) / 100), 1)
+    return kth_largest(values, k)
+
+def estimate_max_hr(user_age, heart_rates=None):
+    """
+    Max HR from age (Tanaka from 40 on, 220 - age below), replaced by the
+    95th percentile of the recorded HR when there is enough data and it is
+    within 10% of the formula.
+    """
+    if user_age >= 40:
+        max_hr = 208 - (0.7 * user_age)  # Tanaka formula
+    else:
+        max_hr = 220 - user_age  # Traditional formula
+
+    if heart_rates is not None and len(heart_rates) > 100:
+        measured_max_hr = percentile(heart_rates, 95)
+        if max_hr * 0.9 < measured_max_hr < max_hr * 1.1:
+            max_hr = measured_max_hr
+            print(f"Using measured max HR: {max_hr}")
+    return max_hr
+
+def filter_outliers(heart_rates, durations):
+    """Drop samples more than 2.5 standard deviations from the mean, unless that drops over 20%"""
+    n = len(heart_rates)
+    if has_numpy:
+        mean = heart_rates.mean()
+        keep = np.abs(heart_rates - mean) <= 2.5 * heart_rates.std()
+        kept = int(np.count_nonzero(keep))
+    else:
+        mean = sum(heart_rates) / n
+        std_dev = (sum((hr - mean) ** 2 for hr in heart_rates) / n) ** 0.5
+        keep = [abs(hr - mean) <= 2.5 * std_dev for hr in heart_rates]
+        kept = sum(keep)
+
+    if kept < n * 0.8:
+        print(f"Heart rate filtering reverted - too many outliers")
+        return heart_rates, durations
+    print(f"Filtered heart rates: removed {n - kept} outliers")
+    if has_numpy:
+        return heart_rates[keep], durations[keep]
+    return ([hr for hr, k in zip(heart_rates, keep) if k],
+            [duration for duration, k in zip(durations, keep) if k])
+
+def zone_times(fractions, durations, upper_bounds):
+    """
+    Seconds spent in each zone.
+
+    A sample belongs to the first zone whose upper bound it does not
+    exceed; anything above the last bound lands in the last zone and
+    anything below the first zone in the first.
+    """
+    zone_count = len(upper_bounds)
+    if has_numpy:
+        bins = np.searchsorted(np.asarray(upper_bounds[:-1]), fractions, side='left')
+        return np.bincount(bins, weights=durations, minlength=zone_count).tolist()
+
+    seconds = [0.0] * zone_count
+    inner_bounds = upper_bounds[:-1]
+    for fraction, duration in zip(fractions, durations):
+        seconds[bisect.bisect_left(inner_bounds, fraction)] += duration
+    return seconds
+
+def hr_sample_durations(track):
+    """
+    HR samples of a track with motion columns and the seconds each one
+    stands for (the time since the previous point). Samples in a pause
+    (the 'paused' column) are left out.
+    """
+    hr = track['hr']
+    steps = track['time_step']
+    paused = track['paused'] if 'paused' in track else None
+    if has_numpy:
+        valid = hr == hr
+        if paused is not None:
+            valid &= paused == 0
+        return hr[valid], steps[valid]
+    valid = [i for i, value in enumerate(hr) if value == value and not (paused is not None and paused[i])]
+    return [hr[i] for i in valid], [steps[i] for i in valid]
+
+def compute_training_zones(heart_rates, durations, user_age=None, resting_hr=None,
+                           model='hrr', max_hr=None, lthr=None):
+    """
+    Time spent in each training zone.
+
+    Args:
+        heart_rates: HR samples (bpm)
+        durations: Seconds each sample stands for (same length)
+        user_age, resting_hr: Used to derive max HR and the HR reserve
+        model: 'hrr', 'hrmax', 'lthr' or a custom dict shaped like
+               TRAINING_ZONES with ranges as fractions of the reference HR
+        max_hr: Known max HR; estimated from age and the data if missing
+        lthr: Lactate threshold HR, required by the 'lthr' model
+
+    Returns:
+        Fresh dict of zones with hr_range, time_spent (minutes) and
+        percentage (share of time) added, or None without enough data
+    """
+    if len(heart_rates) == 0:
+        print("Missing required data for training zones")
+        return None
+
+    if isinstance(model, dict):
+        model_name, template = 'custom', model
+    else:
+        model_name = model if model in ZONE_MODELS else 'hrr'
+        if model_name == 'lthr' and not lthr:
+            print("No LTHR available, using heart rate reserve zones")
+            model_name = 'hrr'
+        template = ZONE_MODELS[model_name]
+
+    if model_name in ('hrr', 'custom') and not (resting_hr and (user_age or max_hr)):
+        print("Missing required data for training zones")
+        return None
+    if model_name == 'hrmax' and not (user_age or max_hr):
+        print("Missing required data for training zones")
+        return None
+
+    if has_numpy:
+        heart_rates = np.asarray(heart_rates, dtype=np.float64)
+        durations = np.asarray(durations, dtype=np.float64)
+    else:
+        heart_rates = list(heart_rates)
+        durations = list(durations)
+    heart_rates, durations = filter_outliers(heart_rates, durations)
+
+    if model_name != 'lthr' and not max_hr:
+        max_hr = estimate_max_hr(user_age, heart_rates)
+
+    # Reference HR and offset: fraction = (hr - offset) / reference
+    if model_name == 'lthr':
+        offset, reference = 0, lthr
+    elif model_name == 'hrmax':
+        offset, reference = 0, max_hr
+    else:
+        offset, reference = resting_hr, max_hr - resting_hr
+    if reference <= 0:
+        print(f"Invalid zone reference HR: {reference}")
+        return None
+
+    print(f"Zone model: {model_name}, reference HR: {reference}, offset: {offset}")
+
+    if has_numpy:
+        fractions = (heart_rates - offset) / reference
+    else:
+        fractions = [(hr - offset) / reference for hr in heart_rates]
+
+    zones = {name: dict(zone) for name, zone in template.items()}
+    seconds = zone_times(fractions, durations, [zone['range'][1] for zone in zones.values()])
+    total_time = sum(seconds)
+    print(f"Total time: {total_time:.2f} seconds ({total_time/60:.2f} minutes)")
+
+    for zone, zone_seconds in zip(zones.values(), seconds):
+        zone['hr_range'] = (
+            int(offset + (zone['range'][0] * reference)),
+            int(offset + (zone['range'][1] * reference))
+        )
+        zone['time_spent'] = zone_seconds / 60  # Minutes
+        zone['percentage'] = (zone_seconds / total_time * 100) if total_time > 0 else 0
+
+    return zones
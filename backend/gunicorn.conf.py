@@ -0,0 +1,21 @@
+"""
+Gunicorn settings shared by every launch command (Procfile, start_render.sh).
+
+Command-line flags still set the worker count, threads and bind address;
+this file only adds the server hooks.
+"""
+
+def post_worker_init(worker):
+    """
+    Start the analysis job pool as soon as a web worker has loaded the app.
+
+    The pool is forked here, before the gthread worker starts its request
+    threads, so the job processes never inherit a half-held lock from a
+    thread that was serving a request. Only one web worker wins the pool
+    lock; in the others this is a no-op, and /jobs still calls
+    start_workers on enqueue to take the pool over if that worker restarts.
+    """
+    from routes.jobs import db
+    from app.jobs import start_workers
+    start_workers(db.db_name)
+    print(f"Worker {worker.pid}: analysis job pool checked")
@@ -0,0 +1,139 @@
+from flask import Blueprint, request, jsonify, session, Response, stream_with_context
+from functools import wraps
+import traceback
+import json
+import time
+from app.database import RunDatabase
+from app.bulk import run_date_from_filename
+from app.running import RUN_FILE_EXTENSIONS
+from app.downsample import downsample_settings
+from app.jobs import JobQueue, start_workers
+
+jobs_bp = Blueprint('jobs_bp', __name__)
+db = RunDatabase()  # This will now use DATABASE_PATH from environment
+queue = JobQueue(db.db_name)
+
+# Longest time one /events stream stays open. It is kept well under the
+# gunicorn worker timeout (30 s); EventSource clients reconnect on their own
+# after EVENT_RETRY_MS and get the current state straight away
+EVENT_STREAM_SECONDS = 20
+EVENT_RETRY_MS = 1000
+
+def login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            return jsonify({'error': 'Unauthorized'}), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
+@jobs_bp.route('/jobs', methods=['POST'])
+@login_required
+def create_job():
+    """
+    Queue a GPX, TCX or FIT upload for background analysis.
+
+    Takes the same form fields as /analyze and returns 202 with the job id
+    right away; progress is available from /jobs/<id> and /jobs/<id>/events.
+    """
+    try:
+        if 'file' not in request.files:
+            return jsonify({'error': 'No file uploaded'}), 400
+
+        file = request.files['file']
+        if not file or not file.filename.lower().endswith(RUN_FILE_EXTENSIONS):
+            return jsonify({'error': 'Invalid file format'}), 400
+
+        profile = db.get_profile(session['user_id'])
+        params = {
+            'pace_limit': float(request.form.get('paceLimit', 0)),
+            'user_age': int(request.form.get('age', 0)),
+            'resting_hr': int(request.form.get('restingHR', 0)),
+            'weight': profile.get('weight', 70),
+            'gender': profile.get('gender', 1),
+            'tz_name': request.form.get('timezone') or None,
+            'run_date': run_date_from_filename(file.filename)
+        }
+        try:
+            downsample = downsample_settings(request.form.get('downsample') or None,
+                                             request.form.get('downsamplePoints', type=int))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if downsample:
+            params['downsample'] = downsample
+
+        job_id = queue.enqueue(session['user_id'], file.stream.read(), params, filename=file.filename)
+        start_workers(db.db_name)
+
+        return jsonify({
+            'message': 'Analysis queued',
+            'job_id': job_id,
+            'status_url': f'/jobs/{job_id}',
+            'events_url': f'/jobs/{job_id}/events'
+        }), 202
+    except Exception as e:
+        print(f"\nServer error in /jobs route:")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+@jobs_bp.route('/jobs/<job_id>', methods=['GET'])
+@login_required
+def get_job(job_id):
+    """Current status, stage and progress of a job; run_id once it is done"""
+    job = queue.get(job_id, session['user_id'])
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@jobs_bp.route('/jobs/batches/<batch_id>', methods=['GET'])
+@login_required
+def get_batch(batch_id):
+    """Status of every job of a bulk import, with counts per status"""
+    batch = queue.batch(batch_id, session['user_id'])
+    if not batch:
+        return jsonify({'error': 'Batch not found'}), 404
+    counts = {}
+    for job in batch:
+        counts[job['status']] = counts.get(job['status'], 0) + 1
+    return jsonify({
+        'batch_id': batch_id,
+        'total': len(batch),
+        'counts': counts,
+        'finished': counts.get('done', 0) + counts.get('failed', 0) == len(batch),
+        'jobs': batch
+    })
+
+@jobs_bp.route('/jobs/<job_id>/events', methods=['GET'])
+@login_required
+def job_events(job_id):
+    """
+    Server-Sent Events stream of a job's progress.
+
+    Sends a 'progress' event whenever the stage or progress changes and a
+    final 'done' or 'failed' event, then closes. Streams of jobs that are
+    still running close after EVENT_STREAM_SECONDS and the client
+    reconnects; clients that can't stream can poll /jobs/<id> instead.
+    """
+    user_id = session['user_id']
+    if not queue.get(job_id, user_id):
+        return jsonify({'error': 'Job not found'}), 404
+
+    def events():
+        yield f"retry: {EVENT_RETRY_MS}\n\n"
+        last_state = None
+        deadline = time.time() + EVENT_STREAM_SECONDS
+        while time.time() < deadline:
+            job = queue.get(job_id, user_id)
+            if not job:
+                break
+            state = (job['status'], job['stage'], job['progress'])
+            if state != last_state:
+                last_state = state
+                event = job['status'] if job['status'] in ('done', 'failed') else 'progress'
+                yield f"event: {event}\ndata: {json.dumps(job)}\n\n"
+                if event != 'progress':
+                    break
+            time.sleep(0.5)
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
@@ -0,0 +1,118 @@
+"""
+Compressed request bodies.
+
+Clients may send an upload form with Content-Encoding gzip or deflate.
+The body is inflated chunk by chunk as werkzeug's form parser reads it, so
+the compressed request is never buffered whole. The parser still writes
+each uploaded file part, inflated, to a temporary file, so the run file is
+held there in full before it is analyzed, just as an uncompressed upload is.
+"""
+import os
+import io
+import zlib
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+from werkzeug.wsgi import LimitedStream
+
+# Largest request body accepted after inflating, which keeps a small
+# compressed upload from expanding without bound
+MAX_INFLATED_BODY = int(os.environ.get('MAX_INFLATED_BODY', 512 * 1024 * 1024))
+
+INFLATE_CHUNK_SIZE = 64 * 1024
+
+def inflate_wbits(head):
+    """
+    zlib.decompressobj wbits for a compressed body starting with `head`:
+    automatic gzip or zlib header detection when either header is there,
+    otherwise raw DEFLATE, which some clients send as 'deflate' without the
+    zlib wrapper the HTTP spec asks for
+    """
+    if head[:2] == b'\x1f\x8b':
+        return 32 + zlib.MAX_WBITS
+    if len(head) >= 2 and head[0] & 0x0f == 8 and ((head[0] << 8) | head[1]) % 31 == 0:
+        return 32 + zlib.MAX_WBITS
+    return -zlib.MAX_WBITS
+
+class InflatingStream(io.RawIOBase):
+    """
+    Read-only stream of the inflated content of a gzip, zlib (HTTP
+    'deflate') or raw DEFLATE compressed stream, inflated chunk by chunk as
+    it is read. The format is told from the first two bytes.
+    Raises RequestEntityTooLarge once more than `max_size` bytes come out.
+    """
+
+    def __init__(self, stream, max_size=MAX_INFLATED_BODY):
+        self.stream = stream
+        self.max_size = max_size
+        self.total = 0
+        # Created once the first bytes show which header the stream has
+        self.inflater = None
+        self.pending = b''
+        self.finished = False
+
+    def _start(self, compressed):
+        """Inflater for a stream starting with `compressed`, and those bytes"""
+        while len(compressed) < 2:
+            more = self.stream.read(INFLATE_CHUNK_SIZE)
+            if not more:
+                break
+            compressed += more
+        self.inflater = zlib.decompressobj(inflate_wbits(compressed))
+        return compressed
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending and not self.finished:
+            compressed = (self.inflater and self.inflater.unconsumed_tail) or self.stream.read(INFLATE_CHUNK_SIZE)
+            try:
+                if compressed:
+                    if self.inflater is None:
+                        compressed = self._start(compressed)
+                    self.pending = self.inflater.decompress(compressed, INFLATE_CHUNK_SIZE)
+                    if self.inflater.eof and self.inflater.unused_data:
+                        # Another gzip member follows
+                        rest = self.inflater.unused_data
+                        self.inflater = zlib.decompressobj(32 + zlib.MAX_WBITS)
+                        self.pending += self.inflater.decompress(rest, INFLATE_CHUNK_SIZE)
+                else:
+                    if self.inflater is None or not self.inflater.eof:
+                        raise BadRequest("Truncated compressed request body")
+                    self.finished = True
+            except zlib.error as e:
+                raise BadRequest(f"Invalid compressed request body: {e}")
+            self.total += len(self.pending)
+            if self.total > self.max_size:
+                raise RequestEntityTooLarge()
+
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+class DecodeRequestBody:
+    """
+    WSGI middleware that undoes Content-Encoding gzip or deflate on request
+    bodies, so multipart forms sent compressed are parsed as usual. The body
+    is inflated as the form parser reads it.
+    """
+
+    ENCODINGS = ('gzip', 'x-gzip', 'deflate')
+
+    def __init__(self, app, max_size=MAX_INFLATED_BODY):
+        self.app = app
+        self.max_size = max_size
+
+    def __call__(self, environ, start_response):
+        encoding = environ.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+        if encoding in self.ENCODINGS:
+            stream = environ['wsgi.input']
+            length = environ.get('CONTENT_LENGTH')
+            if length and length.isdigit() and 'wsgi.input_terminated' not in environ:
+                stream = LimitedStream(stream, int(length))
+            environ['wsgi.input'] = InflatingStream(stream, self.max_size)
+            # The inflated length isn't known up front; the stream ends itself
+            environ.pop('CONTENT_LENGTH', None)
+            environ['wsgi.input_terminated'] = True
+            del environ['HTTP_CONTENT_ENCODING']
+        return self.app(environ, start_response)
@@ -1,16 +1,26 @@
 from flask import Blueprint, request, jsonify, session, current_app
 from functools import wraps
 import traceback
-import re
-import os
 from datetime import datetime
 from app.database import RunDatabase, safe_json_dumps
-from app.running import analyze_run_file, calculate_vo2max, calculate_training_load, calculate_recovery_time
+from app.running import analyze_run_file, calculate_vo2max, calculate_training_load, calculate_recovery_time, route_track
+from app.segments import materialize_route
+from app.bulk import enqueue_uploads
+from app.downsample import downsample_settings
+from app.jobs import JobQueue, start_workers
+from app.track_store import RunTrackStore
+from app.pace_distribution import PaceHistogramStore, pace_split, pace_curve, merge_histograms
+from app.splits import splits_for_track, SPLIT_UNITS
+from app.best_efforts import BestEffortStore, riegel_predictions
 import json
 
 # Initialize database with environment variables
 runs_bp = Blueprint('runs_bp', __name__)
 db = RunDatabase()  # This will now use DATABASE_PATH from environment
+tracks = RunTrackStore(db.db_name)
+histograms = PaceHistogramStore(db.db_name)
+efforts = BestEffortStore(db.db_name)
+jobs = JobQueue(db.db_name)
 
 # Updated CustomJSONEncoder with comprehensive Infinity handling
 class CustomJSONEncoder(json.JSONEncoder):
@@ -186,123 +196,57 @@ def get_runs():
         return jsonify([])
 
 
-@runs_bp.route('/analyze', methods=['POST'])
+@runs_bp.route('/analyze/bulk', methods=['POST'])
 @login_required
-def analyze():
+def analyze_bulk():
+    """
+    Import many runs at once.
+    
+    Accepts one or more zip archives and/or GPX, TCX or FIT files in the 'files'
+    form field (or 'file'). Every run file is queued as a background
+    analysis job, so the request returns 202 as soon as the files are
+    stored, with a status entry per file and the batch id; progress of the
+    whole import is available from /jobs/batches/<batch_id>.
+    """
     try:
-        print("\n=== Starting Analysis ===")
-        if 'file' not in request.files:
-            print("No file in request")
-            return jsonify({'error': 'No file uploaded'}), 400
-            
-        file = request.files['file']
-        print(f"\nFile details:")
-        print(f"Filename: {file.filename}")
-        print(f"Content type: {file.content_type}")
-        print(f"File size: {len(file.read())} bytes")
-        file.seek(0)  # Reset file pointer after reading
+        print("\n=== Starting Bulk Import ===")
+        uploads = request.files.getlist('files') or request.files.getlist('file')
+        if not uploads:
+            return jsonify({'error': 'No files uploaded'}), 400
         
-        pace_limit = float(request.form.get('paceLimit', 0))
-        age = int(request.form.get('age', 0))
-        resting_hr = int(request.form.get('restingHR', 0))
-        
-        # Get user profile for additional metrics
         profile = db.get_profile(session['user_id'])
-        print("\nProfile data:", profile)
-        
-        if not file or not file.filename.endswith('.gpx'):
-            print("Invalid file format")
-            return jsonify({'error': 'Invalid file format'}), 400
-            
-        # Extract date from filename
-        date_match = re.search(r'\d{4}-\d{2}-\d{2}', file.filename)
-        run_date = date_match.group(0) if date_match else datetime.now().strftime('%Y-%m-%d')
-        
-        # Save uploaded file temporarily
-        temp_path = 'temp.gpx'
-        file.save(temp_path)
-        
-        print("\nFile saved to:", temp_path)
-        print("File exists:", os.path.exists(temp_path))
-        print("File size:", os.path.getsize(temp_path))
-        
+        params = {
+            'pace_limit': float(request.form.get('paceLimit', 0)),
+            'user_age': int(request.form.get('age', 0)),
+            'resting_hr': int(request.form.get('restingHR', 0)),
+            'weight': profile.get('weight', 70),
+            'gender': profile.get('gender', 1),
+            'tz_name': request.form.get('timezone') or None
+        }
         try:
-            # Pass age, resting_hr, weight, and gender to analyze_run_file
-            analysis_result = analyze_run_file(
-                temp_path, 
-                pace_limit, 
-                user_age=age, 
-                resting_hr=resting_hr, 
-                weight=profile.get('weight', 70),
-                gender=profile.get('gender', 1)
-            )
-            print("\nAnalysis completed successfully.")
-            
-            # Log advanced metrics to verify they exist in analysis_result
-            print("\nAdvanced metrics in analysis_result:")
-            print(f"VO2 Max: {analysis_result.get('vo2max')}")
-            print(f"Training Load: {analysis_result.get('training_load')}")
-            print(f"Recovery Time: {analysis_result.get('recovery_time')}")
-            print(f"Training Zones: {analysis_result.get('training_zones') is not None}")
-
-            # Add detailed debug logging to see what exactly is being saved
-            print("\n=== SAVING RUN DATA ===")
-            print(f"Advanced metrics being saved:")
-            print(f"VO2 Max: {analysis_result.get('vo2max')}")
-            
-            # Add run date to analysis results
-            analysis_result['run_date'] = run_date
-            
-            # Save the run to database
-            encoded_data = json.dumps(analysis_result, cls=CustomJSONEncoder)
-            
-            # Debug log the full encoded data (truncated for readability)
-            print(f"Encoded data sample: {encoded_data[:100]}...")
-
-            run_id = db.add_run(
-                user_id=session['user_id'],
-                date=run_date,
-                data=encoded_data,
-                total_distance=analysis_result['total_distance'],
-                avg_pace=analysis_result.get('avg_pace_all', 0),
-                avg_hr=analysis_result.get('avg_hr_all', 0),
-                pace_limit=pace_limit
-            )
-            print(f"Run saved successfully with ID: {run_id}")
-
-            # Use custom encoder for the response too
-            response_data = {
-                'message': 'Analysis complete',
-                'data': analysis_result,
-                'run_id': run_id,
-                'saved': True,
-                'date': run_date,
-                'run_date': run_date
-            }
-            
-            # Use safe_json_dumps to ensure proper handling of Infinity values
-            return current_app.response_class(
-                response=safe_json_dumps(response_data),
-                status=200,
-                mimetype='application/json'
-            )
-            
-        except Exception as e:
-            print(f"\nError during analysis:")
-            traceback.print_exc()
-            return jsonify({'error': f'Failed to analyze run: {str(e)}'}), 500
-        finally:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-                print(f"Cleaned up temporary file: {temp_path}")
-                
-            # Also clean up downsampled file if it exists
-            downsampled_path = f"{temp_path}_downsampled.gpx"
-            if os.path.exists(downsampled_path):
-                os.remove(downsampled_path)
-                print(f"Cleaned up downsampled file: {downsampled_path}")
+            downsample = downsample_settings(request.form.get('downsample') or None,
+                                             request.form.get('downsamplePoints', type=int))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if downsample:
+            params['downsample'] = downsample
+        batch_id, files = enqueue_uploads(jobs, session['user_id'], uploads, params)
+        queued = sum(1 for entry in files if entry['status'] == 'queued')
+        print(f"Bulk import {batch_id}: {queued} of {len(files)} files queued")
+        if queued:
+            start_workers(db.db_name)
+        
+        return jsonify({
+            'message': 'Bulk import queued',
+            'batch_id': batch_id,
+            'status_url': f'/jobs/batches/{batch_id}',
+            'queued': queued,
+            'failed': sum(1 for entry in files if entry['status'] == 'error'),
+            'skipped': sum(1 for entry in files if entry['status'] == 'skipped'),
+            'files': files
+        }), 202
     except Exception as e:
-        print(f"\nServer error in /analyze route:")
+        print(f"\nServer error in /analyze/bulk route:")
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
@@ -351,8 +295,11 @@ def get_run_analysis(run_id):
                 'pace_limit': run['pace_limit'],
             }
 
-            # Copy all run_data properties into response_data
-            for key, value in run_data.items():
+            # Copy all run_data properties into response_data, with the
+            # route coordinates filled in from the stored track
+            stored = tracks.get(run_id, user_id)
+            track = route_track(stored['track'], run_data, stored['options']) if stored else None
+            for key, value in materialize_route(run_data, track).items():
                 response_data[key] = value
             
             # If advanced metrics are missing, try to recalculate them
@@ -444,4 +391,242 @@ def get_run_analysis(run_id):
     except Exception as e:
         print(f"Error retrieving run analysis: {str(e)}")
         traceback.print_exc()  # Add detailed stack trace for debugging
-        return jsonify({'error': 'Failed to retrieve analysis data'}), 500 
\ No newline at end of file
+        return jsonify({'error': 'Failed to retrieve analysis data'}), 500
+
+@runs_bp.route('/run/<int:run_id>/reanalyze', methods=['GET', 'POST'])
+@login_required
+def reanalyze_run(run_id):
+    """
+    Analyze a saved run again at another pace limit.
+    
+    Classification and aggregation are rerun on the track stored with the
+    run, so nothing has to be uploaded or parsed. Parameters: pace_limit
+    (required), downsample and downsample_points (strategy and LTTB point
+    budget for high-frequency files; by default those the run was uploaded
+    with) and save ('true' replaces the stored analysis; by default the
+    result is only returned, so the limit can be adjusted freely).
+    """
+    try:
+        pace_limit = request.values.get('pace_limit', type=float)
+        if not pace_limit or pace_limit <= 0:
+            return jsonify({'error': 'A positive pace_limit is required'}), 400
+        save = request.values.get('save', 'false').lower() in ('true', '1', 'yes')
+        try:
+            downsample = downsample_settings(request.values.get('downsample') or None,
+                                             request.values.get('downsample_points', type=int))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        run = db.get_run_by_id(run_id, session['user_id'])
+        if not run:
+            return jsonify({'error': 'Run not found or access denied'}), 404
+        
+        stored = tracks.get(run_id, session['user_id'])
+        if not stored:
+            return jsonify({'error': 'No stored track for this run, upload the run file again to reanalyze it'}), 409
+        
+        options = dict(stored['options'])
+        if downsample:
+            options['downsample'] = dict(options.get('downsample') or {}, **downsample)
+        analysis_result = analyze_run_file(stored['track'], pace_limit, **options)
+        analysis_result['run_date'] = run['date']
+        
+        saved = False
+        if save:
+            saved = db.update_run(
+                run_id,
+                session['user_id'],
+                data=safe_json_dumps(analysis_result),
+                total_distance=analysis_result['total_distance'],
+                avg_pace=analysis_result['overall_avg_pace'],
+                avg_hr=analysis_result.get('avg_hr_all', 0),
+                pace_limit=pace_limit,
+                elevation_gain=analysis_result.get('elevation_gain'),
+                elevation_loss=analysis_result.get('elevation_loss')
+            )
+            if saved:
+                # The saved route is drawn from the track prepared with these options
+                tracks.update_options(run_id, options)
+                histograms.save(run_id, session['user_id'], run['date'], analysis_result.get('pace_histogram'))
+                efforts.save(run_id, session['user_id'], run['date'], analysis_result.get('best_efforts'))
+            print(f"Reanalysis of run {run_id} at {pace_limit} min/mile saved: {saved}")
+        
+        return current_app.response_class(
+            response=safe_json_dumps({
+                'message': 'Reanalysis complete',
+                'run_id': run_id,
+                'pace_limit': pace_limit,
+                'saved': saved,
+                'date': run['date'],
+                'run_date': run['date'],
+                'data': materialize_route(analysis_result, route_track(stored['track'], analysis_result, options))
+            }),
+            status=200,
+            mimetype='application/json'
+        )
+    except Exception as e:
+        print(f"\nServer error in /run/{run_id}/reanalyze route:")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+@runs_bp.route('/run/<int:run_id>/splits', methods=['GET'])
+@login_required
+def get_run_splits(run_id):
+    """
+    Splits of a run at any interval, from its stored track.
+    
+    Mile and kilometer splits already come with the analysis; this is for
+    other intervals. Parameters: interval (split length, required) and
+    unit ('mile', 'km' or 'm'; default 'mile').
+    """
+    try:
+        interval = request.args.get('interval', type=float)
+        unit = request.args.get('unit', 'mile')
+        unit_miles = dict(SPLIT_UNITS, m=SPLIT_UNITS['km'] / 1000).get(unit)
+        if not interval or interval <= 0 or unit_miles is None:
+            return jsonify({'error': "A positive interval and a unit of 'mile', 'km' or 'm' are required"}), 400
+        
+        stored = tracks.get(run_id, session['user_id'])
+        if not stored:
+            return jsonify({'error': 'No stored track for this run'}), 404
+        
+        splits = splits_for_track(stored['track'], interval * unit_miles)
+        return current_app.response_class(
+            response=safe_json_dumps({'run_id': run_id, 'interval': interval, 'unit': unit, 'splits': splits}),
+            status=200,
+            mimetype='application/json'
+        )
+    except Exception as e:
+        print(f"\nServer error in /run/{run_id}/splits route:")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+def _run_pace_histogram(run_id, user_id):
+    """Pace histogram of a run: the stored one, or the copy in its analysis data"""
+    histogram = histograms.get(run_id, user_id)
+    if histogram:
+        return histogram
+    run = db.get_run(run_id, user_id)
+    if run and isinstance(run['data'], dict):
+        return run['data'].get('pace_histogram')
+    return None
+
+@runs_bp.route('/run/<int:run_id>/pace-distribution', methods=['GET'])
+@login_required
+def get_pace_distribution(run_id):
+    """
+    Distance, time and HR of a run split at any pace limit.
+    
+    Answered from the run's pace histogram, without reanalysis. Parameters:
+    pace_limit (optional) for the fast/slow split; the cumulative
+    distance-by-pace curve is always included for charting.
+    """
+    try:
+        histogram = _run_pace_histogram(run_id, session['user_id'])
+        if not histogram:
+            return jsonify({'error': 'No pace distribution for this run'}), 404
+        
+        response_data = {'run_id': run_id, 'curve': pace_curve(histogram)}
+        pace_limit = request.args.get('pace_limit', type=float)
+        if pace_limit:
+            response_data['split'] = pace_split(histogram, pace_limit)
+        return current_app.response_class(
+            response=safe_json_dumps(response_data),
+            status=200,
+            mimetype='application/json'
+        )
+    except Exception as e:
+        print(f"\nServer error in /run/{run_id}/pace-distribution route:")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+@runs_bp.route('/runs/pace-distribution', methods=['GET'])
+@login_required
+def get_history_pace_distribution():
+    """
+    Distance under a pace limit across a user's run history.
+    
+    Parameters: pace_limit (required), start and end (optional YYYY-MM-DD
+    dates) and curve ('true' adds the combined distance-by-pace curve).
+    Returns the combined split and a per-run split.
+    """
+    try:
+        pace_limit = request.args.get('pace_limit', type=float)
+        if not pace_limit or pace_limit <= 0:
+            return jsonify({'error': 'A positive pace_limit is required'}), 400
+        
+        stored = histograms.for_user(session['user_id'], request.args.get('start'), request.args.get('end'))
+        runs = []
+        for run_id, date, histogram in stored:
+            split = pace_split(histogram, pace_limit)
+            runs.append({
+                'run_id': run_id,
+                'date': date,
+                'fast_distance': split['fast']['distance'],
+                'total_distance': split['total_distance'],
+                'percentage_fast': split['percentage_fast']
+            })
+        
+        combined = merge_histograms([histogram for _, _, histogram in stored])
+        response_data = {
+            'pace_limit': pace_limit,
+            'run_count': len(runs),
+            'total': pace_split(combined, pace_limit),
+            'runs': runs
+        }
+        if request.args.get('curve', 'false').lower() in ('true', '1', 'yes'):
+            response_data['curve'] = pace_curve(combined)
+        return current_app.response_class(
+            response=safe_json_dumps(response_data),
+            status=200,
+            mimetype='application/json'
+        )
+    except Exception as e:
+        print(f"\nServer error in /runs/pace-distribution route:")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+@runs_bp.route('/run/<int:run_id>/best-efforts', methods=['GET'])
+@login_required
+def get_run_best_efforts(run_id):
+    """Fastest 400m, 1k, mile, 5k and 10k within a run"""
+    try:
+        stored = efforts.for_run(run_id, session['user_id'])
+        if not stored:
+            run = db.get_run(run_id, session['user_id'])
+            if not run:
+                return jsonify({'error': 'Run not found or access denied'}), 404
+            stored = run['data'].get('best_efforts', []) if isinstance(run['data'], dict) else []
+        return current_app.response_class(
+            response=safe_json_dumps({'run_id': run_id, 'best_efforts': stored}),
+            status=200,
+            mimetype='application/json'
+        )
+    except Exception as e:
+        print(f"\nServer error in /run/{run_id}/best-efforts route:")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+@runs_bp.route('/runs/best-efforts', methods=['GET'])
+@login_required
+def get_personal_records():
+    """
+    Personal records: the fastest effort per distance across a user's runs.
+    
+    Parameters: start and end (optional YYYY-MM-DD dates). Race predictions
+    from the records are included.
+    """
+    try:
+        records = efforts.personal_records(session['user_id'], request.args.get('start'), request.args.get('end'))
+        return current_app.response_class(
+            response=safe_json_dumps({
+                'records': records,
+                'race_predictions': riegel_predictions(records)
+            }),
+            status=200,
+            mimetype='application/json'
+        )
+    except Exception as e:
+        print(f"\nServer error in /runs/best-efforts route:")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
@@ -22,6 +22,9 @@ from json import JSONEncoder
 from routes.auth import auth_bp
 from routes.runs import runs_bp
 from routes.profile import profile_bp
+from routes.jobs import jobs_bp
+from routes.request_encoding import DecodeRequestBody
+from werkzeug.exceptions import HTTPException
 
 # Import admin blueprint with error handling
 try:
@@ -91,7 +94,14 @@ except Exception as e:
 
 # Import app modules - with better error handling
 try:
-    from app.running import analyze_run_file, calculate_pace_zones, analyze_elevation_impact
+    from app.running import analyze_run_file, read_run_track, calculate_pace_zones, analyze_elevation_impact
+    from app.running import RUN_FILE_EXTENSIONS, route_track
+    from app.segments import materialize_route
+    from app.downsample import downsample_settings
+    from app.result_cache import AnalysisCache, content_digest, cache_key
+    from app.track_store import RunTrackStore
+    from app.pace_distribution import PaceHistogramStore
+    from app.best_efforts import BestEffortStore
     print("Successfully imported running module")
 except Exception as e:
     print("Error importing running module:", handle_exception(e))
@@ -100,11 +110,29 @@ except Exception as e:
     def analyze_run_file(file_path):
         return {"error": "Running analysis module not available"}
     
+    def read_run_track(file_path, digest=None):
+        return file_path
+    
     def calculate_pace_zones(base_pace):
         return {"error": "Pace zones calculation not available"}
     
     def analyze_elevation_impact(data):
         return {"error": "Elevation impact analysis not available"}
+    
+    def materialize_route(results, track=None):
+        return results
+    
+    def route_track(track, results, options=None):
+        return None
+    
+    def downsample_settings(strategy=None, target_points=None):
+        return None
+    
+    RUN_FILE_EXTENSIONS = ('.gpx',)
+    AnalysisCache = None
+    RunTrackStore = None
+    PaceHistogramStore = None
+    BestEffortStore = None
 
 try:
     from app.database_adapter import RunDatabaseAdapter, safe_json_dumps
@@ -148,6 +176,9 @@ if os.path.exists(asset_manifest_path):
 app = Flask(__name__, static_folder=static_folder, static_url_path='')
 print(f"Starting Flask server in {env} mode with static url path: ''")
 
+# Accept request bodies sent with Content-Encoding gzip/deflate
+app.wsgi_app = DecodeRequestBody(app.wsgi_app)
+
 # Use the custom encoder for all JSON responses
 app.json_encoder = DateTimeEncoder
 
@@ -168,7 +199,7 @@ try:
         CORS(app,
             origins=[CONFIG.FRONTEND_URL],
             methods=["GET", "POST", "DELETE", "OPTIONS"],
-            allow_headers=["Content-Type", "Accept", "Cookie"],
+            allow_headers=["Content-Type", "Content-Encoding", "Accept", "Cookie"],
             supports_credentials=True,
             expose_headers=["Content-Type", "Authorization", "Set-Cookie"],
             allow_credentials=True)
@@ -178,7 +209,7 @@ try:
         CORS(app,
             origins=["*"],
             methods=["GET", "POST", "DELETE", "OPTIONS"],
-            allow_headers=["Content-Type", "Accept", "Cookie"],
+            allow_headers=["Content-Type", "Content-Encoding", "Accept", "Cookie"],
             supports_credentials=True,
             expose_headers=["Content-Type", "Authorization", "Set-Cookie"],
             allow_credentials=True)
@@ -197,6 +228,21 @@ except Exception as e:
     # Create a minimal db instance to avoid errors later
     db = FallbackDatabaseAdapter()
 
+# Analysis result cache, raw run tracks, pace histograms and best efforts
+# (kept in the SQLite database; off for PostgreSQL)
+analysis_cache = None
+run_tracks = None
+pace_histograms = None
+best_efforts = None
+try:
+    if AnalysisCache and getattr(db, 'db_name', None):
+        analysis_cache = AnalysisCache(db.db_name)
+        run_tracks = RunTrackStore(db.db_name)
+        pace_histograms = PaceHistogramStore(db.db_name)
+        best_efforts = BestEffortStore(db.db_name)
+except Exception as e:
+    print("Error initializing analysis cache:", handle_exception(e))
+
 # Session debugging
 @app.before_request
 def before_request():
@@ -285,8 +331,7 @@ def analyze():
         print(f"\nFile details:")
         print(f"Filename: {file.filename}")
         print(f"Content type: {file.content_type}")
-        print(f"File size: {len(file.read())} bytes")
-        file.seek(0)  # Reset file pointer after reading
+        print(f"Request size: {request.content_length} bytes")
         
         # Debug profile data
         print("\nSession data:", dict(session))
@@ -295,12 +340,13 @@ def analyze():
         pace_limit = float(request.form.get('paceLimit', 0))
         age = int(request.form.get('age', 0))
         resting_hr = int(request.form.get('restingHR', 0))
+        tz_name = request.form.get('timezone') or None
         
         # Get user profile for additional metrics
         profile = db.get_profile(session['user_id'])
         print("\nProfile data:", profile)
         
-        if not file or not file.filename.endswith('.gpx'):
+        if not file or not file.filename.lower().endswith(RUN_FILE_EXTENSIONS):
             print("Invalid file format")
             return jsonify({'error': 'Invalid file format'}), 400
             
@@ -308,24 +354,55 @@ def analyze():
         date_match = re.search(r'\d{4}-\d{2}-\d{2}', file.filename)
         run_date = date_match.group(0) if date_match else datetime.now().strftime('%Y-%m-%d')
         
-        # Save uploaded file temporarily
-        temp_path = 'temp.gpx'
-        file.save(temp_path)
-        
-        print("\nFile saved to:", temp_path)
-        print("File exists:", os.path.exists(temp_path))
-        print("File size:", os.path.getsize(temp_path))
+        options = {
+            'user_age': age,
+            'resting_hr': resting_hr,
+            'weight': profile['weight'],
+            'gender': profile['gender'],
+            'tz_name': tz_name
+        }
+        # Downsampling strategy for high-frequency files ('smart' or 'lttb')
+        try:
+            downsample = downsample_settings(request.form.get('downsample') or None,
+                                             request.form.get('downsamplePoints', type=int))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if downsample:
+            options['downsample'] = downsample
+        # Re-uploads of a saved run return that run instead of a copy
+        link_existing = request.form.get('linkExisting', 'true').lower() not in ('false', '0', 'no')
         
+        # Analyze straight from the upload stream - nothing is written to disk,
+        # so concurrent uploads can't overwrite each other's files
         try:
-            # Analyze the file
-            analysis_result = analyze_run_file(
-                temp_path, 
-                pace_limit,
-                user_age=age,
-                resting_hr=resting_hr,
-                weight=profile['weight'],
-                gender=profile['gender']
-            )
+            # The upload is hashed as the parser reads it; the parsed track is
+            # kept for reanalysis whether or not the result is cached
+            cached, raw_track = None, None
+            digest = content_digest() if analysis_cache else None
+            track = read_run_track(file.stream, digest=digest)
+            if run_tracks:
+                raw_track = track.to_bytes()
+            if analysis_cache:
+                content_hash = digest.hexdigest()
+                key = cache_key(content_hash, pace_limit, options, session['user_id'])
+                cached = analysis_cache.get(key)
+            
+            if cached:
+                print(f"\nAnalysis cache hit for {content_hash[:12]}")
+                analysis_result = json.loads(cached['data'])
+                if (link_existing and cached['run_id'] and cached['user_id'] == session['user_id']
+                        and db.get_run_by_id(cached['run_id'], session['user_id'])):
+                    print(f"Linking existing run {cached['run_id']}")
+                    return jsonify({
+                        'message': 'Analysis complete',
+                        'data': materialize_route(analysis_result, route_track(track, analysis_result, options)),
+                        'run_id': cached['run_id'],
+                        'saved': True,
+                        'cached': True,
+                        'linked': True
+                    })
+            else:
+                analysis_result = analyze_run_file(track, pace_limit, **options)
             
             if not analysis_result:
                 print("Analysis returned no results")
@@ -341,12 +418,23 @@ def analyze():
             print("\nAttempting to save run data...")
             run_id = db.save_run(session['user_id'], run_data)
             print(f"Run saved successfully with ID: {run_id}")
+            
+            if cached:
+                analysis_cache.link_run(key, session['user_id'], run_id)
+            elif analysis_cache:
+                analysis_cache.put(key, content_hash, safe_json_dumps(analysis_result), session['user_id'], run_id)
+            if run_id and raw_track:
+                run_tracks.save(run_id, session['user_id'], raw_track, options)
+            if run_id and pace_histograms:
+                pace_histograms.save(run_id, session['user_id'], run_date, analysis_result.get('pace_histogram'))
+                best_efforts.save(run_id, session['user_id'], run_date, analysis_result.get('best_efforts'))
 
             return jsonify({
                 'message': 'Analysis complete',
-                'data': analysis_result,
+                'data': materialize_route(analysis_result, route_track(track, analysis_result, options)),
                 'run_id': run_id,
-                'saved': True
+                'saved': True,
+                'cached': bool(cached)
             })
             
         except Exception as e:
@@ -356,13 +444,10 @@ def analyze():
             print("Full traceback:")
             traceback.print_exc()
             return jsonify({'error': str(e)}), 500
-            
-        finally:
-            # Clean up temp file
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-                print(f"Cleaned up temporary file: {temp_path}")
                 
+    except HTTPException:
+        # e.g. a request body that fails to inflate (400) or inflates too large (413)
+        raise
     except Exception as e:
         print(f"\nServer error:")
         print(f"Error type: {type(e).__name__}")
@@ -383,31 +468,18 @@ def compare_runs():
             run = db.get_run_by_id(run_id)
             if run:
                 try:
-                    run_data = json.loads(run['data'])
-                    
-                    # Calculate total time for average pace
-                    total_time = 0
-                    for segment in run_data['fast_segments'] + run_data['slow_segments']:
-                        if isinstance(segment, dict) and 'time_diff' in segment:
-                            total_time += segment['time_diff']
-                    
-                    # Calculate average pace
-                    avg_pace = total_time / run_data['total_distance'] if run_data['total_distance'] > 0 else 0
-                    
-                    # Calculate elevation gain
-                    elevation_gain = 0
-                    if 'elevation_data' in run_data:
-                        elevation_changes = [point['elevation'] for point in run_data['elevation_data']]
-                        elevation_gain = sum(max(0, elevation_changes[i] - elevation_changes[i-1]) 
-                                          for i in range(1, len(elevation_changes)))
+                    # Summaries come from the row columns; the analysis JSON
+                    # is only decoded for the mile splits
+                    run_data = json.loads(run['data']) if isinstance(run['data'], str) else (run['data'] or {})
                     
                     formatted_run = {
                         'id': run['id'],
                         'date': run['date'],
-                        'distance': run_data['total_distance'],
-                        'avg_pace': avg_pace,
-                        'avg_hr': run_data.get('avg_hr_all', 0),
-                        'elevation_gain': elevation_gain,
+                        'distance': run.get('total_distance') or 0,
+                        'avg_pace': run.get('avg_pace') or 0,
+                        'avg_hr': run.get('avg_hr') or 0,
+                        'elevation_gain': run.get('elevation_gain') or 0,
+                        'elevation_loss': run.get('elevation_loss') or 0,
                         'data': run['data'],
                         'mile_splits': run_data.get('mile_splits', [])
                     }
@@ -436,6 +508,10 @@ def delete_run(run_id):
             return jsonify({'error': 'Run not found'}), 404
             
         db.delete_run(run_id)
+        if run_tracks:
+            run_tracks.delete(run_id)
+            pace_histograms.delete(run_id)
+            best_efforts.delete(run_id)
         print(f"Successfully deleted run {run_id}")
         return jsonify({'message': f'Run {run_id} deleted successfully'})
     except Exception as e:
@@ -488,6 +564,7 @@ def save_profile():
 app.register_blueprint(auth_bp)
 app.register_blueprint(runs_bp)
 app.register_blueprint(profile_bp)
+app.register_blueprint(jobs_bp)
 app.register_blueprint(admin_bp)
 
 # Add a health check endpoint
@@ -136,5 +136,6 @@ port="${PORT:-10000}"
 echo "IMPORTANT: Binding to port $port on host 0.0.0.0 as required by Render"
 
 # Start Gunicorn
-echo "Starting Gunicorn with workers=2, bind=0.0.0.0:$port"
-exec gunicorn --workers=2 --bind=0.0.0.0:$port --log-level=info wsgi:application 
\ No newline at end of file
+# Threaded workers, so job progress streams and polls don't each hold a whole worker
+echo "Starting Gunicorn with workers=2, threads=8, bind=0.0.0.0:$port"
+exec gunicorn --config=gunicorn.conf.py --workers=2 --worker-class=gthread --threads=8 --bind=0.0.0.0:$port --log-level=info wsgi:application 
\ No newline at end of file
@@ -0,0 +1,89 @@
+"""
+Shared fixtures.
+
+Modules with a NumPy path import `has_numpy` from app.track, so the
+pure-Python path is selected by switching it off in each of them. Tracks
+must be read after the switch, so their columns are array('d') as well.
+"""
+import os
+import sys
+import math
+from array import array
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app.running  # noqa: F401  (imports every analysis module)
+import app.fit_reader  # noqa: F401
+import app.tcx_reader  # noqa: F401
+from app.track import TrackArray, np, has_numpy
+
+requires_numpy = pytest.mark.skipif(not has_numpy, reason="NumPy is not installed")
+
+def _numpy_modules():
+    return [module for name, module in sys.modules.items()
+            if name.startswith('app.') and getattr(module, 'has_numpy', None) is True]
+
+@pytest.fixture
+def pure_python(monkeypatch):
+    """Run the test on the stdlib path of every analysis module"""
+    for module in _numpy_modules():
+        monkeypatch.setattr(module, 'has_numpy', False)
+
+@pytest.fixture
+def both_paths(monkeypatch):
+    """
+    both_paths(function) calls `function` on the NumPy path and then on the
+    stdlib path and returns both results as plain Python values.
+    """
+    if not has_numpy:
+        pytest.skip("NumPy is not installed")
+
+    def run(function):
+        with_numpy = plain(function())
+        with monkeypatch.context() as patch:
+            for module in _numpy_modules():
+                patch.setattr(module, 'has_numpy', False)
+            without_numpy = plain(function())
+        return with_numpy, without_numpy
+    return run
+
+def plain(value):
+    """`value` with arrays, tracks and NumPy scalars turned into lists, dicts and Python numbers"""
+    if isinstance(value, TrackArray):
+        return {'columns': plain(value.columns), 'metadata': plain(value.metadata)}
+    if isinstance(value, dict):
+        return {key: plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, array)):
+        return [plain(item) for item in value]
+    if np is not None:
+        if isinstance(value, np.ndarray):
+            return [plain(item) for item in value.tolist()]
+        if isinstance(value, np.generic):
+            return value.item()
+    return value
+
+def assert_same(a, b, rel=1e-9, path='result'):
+    """Recursive equality with a relative tolerance for floats (NaN equals NaN)"""
+    if isinstance(a, dict):
+        assert isinstance(b, dict) and a.keys() == b.keys(), f"{path}: keys differ"
+        for key in a:
+            assert_same(a[key], b[key], rel, f"{path}[{key!r}]")
+    elif isinstance(a, list):
+        assert isinstance(b, list) and len(a) == len(b), f"{path}: lengths differ"
+        for i, (x, y) in enumerate(zip(a, b)):
+            assert_same(x, y, rel, f"{path}[{i}]")
+    elif isinstance(a, float) or isinstance(b, float):
+        if isinstance(a, bool) or isinstance(b, bool):
+            assert a == b, f"{path}: {a!r} != {b!r}"
+        elif math.isnan(a) or math.isnan(b):
+            assert math.isnan(a) and math.isnan(b), f"{path}: {a!r} != {b!r}"
+        else:
+            assert math.isclose(a, b, rel_tol=rel, abs_tol=1e-12), f"{path}: {a!r} != {b!r}"
+    else:
+        assert a == b, f"{path}: {a!r} != {b!r}"
+
+@pytest.fixture
+def db_name(tmp_path):
+    """Path of an empty SQLite database for the stores and the job queue"""
+    return str(tmp_path / 'runs.db')
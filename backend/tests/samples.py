@@ -0,0 +1,122 @@
+"""
+Synthetic run files for the tests.
+
+Points are (lat, lon, epoch seconds, elevation, hr) tuples; hr None is a
+point without a heart rate sample. The writers produce the bytes of a GPX,
+TCX or FIT file holding them, so tests don't depend on recorded files.
+"""
+import math
+import random
+import struct
+from datetime import datetime, timezone
+
+START = 1711713600  # 2024-03-29 12:00:00 UTC
+FIT_EPOCH_OFFSET = 631065600
+SEMICIRCLES = 2 ** 31 / 180
+
+def run_points(seed=1, warmup=300, reps=4, work=180, rest=90, stop=60, cooldown=300):
+    """
+    A 1 Hz interval workout: warmup, `reps` fast/easy repeats, a stop of
+    `stop` seconds standing still, and a cooldown. Speed, position and HR
+    carry random noise.
+    """
+    rng = random.Random(seed)
+    points = []
+    state = {'t': START, 'lat': 42.88, 'lon': -85.73, 'ele': 200.0, 'hr': 110.0}
+
+    def move(seconds, mph, target_hr):
+        for _ in range(seconds):
+            state['t'] += 1
+            miles = max(mph + rng.gauss(0, 0.6), 0) / 3600 if mph else 0
+            state['lat'] += miles / 69.0
+            state['ele'] += rng.gauss(0, 0.2) + 0.05 * math.sin(state['t'] / 120)
+            state['hr'] += (target_hr - state['hr']) * 0.05
+            jitter = 0.000002 if mph else 0
+            points.append((state['lat'] + rng.gauss(0, jitter), state['lon'] + rng.gauss(0, jitter),
+                           state['t'], state['ele'], round(state['hr'] + rng.gauss(0, 1.5))))
+
+    move(warmup, 6.0, 135)
+    for _ in range(reps):
+        move(work, 8.5, 172)
+        move(rest, 4.0, 128)
+    move(stop, 0, 110)
+    move(cooldown, 6.0, 138)
+    return points
+
+def iso(epoch, fraction_digits=0):
+    text = datetime.fromtimestamp(int(epoch), timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+    if fraction_digits:
+        text += '.' + f'{epoch % 1:.{fraction_digits}f}'[2:]
+    return text + 'Z'
+
+def gpx_bytes(points, device_speed=None, creator='Synthetic'):
+    """GPX 1.1 document; `device_speed` (m/s) adds a gpxtpx:speed extension to every point"""
+    parts = [f'<?xml version="1.0" encoding="UTF-8"?>\n<gpx creator="{creator}" version="1.1" '
+             'xmlns="http://www.topografix.com/GPX/1/1" '
+             'xmlns:gpxtpx="http://www.garmin.com/xmlschemas/TrackPointExtension/v1"><trk><trkseg>']
+    for lat, lon, epoch, elevation, hr in points:
+        extensions = ''
+        if hr is not None:
+            extensions += f'<gpxtpx:hr>{hr}</gpxtpx:hr>'
+        if device_speed is not None:
+            extensions += f'<gpxtpx:speed>{device_speed}</gpxtpx:speed>'
+        if extensions:
+            extensions = f'<extensions><gpxtpx:TrackPointExtension>{extensions}</gpxtpx:TrackPointExtension></extensions>'
+        parts.append(f'<trkpt lat="{lat:.7f}" lon="{lon:.7f}"><ele>{elevation:.1f}</ele>'
+                     f'<time>{iso(epoch)}</time>{extensions}</trkpt>')
+    parts.append('</trkseg></trk></gpx>\n')
+    return '\n'.join(parts).encode('utf-8')
+
+def tcx_bytes(points, lap_starts=(0,)):
+    """TCX document with a lap starting at each index in `lap_starts`"""
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n<TrainingCenterDatabase '
+             'xmlns="http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2">'
+             f'<Activities><Activity Sport="Running"><Id>{iso(points[0][2])}</Id>']
+    bounds = list(lap_starts) + [len(points)]
+    for start, end in zip(bounds, bounds[1:]):
+        parts.append(f'<Lap StartTime="{iso(points[start][2])}"><Track>')
+        for lat, lon, epoch, elevation, hr in points[start:end]:
+            heart_rate = f'<HeartRateBpm><Value>{hr}</Value></HeartRateBpm>' if hr is not None else ''
+            parts.append(f'<Trackpoint><Time>{iso(epoch)}</Time><Position><LatitudeDegrees>{lat:.7f}</LatitudeDegrees>'
+                         f'<LongitudeDegrees>{lon:.7f}</LongitudeDegrees></Position>'
+                         f'<AltitudeMeters>{elevation:.1f}</AltitudeMeters>{heart_rate}</Trackpoint>')
+        parts.append('</Track></Lap>')
+    parts.append('<Creator><Name>Forerunner 255</Name></Creator></Activity></Activities></TrainingCenterDatabase>\n')
+    return '\n'.join(parts).encode('utf-8')
+
+def fit_bytes(points, lap_starts=(), manufacturer=1, compressed_timestamps=True):
+    """
+    FIT activity: a file_id message, a lap message per index in
+    `lap_starts` and a record per point. Records use a big-endian layout
+    with a developer field, and every third one (when
+    `compressed_timestamps`) a little-endian layout with a compressed
+    timestamp header instead.
+    """
+    records = bytearray()
+    # file_id: local type 0, little endian, type / manufacturer / time_created
+    records += bytes([0x40, 0, 0]) + struct.pack('<H', 0) + bytes([3, 0, 1, 0x00, 1, 2, 0x84, 4, 4, 0x86])
+    records += bytes([0x00]) + struct.pack('<BHI', 4, manufacturer, int(points[0][2]) - FIT_EPOCH_OFFSET)
+    # lap: local type 3, start_time
+    records += bytes([0x43, 0, 0]) + struct.pack('<H', 19) + bytes([1, 2, 4, 0x86])
+    for index in lap_starts:
+        records += bytes([0x03]) + struct.pack('<I', int(points[index][2]) - FIT_EPOCH_OFFSET)
+    # record: local type 1, big endian, with one 2-byte developer field
+    records += (bytes([0x61, 0, 1]) + struct.pack('>H', 20) +
+                bytes([6, 253, 4, 0x86, 0, 4, 0x85, 1, 4, 0x85, 78, 4, 0x86, 3, 1, 0x02, 4, 1, 0x02]) +
+                bytes([1, 0, 2, 0]))
+    # record: local type 2, little endian, for compressed timestamp headers
+    records += bytes([0x42, 0, 0]) + struct.pack('<H', 20) + bytes([4, 0, 4, 0x85, 1, 4, 0x85, 2, 2, 0x84, 3, 1, 0x02])
+    last = None
+    for i, (lat, lon, epoch, elevation, hr) in enumerate(points):
+        timestamp = int(epoch) - FIT_EPOCH_OFFSET
+        lat_sc = int(round(lat * SEMICIRCLES))
+        lon_sc = int(round(lon * SEMICIRCLES))
+        altitude = int(round((elevation + 500) * 5))
+        hr = 0xFF if hr is None else int(hr)
+        if compressed_timestamps and last is not None and 0 < timestamp - last < 32 and i % 3 == 0:
+            records += bytes([0x80 | (2 << 5) | (timestamp & 0x1F)]) + struct.pack('<iiHB', lat_sc, lon_sc, altitude, hr)
+        else:
+            records += bytes([0x01]) + struct.pack('>IiiIBB', timestamp, lat_sc, lon_sc, altitude, hr, 0xFF) + b'\x01\x02'
+        last = timestamp
+    header = struct.pack('<BBHI4sH', 14, 0x20, 2132, len(records), b'.FIT', 0)
+    return header + bytes(records) + b'\x00\x00'
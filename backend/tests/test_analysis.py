@@ -0,0 +1,50 @@
+import io
+import pytest
+from app.running import analyze_run_file, read_run_track, route_track
+from conftest import assert_same
+from samples import run_points, gpx_bytes, tcx_bytes, fit_bytes
+
+POINTS = run_points(reps=4)
+SETTINGS = {'user_age': 35, 'resting_hr': 55, 'weight': 150, 'gender': 1, 'tz_name': 'UTC'}
+DATA = gpx_bytes(POINTS)
+
+FILES = {
+    'gpx': DATA,
+    'tcx': tcx_bytes(POINTS, lap_starts=[0, 300, 480, 570]),
+    'fit': fit_bytes(POINTS, lap_starts=[0, 300, 480, 570])
+}
+
+def test_path_bytes_and_stream_read_the_same(tmp_path):
+    path = tmp_path / 'run.gpx'
+    path.write_bytes(DATA)
+    from_stream = analyze_run_file(io.BytesIO(DATA), 8.0, **SETTINGS)
+    assert_same(analyze_run_file(DATA, 8.0, **SETTINGS), from_stream)
+    assert_same(analyze_run_file(str(path), 8.0, **SETTINGS), from_stream)
+    assert from_stream['total_distance'] > 3
+
+@pytest.mark.parametrize('name', FILES)
+@pytest.mark.parametrize('downsample', [None, {'strategy': 'lttb', 'target_points': 300}], ids=['smart', 'lttb'])
+def test_analysis_parity(both_paths, name, downsample):
+    data = FILES[name]
+    with_numpy, without_numpy = both_paths(
+        lambda: analyze_run_file(io.BytesIO(data), 8.0, downsample=downsample, **SETTINGS))
+    assert_same(with_numpy, without_numpy)
+    assert with_numpy['is_high_frequency']
+    # The one stop in the workout, also once downsampling has thinned the track
+    assert with_numpy['pause_count'] == 1
+    assert with_numpy['laps_source'] == ('detected' if name == 'gpx' else 'file')
+
+@pytest.mark.parametrize('write', [tcx_bytes, fit_bytes])
+def test_formats_read_like_gpx(write):
+    result = analyze_run_file(write(POINTS), 8.0, **SETTINGS)
+    from_gpx = analyze_run_file(DATA, 8.0, **SETTINGS)
+    assert result['total_distance'] == pytest.approx(from_gpx['total_distance'], rel=1e-3)
+    assert result['avg_hr_all'] == pytest.approx(from_gpx['avg_hr_all'], abs=1)
+
+def test_downsampling_strategy_is_chosen_per_request():
+    options = {'downsample': {'strategy': 'lttb', 'target_points': 300}}
+    smart = analyze_run_file(DATA, 8.0, **SETTINGS)
+    lttb = analyze_run_file(DATA, 8.0, **options, **SETTINGS)
+    assert (len(route_track(read_run_track(DATA), lttb, options)['lat']) == 300
+            < len(route_track(read_run_track(DATA), smart)['lat']))
+    assert lttb['total_distance'] == pytest.approx(smart['total_distance'], rel=0.01)
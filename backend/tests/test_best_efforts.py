@@ -0,0 +1,92 @@
+import io
+import random
+import pytest
+from app.gpx_reader import read_gpx_track
+from app.geo import add_motion_columns
+from app.segments import segment_prefix_sums, moving_mask
+from app.best_efforts import fastest_window, find_best_efforts, riegel_predictions, BestEffortStore
+from app import best_efforts
+from app.track import np
+from conftest import assert_same
+from samples import run_points, gpx_bytes
+
+def random_run(n=400, seed=4):
+    rng = random.Random(seed)
+    distance, time = [0.0], [0.0]
+    for _ in range(n - 1):
+        # Some steps don't move (stops), some don't advance the clock
+        distance.append(distance[-1] + rng.choice([0.0, 0.002, 0.003, 0.004]))
+        time.append(time[-1] + rng.choice([1.0, 1.0, 2.0]))
+    return distance, time
+
+def brute_force(distance, time, miles):
+    """Fastest window by trying every pair of points and interpolating the start"""
+    best = None
+    for j in range(len(distance)):
+        target = distance[j] - miles
+        if target < 0:
+            continue
+        for i in range(j):
+            if distance[i] <= target < distance[i + 1]:
+                fraction = (target - distance[i]) / (distance[i + 1] - distance[i])
+                elapsed = time[j] - (time[i] + fraction * (time[i + 1] - time[i]))
+                if elapsed >= 3.0 * 60 * miles and (best is None or elapsed < best):
+                    best = elapsed
+    return best
+
+def columns(distance, time):
+    """The columns as the path being tested stores them"""
+    if best_efforts.has_numpy:
+        return np.asarray(distance), np.asarray(time)
+    return distance, time
+
+@pytest.mark.parametrize('miles', [0.05, 0.25, 0.5])
+def test_fastest_window_matches_brute_force(both_paths, miles):
+    distance, time = random_run()
+    with_numpy, without_numpy = both_paths(lambda: fastest_window(*columns(distance, time), miles))
+    assert_same(with_numpy, without_numpy)
+    assert with_numpy[0] == pytest.approx(brute_force(distance, time, miles))
+
+@pytest.mark.parametrize('distance, time, miles', [
+    ([0.0, 0.1], [0.0, 60.0], 0.5),     # Shorter than the distance
+    ([0.0, 0.1], [0.0, 60.0], 0.0),     # No distance
+    ([0.0], [0.0], 0.05),               # A single point
+    ([0.0, 1.0], [0.0, 60.0], 0.5),     # Faster than MIN_EFFORT_PACE: a GPS error
+])
+def test_fastest_window_without_an_effort(both_paths, distance, time, miles):
+    assert both_paths(lambda: fastest_window(*columns(distance, time), miles)) == (None, None)
+
+def test_best_efforts_parity(both_paths):
+    # About 3.6 miles
+    data = gpx_bytes(run_points(reps=6))
+
+    def efforts():
+        track = add_motion_columns(read_gpx_track(io.BytesIO(data)))
+        sums = segment_prefix_sums(track, moving_mask(track))
+        return find_best_efforts(track, sums['distance'])
+    with_numpy, without_numpy = both_paths(efforts)
+    assert_same(with_numpy, without_numpy)
+    assert [effort['name'] for effort in with_numpy] == ['400m', '1k', 'mile', '5k']
+    # Shorter efforts are run at a faster pace in an interval session
+    assert with_numpy[0]['pace'] < with_numpy[-1]['pace']
+    assert riegel_predictions(with_numpy)
+
+def effort(name, meters, seconds):
+    miles = meters / best_efforts.METERS_PER_MILE
+    return {'name': name, 'distance_m': meters, 'time_seconds': seconds, 'pace': seconds / 60 / miles,
+            'start_distance': 0.0}
+
+def test_personal_records(db_name):
+    store = BestEffortStore(db_name)
+    store.save(1, 7, '2024-05-01', [effort('1k', 1000, 240), effort('mile', 1609.344, 400)])
+    store.save(2, 7, '2024-05-08', [effort('1k', 1000, 230), effort('mile', 1609.344, 410)])
+    store.save(3, 8, '2024-05-08', [effort('1k', 1000, 200)])
+    records = store.personal_records(7)
+    assert [(record['name'], record['time_seconds'], record['run_id']) for record in records] == [
+        ('1k', 230, 2), ('mile', 400, 1)]
+    assert [record['run_id'] for record in store.personal_records(7, end_date='2024-05-01')] == [1, 1]
+    # Saving again replaces a run's efforts
+    store.save(1, 7, '2024-05-01', [effort('1k', 1000, 250)])
+    assert [record['name'] for record in store.for_run(1, 7)] == ['1k']
+    store.delete(1)
+    assert store.for_run(1) == []
@@ -0,0 +1,43 @@
+import io
+import zipfile
+import pytest
+from werkzeug.datastructures import FileStorage
+from app.bulk import iter_run_uploads, read_capped, read_member, run_date_from_filename, FileTooLarge
+from samples import run_points, gpx_bytes, tcx_bytes, fit_bytes
+
+GPX = gpx_bytes(run_points(reps=1))
+TCX = tcx_bytes(run_points(reps=1))
+FIT = fit_bytes(run_points(reps=1))
+
+def zip_upload(members, name='history.zip'):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for member_name, data in members.items():
+            archive.writestr(member_name, data)
+    buffer.seek(0)
+    return FileStorage(stream=buffer, filename=name)
+
+def test_iter_run_uploads():
+    uploads = [
+        zip_upload({'runs/2024-03-29 Intervals.gpx': GPX, 'notes.txt': b'hi', '__MACOSX/._a.gpx': b'', 'runs/': b''}),
+        FileStorage(stream=io.BytesIO(GPX), filename='Morning.GPX'),
+        FileStorage(stream=io.BytesIO(TCX), filename='Lunch.tcx'),
+        FileStorage(stream=io.BytesIO(FIT), filename='Evening.fit'),
+        FileStorage(stream=io.BytesIO(b'PK'), filename='broken.zip'),
+        FileStorage(stream=io.BytesIO(b''), filename='photo.jpg')
+    ]
+    files = [(name, read() if read else None) for name, read in iter_run_uploads(uploads)]
+    assert files == [('2024-03-29 Intervals.gpx', GPX), ('notes.txt', None), ('Morning.GPX', GPX),
+                     ('Lunch.tcx', TCX), ('Evening.fit', FIT), ('broken.zip', None), ('photo.jpg', None)]
+
+def test_reads_are_capped():
+    assert read_capped(io.BytesIO(b'x' * 100), limit=100) == b'x' * 100
+    with pytest.raises(FileTooLarge):
+        read_capped(io.BytesIO(b'x' * 101), limit=100)
+    archive = zipfile.ZipFile(zip_upload({'big.gpx': b'x' * 101}).stream)
+    with pytest.raises(FileTooLarge):
+        read_member(archive, archive.getinfo('big.gpx'), limit=100)
+
+def test_run_date_from_filename():
+    assert run_date_from_filename('2024-03-29 Intervals.gpx') == '2024-03-29'
+    assert len(run_date_from_filename('Morning Run.gpx')) == 10
@@ -0,0 +1,122 @@
+import io
+import os
+import sys
+import gzip
+import zlib
+import subprocess
+import pytest
+from flask import Flask, request, jsonify
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+from app.compression import decompressed, is_gzip, peek
+from routes.request_encoding import InflatingStream, DecodeRequestBody
+
+CONTENT = b''.join(b'<trkpt lat="42.%07d" lon="-85.73"/>\n' % i for i in range(5000))
+
+def raw_deflate(data):
+    """DEFLATE without the zlib header and checksum"""
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+class Trickle(io.RawIOBase):
+    """Stream that hands out one byte per read"""
+
+    def __init__(self, data):
+        self.data = io.BytesIO(data)
+
+    def read(self, size=-1):
+        return self.data.read(1)
+
+def test_decompressed():
+    stream = decompressed(io.BytesIO(gzip.compress(CONTENT)))
+    assert stream.read() == CONTENT
+    plain = io.BytesIO(CONTENT)
+    assert decompressed(plain) is plain
+    assert is_gzip(gzip.compress(b'')) and not is_gzip(CONTENT)
+
+def test_analysis_modules_dont_need_the_web_stack():
+    # Job workers import the readers without Flask or werkzeug
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = "import sys, app.ingest, app.running; print('werkzeug' in sys.modules)"
+    output = subprocess.run([sys.executable, '-c', code], cwd=backend, capture_output=True, text=True, check=True)
+    assert output.stdout.strip().splitlines()[-1] == 'False'
+
+def test_peek_leaves_the_position():
+    stream = io.BytesIO(CONTENT)
+    stream.read(10)
+    assert peek(stream, 5) == CONTENT[10:15]
+    assert stream.tell() == 10
+
+@pytest.mark.parametrize('compress', [
+    gzip.compress,
+    zlib.compress,
+    raw_deflate,
+    # Concatenated gzip members read as one
+    lambda data: gzip.compress(data[:1000]) + gzip.compress(data[1000:]),
+])
+def test_inflating_stream(compress):
+    stream = io.BufferedReader(InflatingStream(io.BytesIO(compress(CONTENT))))
+    assert stream.read() == CONTENT
+
+@pytest.mark.parametrize('compress', [gzip.compress, zlib.compress, raw_deflate])
+def test_format_is_told_from_a_trickling_stream(compress):
+    assert InflatingStream(Trickle(compress(CONTENT[:2000]))).read() == CONTENT[:2000]
+
+def test_inflating_stream_reads_in_small_pieces():
+    stream = InflatingStream(io.BytesIO(gzip.compress(CONTENT)))
+    pieces = []
+    while True:
+        piece = stream.read(1000)
+        if not piece:
+            break
+        assert len(piece) <= 1000
+        pieces.append(piece)
+    assert b''.join(pieces) == CONTENT
+
+@pytest.mark.parametrize('data, error', [
+    (gzip.compress(CONTENT)[:-100], BadRequest),
+    (b'not compressed at all', BadRequest),
+])
+def test_broken_bodies(data, error):
+    with pytest.raises(error):
+        InflatingStream(io.BytesIO(data)).read()
+
+def test_inflated_size_is_capped():
+    with pytest.raises(RequestEntityTooLarge):
+        InflatingStream(io.BytesIO(gzip.compress(CONTENT)), max_size=len(CONTENT) - 1).read()
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.wsgi_app = DecodeRequestBody(app.wsgi_app)
+
+    @app.route('/upload', methods=['POST'])
+    def upload():
+        file = request.files['file']
+        return jsonify({'filename': file.filename, 'size': len(file.read()), 'pace': request.form['paceLimit']})
+    return app.test_client()
+
+def multipart_body():
+    boundary = 'runboundary'
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="paceLimit"\r\n\r\n8.5\r\n'
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="run.gpx"\r\n'
+            f'Content-Type: application/gpx+xml\r\n\r\n').encode() + CONTENT + f'\r\n--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+@pytest.mark.parametrize('encoding, compress', [
+    ('gzip', gzip.compress),
+    ('deflate', zlib.compress),
+    ('deflate', raw_deflate),
+    (None, lambda data: data),
+])
+def test_compressed_form_upload(client, encoding, compress):
+    body, content_type = multipart_body()
+    headers = {'Content-Encoding': encoding} if encoding else {}
+    response = client.post('/upload', data=compress(body), content_type=content_type, headers=headers)
+    assert response.status_code == 200
+    assert response.get_json() == {'filename': 'run.gpx', 'size': len(CONTENT), 'pace': '8.5'}
+
+def test_broken_compressed_upload(client):
+    body, content_type = multipart_body()
+    response = client.post('/upload', data=gzip.compress(body)[:-100], content_type=content_type,
+                           headers={'Content-Encoding': 'gzip'})
+    assert response.status_code == 400
@@ -0,0 +1,60 @@
+import io
+import math
+import pytest
+from array import array
+from app.gpx_reader import read_gpx_track
+from app.track import TrackArray
+from app.downsample import (find_pace_transitions, smart_keep_indices, lttb_keep_indices, select_points,
+                            downsample_settings)
+from samples import run_points, gpx_bytes
+
+DATA = gpx_bytes(run_points(reps=2))
+
+def test_pace_transitions():
+    # No pace, fast, fast, no pace, slow, fast, slow: a point without a pace
+    # isn't compared with its neighbours
+    transitions = find_pace_transitions([math.inf, 7.0, 7.5, math.inf, 9.0, 7.0, 9.0], 8.0)
+    assert list(transitions) == [0, 0, 0, 0, 0, 1, 1]
+    assert list(find_pace_transitions([7.0, 9.0], None)) == [0, 0]
+
+def test_smart_parity(both_paths):
+    with_numpy, without_numpy = both_paths(
+        lambda: smart_keep_indices(read_gpx_track(io.BytesIO(DATA)), min_time_gap=3, pace_limit=8.0))
+    assert with_numpy == without_numpy
+    assert with_numpy == sorted(set(with_numpy))
+    assert len(with_numpy) < len(run_points(reps=2)) / 2
+
+@pytest.mark.parametrize('target_points', [3, 100, 500])
+def test_lttb_keeps_the_budget(both_paths, target_points):
+    with_numpy, without_numpy = both_paths(
+        lambda: lttb_keep_indices(read_gpx_track(io.BytesIO(DATA)), target_points=target_points))
+    assert with_numpy == without_numpy
+    n = len(run_points(reps=2))
+    assert len(with_numpy) == target_points
+    assert with_numpy[0] == 0 and with_numpy[-1] == n - 1
+    assert with_numpy == sorted(set(with_numpy))
+
+def test_lttb_keeps_the_corner():
+    # Distance over time bends once, at point 50; the bend is always kept
+    times = array('d', range(101))
+    distances = array('d', [t * 0.001 if t <= 50 else 0.05 + (t - 50) * 0.003 for t in range(101)])
+    track = TrackArray({'time': times, 'cum_distance': distances, 'lat': times, 'lon': times,
+                        'elevation': times, 'hr': times})
+    assert 50 in lttb_keep_indices(track, target_points=10)
+
+def test_short_tracks_and_unknown_strategies():
+    track = read_gpx_track(io.BytesIO(gpx_bytes(run_points()[:2])))
+    assert select_points(track, 'smart') == [0, 1]
+    assert select_points(track, 'lttb', target_points=100) == [0, 1]
+    with pytest.raises(ValueError):
+        select_points(track, 'every-other')
+
+def test_downsample_settings():
+    # Requests that don't choose keep the defaults
+    assert downsample_settings() is None
+    assert downsample_settings('', None) is None
+    assert downsample_settings('lttb', 500) == {'strategy': 'lttb', 'target_points': 500}
+    with pytest.raises(ValueError):
+        downsample_settings('every-other')
+    with pytest.raises(ValueError):
+        downsample_settings('lttb', 2)
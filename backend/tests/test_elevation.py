@@ -0,0 +1,73 @@
+import io
+import pytest
+from array import array
+from app.elevation import (smooth_elevation, deadband_steps, add_elevation_columns, segment_grades,
+                           FEET_PER_METER)
+from app.database import RunDatabase
+from app.gpx_reader import read_gpx_track
+from app.geo import add_motion_columns
+from app.track import TrackArray
+from conftest import assert_same
+from samples import run_points, gpx_bytes
+
+def as_list(values):
+    return [float(value) for value in values]
+
+def test_median_drops_a_spike(both_paths):
+    elevations = array('d', [10, 10, 10, 60, 10, 10, 10])
+    with_numpy, without_numpy = both_paths(lambda: as_list(smooth_elevation(elevations, 'median', 5)))
+    assert with_numpy == without_numpy == [10.0] * 7
+
+def test_moving_average_shrinks_at_the_ends(both_paths):
+    elevations = array('d', [0, 3, 6, 9, 12])
+    with_numpy, without_numpy = both_paths(lambda: as_list(smooth_elevation(elevations, 'moving_average', 3)))
+    assert with_numpy == without_numpy == [1.5, 3.0, 6.0, 9.0, 10.5]
+
+def test_no_filter_keeps_the_elevations():
+    elevations = array('d', [0, 5, 1])
+    assert smooth_elevation(elevations, 'none', 5) is elevations
+
+def test_deadband():
+    # Wobbles under the deadband add nothing
+    assert deadband_steps(array('d', [0, 2, 0, 2, 0]), 3.0) == ([0.0] * 5, [0.0] * 5)
+    # Once past it, the whole change from the last counted level is credited
+    gains, losses = deadband_steps(array('d', [0, 2, 4, 1, 5]), 3.0)
+    assert gains == [0, 0, 4, 0, 4]
+    assert losses == [0, 0, 0, 3, 0]
+
+def test_columns_are_in_feet(pure_python):
+    track = TrackArray({'elevation': array('d', [0, 10, 20, 20, 10])}).freeze()
+    add_elevation_columns(track, filter='none', deadband=3.0)
+    assert as_list(track['elevation_smooth']) == pytest.approx([0, 10 * FEET_PER_METER, 20 * FEET_PER_METER,
+                                                                20 * FEET_PER_METER, 10 * FEET_PER_METER])
+    assert sum(track['elevation_gain_step']) == pytest.approx(20 * FEET_PER_METER)
+    assert sum(track['elevation_loss_step']) == pytest.approx(10 * FEET_PER_METER)
+
+def test_segment_grades(pure_python):
+    # 52.8 ft over a tenth of a mile is a 10% grade
+    track = TrackArray({'elevation_smooth': array('d', [0, 26.4, 52.8, 52.8]),
+                        'cum_distance': array('d', [0, 0.05, 0.1, 0.1])}).freeze()
+    rises, grades = segment_grades(track, [0, 2], [3, 4])
+    assert rises == pytest.approx([52.8, 0])
+    assert grades == pytest.approx([10, 0])
+    assert segment_grades(track, [], []) == ([], [])
+
+def test_elevation_parity(both_paths):
+    data = gpx_bytes(run_points())
+
+    def columns():
+        track = add_elevation_columns(add_motion_columns(read_gpx_track(io.BytesIO(data))))
+        steps = [0, 50, 120]
+        return {'smooth': as_list(track['elevation_smooth']), 'gain': as_list(track['elevation_gain_step']),
+                'loss': as_list(track['elevation_loss_step']),
+                'grades': segment_grades(track, steps, [50, 120, len(track)])}
+    assert_same(*both_paths(columns))
+
+def test_runs_store_elevation_summaries(db_name):
+    database = RunDatabase(db_name)
+    database.ensure_tables()
+    run_id = database.add_run(1, '2024-05-01', '{}', 3.1, 8.0, 150, 8.0, elevation_gain=120.5, elevation_loss=118.0)
+    run = database.get_all_runs(1)[0]
+    assert (run['elevation_gain'], run['elevation_loss']) == (120.5, 118.0)
+    assert database.update_run(run_id, 1, '{}', 3.1, 8.0, 150, 8.0, elevation_gain=90.0, elevation_loss=95.0)
+    assert database.get_run_by_id(run_id, 1)['elevation_gain'] == 90.0
@@ -0,0 +1,67 @@
+import io
+import pytest
+from app.fit_reader import read_fit_track, is_fit, FitError
+from app.gpx_reader import read_gpx_track
+from conftest import assert_same
+from samples import run_points, gpx_bytes, fit_bytes
+
+POINTS = run_points(reps=2)
+
+def test_is_fit():
+    data = fit_bytes(POINTS[:10])
+    assert is_fit(data[:12])
+    assert not is_fit(data[:11])
+    assert not is_fit(gpx_bytes(POINTS[:10])[:12])
+    assert not is_fit(b'\x0c' + data[1:8] + b'.FTT')
+
+@pytest.mark.parametrize('compressed_timestamps', [False, True])
+def test_fit_matches_gpx(compressed_timestamps):
+    fit = read_fit_track(io.BytesIO(fit_bytes(POINTS, compressed_timestamps=compressed_timestamps)))
+    gpx = read_gpx_track(io.BytesIO(gpx_bytes(POINTS)))
+    assert len(fit) == len(gpx) == len(POINTS)
+    assert list(fit['time']) == list(gpx['time'])
+    assert list(fit['hr']) == list(gpx['hr'])
+    for name, tolerance in (('lat', 1e-6), ('lon', 1e-6), ('elevation', 0.2)):
+        assert max(abs(a - b) for a, b in zip(fit[name], gpx[name])) < tolerance
+    # Cadence is recorded as invalid, so there is no cadence column
+    assert 'cadence' not in fit
+
+def test_metadata():
+    track = read_fit_track(io.BytesIO(fit_bytes(POINTS, lap_starts=[0, 300, 100], manufacturer=23)))
+    assert track.metadata['creator'] == 'Suunto'
+    assert track.metadata['lap_starts'] == [POINTS[0][2], POINTS[100][2], POINTS[300][2]]
+    assert track.metadata['points_per_minute'] == pytest.approx(60, abs=1)
+    unknown = read_fit_track(io.BytesIO(fit_bytes(POINTS[:10], manufacturer=9999)))
+    assert unknown.metadata['creator'] == 'FIT manufacturer 9999'
+
+def test_chained_files():
+    data = fit_bytes(POINTS[:100]) + fit_bytes(POINTS[100:], compressed_timestamps=False)
+    track = read_fit_track(io.BytesIO(data))
+    assert list(track['time']) == [point[2] for point in POINTS]
+
+def test_missing_hr_is_nan():
+    points = [(lat, lon, time, elevation, None if i % 2 else hr)
+              for i, (lat, lon, time, elevation, hr) in enumerate(POINTS[:20])]
+    track = read_fit_track(io.BytesIO(fit_bytes(points)))
+    assert track.heart_rates() == [hr for _, _, _, _, hr in points if hr is not None]
+
+@pytest.mark.parametrize('data', [
+    fit_bytes(POINTS[:50])[:-40],        # Cut off in a record
+    fit_bytes(POINTS[:50])[:10],         # Cut off in the header
+    b'\x0e' + b'\x00' * 7 + b'.FTT' + b'\x00' * 2,
+])
+def test_broken_files(data):
+    with pytest.raises(FitError):
+        read_fit_track(io.BytesIO(data))
+
+def test_undefined_local_type():
+    data = bytearray(fit_bytes(POINTS[:1], compressed_timestamps=False))
+    # The only record (21 bytes before the CRC) now names local type 5, which has no definition
+    assert data[-23] == 0x01
+    data[-23] = 0x05
+    with pytest.raises(FitError):
+        read_fit_track(io.BytesIO(bytes(data)))
+
+def test_parity(both_paths):
+    data = fit_bytes(POINTS, lap_starts=[0, 300])
+    assert_same(*both_paths(lambda: read_fit_track(io.BytesIO(data))))
@@ -0,0 +1,74 @@
+import io
+import math
+import random
+from array import array
+from app.geo import haversine, step_distances, time_steps, cumulative_sum, instantaneous_pace, add_motion_columns
+from app.gpx_reader import read_gpx_track
+from conftest import assert_same
+from samples import run_points, gpx_bytes
+
+def random_walk(n, seed=3):
+    rng = random.Random(seed)
+    lats, lons, times = [40.0], [-75.0], [1e9]
+    for _ in range(n - 1):
+        lats.append(lats[-1] + rng.gauss(0, 1e-4))
+        lons.append(lons[-1] + rng.gauss(0, 1e-4))
+        times.append(times[-1] + rng.choice([0, 1, 1, 2, 5]))
+    return lats, lons, times
+
+def test_haversine_one_degree_of_latitude():
+    assert math.isclose(haversine(0, 0, 1, 0), 3956 * math.pi / 180)
+    assert haversine(42.5, -85.1, 42.5, -85.1) == 0
+
+def test_step_distances_match_haversine(pure_python):
+    lats, lons, _ = random_walk(50)
+    distances = step_distances(lats, lons)
+    assert distances[0] == 0
+    for i in range(1, 50):
+        assert math.isclose(distances[i], haversine(lats[i - 1], lons[i - 1], lats[i], lons[i]), rel_tol=1e-12)
+
+def test_pure_python_path_uses_stdlib_arrays(pure_python):
+    track = add_motion_columns(read_gpx_track(io.BytesIO(gpx_bytes(run_points(warmup=30, reps=0, stop=0, cooldown=0)))))
+    assert all(isinstance(values, array) for values in track.columns.values())
+
+def test_kernels_parity(both_paths):
+    lats, lons, times = random_walk(500)
+
+    def kernels():
+        distances = step_distances(lats, lons)
+        steps = time_steps(times)
+        return {
+            'distance': distances,
+            'time_step': steps,
+            'cum_distance': cumulative_sum(distances),
+            'pace': instantaneous_pace(distances, steps, min_distance=1e-4)
+        }
+    assert_same(*both_paths(kernels))
+
+def test_short_columns(both_paths):
+    def kernels():
+        return [step_distances([], []), step_distances([40.0], [-75.0]), time_steps([]), time_steps([5.0]),
+                cumulative_sum([]), instantaneous_pace([], [])]
+    with_numpy, without_numpy = both_paths(kernels)
+    assert with_numpy == without_numpy == [[], [0.0], [], [0.0], [], []]
+
+def test_instantaneous_pace_edge_cases(both_paths):
+    # No time, backwards time, no distance, under min_distance, a normal step
+    distances = [0.0, 0.01, 0.01, 0.0, 0.0005, 0.01]
+    steps = [0.0, 0.0, -1.0, 10.0, 10.0, 60.0]
+    with_numpy, without_numpy = both_paths(lambda: instantaneous_pace(distances, steps, min_distance=0.001))
+    assert with_numpy == without_numpy
+    assert with_numpy[:5] == [math.inf] * 5
+    assert math.isclose(with_numpy[5], 100.0)
+
+def test_motion_columns_parity(both_paths):
+    data = gpx_bytes(run_points())
+    assert_same(*both_paths(lambda: add_motion_columns(read_gpx_track(io.BytesIO(data)))))
+
+def test_straight_line_adds_up(pure_python):
+    # Ten steps due north add up to the distance between the end points
+    lats = [40.0 + 0.01 * i for i in range(11)]
+    lons = [-75.0] * 11
+    total = cumulative_sum(step_distances(lats, lons))[-1]
+    assert math.isclose(total, haversine(40.0, -75.0, 40.1, -75.0), rel_tol=1e-9)
+    assert math.isclose(total, 0.1 * 3956 * math.pi / 180, rel_tol=1e-9)
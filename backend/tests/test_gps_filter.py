@@ -0,0 +1,118 @@
+import io
+import math
+import pytest
+from array import array
+from app.gps_filter import outlier_mask, reject_outliers, rolling_speed, kalman_speed, smooth_motion, MAX_PACE
+from app.geo import add_motion_columns, EARTH_RADIUS_MILES
+from app.gpx_reader import read_gpx_track
+from app.track import TrackArray
+from conftest import assert_same
+from samples import run_points, gpx_bytes
+
+DEGREES_PER_MILE = 180 / (math.pi * EARTH_RADIUS_MILES)
+
+def northward(miles_per_second, seconds=120, spikes=(), jump_at=None):
+    """
+    A track heading due north at an even speed, one point a second.
+    Points in `spikes` sit a tenth of a mile off to the east; from
+    `jump_at` on, the whole track is shifted a tenth of a mile north.
+    """
+    lats, lons = [], []
+    for t in range(seconds):
+        lat = 40.0 + t * miles_per_second * DEGREES_PER_MILE
+        if jump_at is not None and t >= jump_at:
+            lat += 0.1 * DEGREES_PER_MILE
+        lats.append(lat)
+        lons.append(-75.0 + (0.1 * DEGREES_PER_MILE if t in spikes else 0.0))
+    return TrackArray({
+        'lat': array('d', lats), 'lon': array('d', lons), 'time': array('d', range(seconds)),
+        'elevation': array('d', [0.0] * seconds), 'hr': array('d', [150.0] * seconds)
+    }).freeze()
+
+def as_list(values):
+    return [float(value) for value in values]
+
+def test_spikes_are_dropped(both_paths):
+    # 8:00 min/mile with a spike mid-run and one on the last point
+    track = northward(1 / 480, spikes=(50, 119))
+    with_numpy, without_numpy = both_paths(lambda: [i for i, keep in enumerate(outlier_mask(track)) if not keep])
+    assert with_numpy == without_numpy == [50, 119]
+
+    def rejected():
+        kept, count = reject_outliers(northward(1 / 480, spikes=(50, 119)))
+        return [len(kept), count]
+    with_numpy, without_numpy = both_paths(rejected)
+    assert with_numpy == without_numpy == [118, 2]
+
+def test_clean_track_is_kept_as_is(pure_python):
+    track = northward(1 / 480)
+    assert reject_outliers(track) == (track, 0)
+
+def test_jump_is_taken_out_of_the_distance(both_paths):
+    def cleaned():
+        track = add_motion_columns(northward(1 / 480, jump_at=60))
+        return smooth_motion(track), float(track['cum_distance'][-1])
+    with_numpy, without_numpy = both_paths(cleaned)
+    assert with_numpy[0] == without_numpy[0] == 1
+    assert with_numpy[1] == pytest.approx(without_numpy[1])
+    # 119 one-second steps at 8:00 min/mile, less the step with the jump
+    assert with_numpy[1] == pytest.approx(118 / 480)
+
+@pytest.mark.parametrize('smoothing', ['rolling', 'kalman', 'none'])
+def test_even_pace_is_recovered(pure_python, smoothing):
+    track = add_motion_columns(northward(1 / 480))
+    smooth_motion(track, smoothing=smoothing)
+    # The Kalman filter starts from standing still and needs a few seconds
+    paces = as_list(track['pace'])[30:]
+    assert paces == pytest.approx([8.0] * len(paces), rel=1e-2)
+
+def test_standing_still_is_max_pace(both_paths):
+    def paces():
+        track = add_motion_columns(northward(0.0, seconds=30))
+        smooth_motion(track)
+        return sorted(set(as_list(track['pace'])))
+    with_numpy, without_numpy = both_paths(paces)
+    assert with_numpy == without_numpy == [MAX_PACE]
+
+def test_rolling_speed_window(both_paths):
+    # 0.01 miles a second for 10 seconds, then standing still
+    times = array('d', range(20))
+    cum_distance = array('d', [0.01 * min(t, 10) for t in range(20)])
+
+    def speeds():
+        track = TrackArray({'time': times, 'cum_distance': cum_distance}).freeze()
+        return as_list(rolling_speed(track['cum_distance'], track['time'], window=4))
+    with_numpy, without_numpy = both_paths(speeds)
+    assert with_numpy == pytest.approx(without_numpy)
+    assert with_numpy[5] == pytest.approx(36.0)
+    assert with_numpy[15] == 0.0
+    # Straddling the stop: 0.02 miles in 4 seconds
+    assert with_numpy[10] == pytest.approx(18.0)
+
+def test_isolated_points_are_not_stopped(both_paths):
+    # One point every 30 s at 7.5 mph: no point has a neighbour inside the window
+    times = array('d', range(0, 600, 30))
+    cum_distance = array('d', [t / 480 for t in range(0, 600, 30)])
+
+    def speeds():
+        track = TrackArray({'time': times, 'cum_distance': cum_distance}).freeze()
+        return as_list(rolling_speed(track['cum_distance'], track['time'], window=20))
+    with_numpy, without_numpy = both_paths(speeds)
+    assert with_numpy == pytest.approx(without_numpy)
+    assert with_numpy == pytest.approx([7.5] * len(times))
+
+def test_kalman_speed_follows_a_steady_run(pure_python):
+    cum_distance = [t / 480 for t in range(300)]
+    speeds = kalman_speed(cum_distance, list(range(300)))
+    assert speeds[0] == 0.0
+    assert speeds[-1] == pytest.approx(7.5, rel=1e-3)
+
+def test_gps_filter_parity(both_paths):
+    data = gpx_bytes(run_points())
+
+    def cleaned():
+        track, rejected = reject_outliers(read_gpx_track(io.BytesIO(data)))
+        track = add_motion_columns(track)
+        jumps = smooth_motion(track)
+        return rejected, jumps, as_list(track['pace']), as_list(track['speed'])
+    assert_same(*both_paths(cleaned))
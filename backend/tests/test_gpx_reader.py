@@ -0,0 +1,61 @@
+import io
+import pytest
+from app.gpx_reader import read_gpx_track
+from samples import run_points, gpx_bytes
+
+POINTS = run_points(reps=1)
+
+def test_reads_every_point():
+    track = read_gpx_track(io.BytesIO(gpx_bytes(POINTS)))
+    assert len(track) == len(POINTS)
+    assert list(track['time']) == [point[2] for point in POINTS]
+    assert track.heart_rates() == [point[4] for point in POINTS]
+    assert track['lat'][0] == pytest.approx(POINTS[0][0], abs=1e-7)
+    assert track['elevation'][0] == pytest.approx(POINTS[0][3], abs=0.05)
+
+def test_creator_and_frequency():
+    track = read_gpx_track(io.BytesIO(gpx_bytes(POINTS, creator='Garmin Connect')))
+    assert track.metadata['creator'] == 'Garmin Connect'
+    # One point a second
+    assert track.metadata['points_per_minute'] == pytest.approx(60, abs=1)
+
+def test_points_without_hr():
+    points = [(lat, lon, time, elevation, None) for lat, lon, time, elevation, _ in POINTS[:10]]
+    track = read_gpx_track(io.BytesIO(gpx_bytes(points)))
+    assert track.heart_rates() == []
+    assert all(hr != hr for hr in track['hr'])
+    assert read_gpx_track(io.BytesIO(gpx_bytes(points[:1]))).metadata['points_per_minute'] is None
+
+def extension_gpx(values):
+    """GPX with one point per dict of values, each written inside a Garmin v2 TrackPointExtension"""
+    points = []
+    for i, fields in enumerate(values):
+        children = ''.join(f'<gpxtpx:{name}>{value}</gpxtpx:{name}>' for name, value in fields.items())
+        points.append(f'<trkpt lat="42.0" lon="-85.0"><time>2024-03-29T12:{i // 60:02d}:{i % 60:02d}Z</time>'
+                      f'<extensions><gpxtpx:TrackPointExtension>{children}</gpxtpx:TrackPointExtension></extensions></trkpt>')
+    return ('<?xml version="1.0"?><gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1" '
+            'xmlns:gpxtpx="http://www.garmin.com/xmlschemas/TrackPointExtension/v2"><trk><trkseg>' +
+            ''.join(points) + '</trkseg></trk></gpx>').encode('utf-8')
+
+def test_sensor_extensions():
+    track = read_gpx_track(io.BytesIO(extension_gpx([{'hr': 140, 'cad': 88, 'atemp': 12.5}] * 10)))
+    assert track.heart_rates() == [140] * 10
+    assert list(track['cadence']) == [88.0] * 10
+    assert list(track['temperature']) == [12.5] * 10
+    # Fields the file doesn't record have no column
+    assert 'power' not in track and 'device_speed' not in track
+
+def test_device_speed_has_its_own_column():
+    # The smoothed 'speed' (mph) column is the analysis' own
+    track = read_gpx_track(io.BytesIO(extension_gpx([{'hr': 140, 'speed': 3.1}] * 10)))
+    assert list(track['device_speed']) == [3.1] * 10
+    assert 'speed' not in track
+
+def test_strap_connecting_late_is_picked_up():
+    values = [{'cad': 88}] * 150 + [{'cad': 88, 'hr': 150}] * 100
+    track = read_gpx_track(io.BytesIO(extension_gpx(values)))
+    # Unknown fields are looked for again every RELEARN_INTERVAL points
+    hr = list(track['hr'])
+    assert all(value != value for value in hr[:150])
+    assert hr[-1] == 150.0
+    assert len(track.heart_rates()) >= 50
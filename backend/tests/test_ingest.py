@@ -0,0 +1,74 @@
+import io
+import gzip
+import hashlib
+import pytest
+from app.ingest import read_track, detect_format, run_file_extensions
+from app.result_cache import content_digest
+from conftest import assert_same, plain
+from samples import run_points, gpx_bytes, tcx_bytes, fit_bytes
+
+POINTS = run_points(reps=1)
+FILES = {
+    'gpx': gpx_bytes(POINTS),
+    'tcx': tcx_bytes(POINTS, lap_starts=[0, 300]),
+    'fit': fit_bytes(POINTS, lap_starts=[0, 300])
+}
+
+@pytest.mark.parametrize('name', FILES)
+def test_detect_format(name):
+    data = FILES[name]
+    assert detect_format(data[:4096])['name'] == name
+    if name != 'fit':
+        assert detect_format(b'\xef\xbb\xbf' + data[:4096])['name'] == name
+
+def test_unknown_format():
+    assert detect_format(b'<?xml version="1.0"?><kml></kml>') is None
+    with pytest.raises(ValueError):
+        read_track(io.BytesIO(b'lat,lon,time\n'))
+
+def test_extensions():
+    extensions = run_file_extensions()
+    for extension in ('.gpx', '.tcx', '.fit', '.gpx.gz', '.tcx.gz', '.fit.gz'):
+        assert extension in extensions
+
+@pytest.mark.parametrize('name', FILES)
+def test_formats_read_the_same_points(name):
+    track = read_track(io.BytesIO(FILES[name]))
+    assert list(track['time']) == [point[2] for point in POINTS]
+    assert track.heart_rates() == [point[4] for point in POINTS]
+
+@pytest.mark.parametrize('name', FILES)
+def test_gzip_reads_like_the_plain_file(name):
+    expected = read_track(io.BytesIO(FILES[name]))
+    # Two gzip members, as concatenating .gz files gives
+    data = FILES[name]
+    compressed = gzip.compress(data[:1000]) + gzip.compress(data[1000:])
+    assert_same(plain(expected), plain(read_track(io.BytesIO(compressed))))
+
+@pytest.mark.parametrize('name', FILES)
+@pytest.mark.parametrize('compress', [False, True])
+def test_digest_hashes_the_file_content(name, compress, tmp_path):
+    # Compressed files hash like their content, so both share cache entries
+    expected = hashlib.sha256(FILES[name]).hexdigest()
+    data = gzip.compress(FILES[name]) if compress else FILES[name]
+    digest = content_digest()
+    read_track(io.BytesIO(data), digest=digest)
+    assert digest.hexdigest() == expected
+
+    path = tmp_path / f'run.{name}'
+    path.write_bytes(data)
+    digest = content_digest()
+    read_track(str(path), digest=digest)
+    assert digest.hexdigest() == expected
+
+def test_digest_covers_trailing_bytes():
+    # The reader stops at the end of the document; what follows is hashed too
+    data = FILES['gpx'] + b'\n<!-- trailing -->\n'
+    digest = content_digest()
+    read_track(io.BytesIO(data), digest=digest)
+    assert digest.hexdigest() == hashlib.sha256(data).hexdigest()
+
+@pytest.mark.parametrize('name', ['gpx', 'tcx'])
+def test_xml_readers_parity(both_paths, name):
+    data = FILES[name]
+    assert_same(*both_paths(lambda: read_track(io.BytesIO(data))))
@@ -0,0 +1,123 @@
+import io
+import random
+import pytest
+from app.gpx_reader import read_gpx_track
+from app.geo import add_motion_columns
+from app.gps_filter import smooth_motion
+from app.pauses import detect_pauses
+from app.segments import segment_prefix_sums, moving_mask
+from app.intervals import pelt, detect_laps, laps_from_starts, INTERVAL_DEFAULTS
+from conftest import assert_same
+from samples import run_points, gpx_bytes, START
+
+def steps_series(levels, length=40, seed=2):
+    rng = random.Random(seed)
+    return [level + rng.gauss(0, 0.2) for level in levels for _ in range(length)]
+
+@pytest.mark.parametrize('levels', [[6.0], [6.0, 9.0], [6.0, 9.0, 4.0, 9.0, 4.0, 6.0]])
+def test_pelt_finds_the_level_changes(both_paths, levels):
+    speeds = steps_series(levels)
+    weights = [5.0] * len(speeds)
+    with_numpy, without_numpy = both_paths(lambda: pelt(speeds, weights, penalty=50.0, min_weight=30.0))
+    assert with_numpy == without_numpy == [40 * (k + 1) for k in range(len(levels))]
+
+def test_pelt_respects_min_weight(both_paths):
+    # A two-bin spike can't be its own segment when segments need 6 bins
+    speeds = [6.0] * 20 + [12.0, 12.0] + [6.0] * 20
+    weights = [5.0] * len(speeds)
+    with_numpy, without_numpy = both_paths(lambda: pelt(speeds, weights, penalty=1.0, min_weight=30.0))
+    assert with_numpy == without_numpy
+    lengths = [end - start for start, end in zip([0] + with_numpy, with_numpy)]
+    assert min(lengths) >= 6
+
+def test_pelt_empty_and_single(both_paths):
+    assert both_paths(lambda: pelt([], [], 1.0, 1.0)) == ([], [])
+    assert both_paths(lambda: pelt([6.0], [5.0], 1.0, 1.0)) == ([1], [1])
+
+def analyzed(data):
+    track = add_motion_columns(read_gpx_track(io.BytesIO(data)))
+    smooth_motion(track)
+    detect_pauses(track)
+    return track, segment_prefix_sums(track, moving_mask(track))
+
+def test_detect_laps_parity(both_paths):
+    data = gpx_bytes(run_points(reps=4))
+
+    def laps():
+        track, sums = analyzed(data)
+        return detect_laps(track, sums, **INTERVAL_DEFAULTS)
+    with_numpy, without_numpy = both_paths(laps)
+    assert_same(with_numpy, without_numpy)
+    types = [lap['type'] for lap in with_numpy]
+    assert types.count('work') == 4
+    assert types[0] == 'warmup' and types[-1] == 'cooldown'
+
+def repeats_800(reps=6, seed=3):
+    """
+    1 Hz points of a 10 min warmup at 6 mph, `reps` x 800 m at 10 mph with
+    90 s jogs at 4 mph between them, and a 5 min cooldown at 6 mph
+    """
+    rng = random.Random(seed)
+    state = {'t': START, 'lat': 42.88}
+    points = []
+
+    def step(mph):
+        miles = max(mph + rng.gauss(0, 0.3), 0) / 3600
+        state['t'] += 1
+        state['lat'] += miles / 69.0
+        points.append((state['lat'], -85.73, state['t'], 200.0, 150))
+        return miles
+
+    for _ in range(600):
+        step(6.0)
+    for rep in range(reps):
+        covered = 0.0
+        while covered < 800 / 1609.344:
+            covered += step(10.0)
+        if rep < reps - 1:
+            for _ in range(90):
+                step(4.0)
+    for _ in range(300):
+        step(6.0)
+    return points
+
+def test_six_by_800(both_paths):
+    data = gpx_bytes(repeats_800())
+
+    def laps():
+        track, sums = analyzed(data)
+        return detect_laps(track, sums, **INTERVAL_DEFAULTS)
+    with_numpy, without_numpy = both_paths(laps)
+    assert_same(with_numpy, without_numpy)
+    assert [lap['type'] for lap in with_numpy] == ['warmup'] + ['work', 'rest'] * 5 + ['work', 'cooldown']
+    for lap in with_numpy:
+        if lap['type'] == 'work':
+            # 800 m is half a mile, run at 6:00 min/mile
+            assert lap['distance'] == pytest.approx(0.497, abs=0.03)
+            assert lap['pace'] == pytest.approx(6.0, abs=0.25)
+        elif lap['type'] == 'rest':
+            assert lap['moving_time_minutes'] == pytest.approx(1.5, abs=0.25)
+
+def test_steady_run_is_one_lap(both_paths):
+    data = gpx_bytes(run_points(warmup=900, reps=0, stop=0, cooldown=0))
+
+    def laps():
+        track, sums = analyzed(data)
+        return detect_laps(track, sums, **INTERVAL_DEFAULTS)
+    with_numpy, without_numpy = both_paths(laps)
+    assert_same(with_numpy, without_numpy)
+    assert [lap['type'] for lap in with_numpy] == ['steady']
+
+def test_laps_from_starts_parity(both_paths):
+    points = run_points(reps=2)
+    data = gpx_bytes(points)
+    # Before the run, on a point, between points, a duplicate, after the run
+    lap_starts = [points[0][2] - 10, points[300][2], points[480][2] + 0.5, points[480][2], points[-1][2] + 10]
+
+    def laps():
+        track, sums = analyzed(data)
+        return laps_from_starts(track, sums, lap_starts)
+    with_numpy, without_numpy = both_paths(laps)
+    assert_same(with_numpy, without_numpy)
+    assert [lap['start_idx'] for lap in with_numpy] == [0, 300, 480]
+    assert with_numpy[-1]['end_idx'] == len(points)
@@ -0,0 +1,94 @@
+import io
+import os
+import runpy
+import pytest
+from werkzeug.datastructures import FileStorage
+from app import jobs
+from app.jobs import JobQueue, run_job
+from app.database import RunDatabase
+from app.bulk import enqueue_uploads
+from samples import run_points, gpx_bytes
+
+GPX = gpx_bytes(run_points(reps=1))
+PARAMS = {'pace_limit': 8.0, 'user_age': 35, 'resting_hr': 55, 'weight': 150, 'gender': 1, 'tz_name': 'UTC'}
+
+def test_claim_respects_the_concurrency_limit(db_name):
+    queue = JobQueue(db_name)
+    first = queue.enqueue(1, b'a', PARAMS)
+    second = queue.enqueue(1, b'b', PARAMS)
+    job = queue.claim('w1', concurrency=1)
+    assert job['id'] == first and job['payload'] == b'a' and job['attempts'] == 1
+    assert queue.claim('w2', concurrency=1) is None
+    queue.update_progress(first, 'segments', 0.5)
+    assert queue.get(first, user_id=1)['stage'] == 'segments'
+    assert queue.get(first, user_id=2) is None
+    queue.complete(first, 42)
+    assert queue.claim('w2', concurrency=1)['id'] == second
+    status = queue.get(first)
+    assert (status['status'], status['run_id'], status['progress']) == ('done', 42, 1)
+
+def test_failed_jobs_retry_with_backoff(db_name, monkeypatch):
+    queue = JobQueue(db_name)
+    job_id = queue.enqueue(1, b'a', PARAMS, max_attempts=2)
+    job = queue.claim('w1')
+    queue.fail(job_id, 'boom', job['attempts'], job['max_attempts'])
+    assert queue.get(job_id)['stage'] == 'retrying'
+    # Not claimable until the retry delay has passed
+    assert queue.claim('w1') is None
+    now = jobs.time.time()
+    monkeypatch.setattr(jobs.time, 'time', lambda: now + jobs.JOB_RETRY_DELAY + 1)
+    job = queue.claim('w1')
+    assert job['attempts'] == 2
+    queue.fail(job_id, 'boom', job['attempts'], job['max_attempts'])
+    assert queue.get(job_id)['status'] == 'failed'
+
+def test_stale_jobs_are_requeued(db_name, monkeypatch):
+    queue = JobQueue(db_name)
+    job_id = queue.enqueue(1, b'a', PARAMS)
+    queue.claim('w1', concurrency=1)
+    now = jobs.time.time()
+    monkeypatch.setattr(jobs.time, 'time', lambda: now + jobs.JOB_STALE_SECONDS + 1)
+    job = queue.claim('w2', concurrency=1)
+    assert job['id'] == job_id and job['attempts'] == 2
+
+def test_bulk_import_is_one_batch_behind_single_uploads(db_name):
+    queue = JobQueue(db_name)
+    uploads = [FileStorage(stream=io.BytesIO(GPX), filename='2024-03-29 Intervals.gpx'),
+               FileStorage(stream=io.BytesIO(b''), filename='notes.txt')]
+    batch_id, files = enqueue_uploads(queue, 1, uploads, PARAMS)
+    assert [(entry['filename'], entry['status']) for entry in files] == [
+        ('2024-03-29 Intervals.gpx', 'queued'), ('notes.txt', 'skipped')]
+    single = queue.enqueue(1, GPX, dict(PARAMS, run_date='2024-03-30'))
+    # The single upload is claimed first even though it was queued later
+    assert queue.claim('w1')['id'] == single
+    bulk_job = queue.claim('w1')
+    assert bulk_job['id'] == files[0]['job_id']
+    assert bulk_job['params']['run_date'] == '2024-03-29'
+    assert [job['id'] for job in queue.batch(batch_id, 1)] == [files[0]['job_id']]
+    assert queue.batch(batch_id, 2) == []
+
+def test_run_job_saves_the_run(db_name):
+    database = RunDatabase(db_name)
+    # init_db creates the original schema; ensure_tables adds the later columns
+    database.ensure_tables()
+    queue = JobQueue(db_name)
+    queue.enqueue(1, GPX, dict(PARAMS, run_date='2024-03-29'))
+    job = queue.claim('w1')
+    stages = []
+    queue.update_progress = lambda job_id, stage, fraction: stages.append(stage)
+    run_id = run_job(queue, database, job)
+    run = database.get_run(run_id, 1)
+    assert run['date'] == '2024-03-29'
+    assert run['pace_limit'] == 8.0
+    assert run['data']['total_distance'] == pytest.approx(run['total_distance'])
+    assert run['avg_pace'] == pytest.approx(run['data']['overall_avg_pace'])
+    assert run['avg_pace'] > 0
+    assert stages[-1] == 'saving'
+
+def test_gunicorn_starts_the_pool_before_serving(monkeypatch):
+    from routes import jobs as job_routes
+    started = []
+    monkeypatch.setattr(jobs, 'start_workers', started.append)
+    config = runpy.run_path(os.path.join(os.path.dirname(__file__), '..', 'gunicorn.conf.py'))
+    config['post_worker_init'](type('Worker', (), {'pid': 1})())
+    assert started == [job_routes.db.db_name]
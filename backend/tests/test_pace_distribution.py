@@ -0,0 +1,74 @@
+import io
+import math
+import pytest
+from array import array
+from app.gpx_reader import read_gpx_track
+from app.geo import add_motion_columns
+from app.track import TrackArray
+from app.pace_distribution import (pace_bucket_indices, build_pace_histogram, merge_histograms, pace_split,
+                                   pace_curve, PaceHistogramStore, PACE_BUCKET_COUNT)
+from conftest import assert_same
+from samples import run_points, gpx_bytes
+
+def steady_track(*stretches):
+    """Track of (seconds, pace) stretches at one point a second, HR 150"""
+    paces = [pace for seconds, pace in stretches for _ in range(seconds)]
+    n = len(paces) + 1
+    track = TrackArray({
+        'lat': array('d', [0.0] * n), 'lon': array('d', [0.0] * n),
+        'time': array('d', range(n)), 'elevation': array('d', [0.0] * n),
+        'hr': array('d', [150.0] * n)
+    }).freeze()
+    track.set_column('distance', [0.0] + [1 / 60 / pace for pace in paces])
+    track.set_column('time_step', [0.0] + [1.0] * (n - 1))
+    track.set_column('pace', [math.inf] + paces)
+    return track, [False] + [True] * (n - 1)
+
+def test_bucket_edges(both_paths):
+    # Bucket 0 is (3:00, 3:05] plus anything faster; the last takes anything slower than 20:00
+    paces = [1.0, 3.0, 3 + 5 / 60, 3 + 6 / 60, 8.0, 20.0, 20.01, math.inf]
+    with_numpy, without_numpy = both_paths(lambda: pace_bucket_indices(paces))
+    assert with_numpy == without_numpy == [0, 0, 0, 1, 59, PACE_BUCKET_COUNT - 1, PACE_BUCKET_COUNT, PACE_BUCKET_COUNT]
+
+def test_split_of_a_known_run(pure_python):
+    # A minute at 7:00/mi and a minute at 9:00/mi
+    histogram = build_pace_histogram(*steady_track((60, 7.0), (60, 9.0)))
+    split = pace_split(histogram, 8.0)
+    assert split['fast']['distance'] == pytest.approx(1 / 7, abs=1e-4)
+    assert split['slow']['distance'] == pytest.approx(1 / 9, abs=1e-4)
+    assert split['fast']['time_minutes'] == pytest.approx(1)
+    assert split['fast']['avg_pace'] == pytest.approx(7, abs=1e-3)
+    assert split['slow']['avg_hr'] == 150
+    assert split['percentage_fast'] == pytest.approx(100 * 9 / 16, abs=0.05)
+    # A limit on a bucket edge takes the whole bucket; limits outside the run take all or nothing
+    assert pace_split(histogram, 7.0)['fast']['distance'] == pytest.approx(1 / 7, abs=1e-4)
+    assert pace_split(histogram, 5.0)['fast']['distance'] == 0
+    assert pace_split(histogram, 12.0)['slow']['distance'] == pytest.approx(0, abs=1e-9)
+
+def test_merged_histograms_add_up(pure_python):
+    first = build_pace_histogram(*steady_track((60, 7.0)))
+    second = build_pace_histogram(*steady_track((60, 9.0)))
+    both = build_pace_histogram(*steady_track((60, 7.0), (60, 9.0)))
+    assert_same(merge_histograms([first, second, None]), both, rel=1e-6)
+    assert pace_curve(both)[-1]['distance'] == pytest.approx(1 / 7 + 1 / 9, abs=1e-4)
+    assert merge_histograms([])['distance'] == []
+
+def test_histogram_parity(both_paths):
+    data = gpx_bytes(run_points())
+
+    def histogram():
+        track = add_motion_columns(read_gpx_track(io.BytesIO(data)))
+        return build_pace_histogram(track, [step > 0 for step in track['time_step']])
+    with_numpy, without_numpy = both_paths(histogram)
+    assert_same(with_numpy, without_numpy)
+
+def test_store(db_name):
+    store = PaceHistogramStore(db_name)
+    histogram = build_pace_histogram(*steady_track((60, 7.0)))
+    store.save(1, 1, '2024-03-01', histogram)
+    store.save(2, 1, '2024-03-20', histogram)
+    store.save(3, 2, '2024-03-10', histogram)
+    assert store.get(1, user_id=1) == histogram
+    assert [run_id for run_id, _, _ in store.for_user(1, start_date='2024-03-10')] == [2]
+    store.delete(2)
+    assert [run_id for run_id, _, _ in store.for_user(1)] == [1]
@@ -0,0 +1,66 @@
+import io
+import math
+import pytest
+from app.gpx_reader import read_gpx_track
+from app.geo import add_motion_columns
+from app.gps_filter import smooth_motion
+from app.pauses import detect_pauses, PAUSE_DEFAULTS
+from app.segments import classify_with_hysteresis, build_segments, segment_prefix_sums, moving_mask
+from conftest import assert_same
+from samples import run_points, gpx_bytes
+
+def pauses_of(points, **settings):
+    track = add_motion_columns(read_gpx_track(io.BytesIO(gpx_bytes(points))))
+    smooth_motion(track)
+    pauses = detect_pauses(track, **dict(PAUSE_DEFAULTS, **settings))
+    return {'pauses': pauses, 'paused': track['paused']}
+
+def test_stop_is_a_pause(both_paths):
+    points = run_points(reps=1, stop=60)
+    with_numpy, without_numpy = both_paths(lambda: pauses_of(points))
+    assert_same(with_numpy, without_numpy)
+    assert len(with_numpy['pauses']) == 1
+    pause = with_numpy['pauses'][0]
+    # The smoothed speed lags the stop by part of its 20 s window
+    assert 40 <= pause['duration'] <= 70
+    assert sum(with_numpy['paused']) == pause['end_idx'] - pause['start_idx']
+
+@pytest.mark.parametrize('stop', [0, 5])
+def test_no_pause_without_a_long_stop(both_paths, stop):
+    points = run_points(reps=1, stop=stop)
+    with_numpy, without_numpy = both_paths(lambda: pauses_of(points))
+    assert_same(with_numpy, without_numpy)
+    assert with_numpy['pauses'] == []
+    assert not any(with_numpy['paused'])
+
+def test_no_segment_spans_a_pause(pure_python):
+    track = add_motion_columns(read_gpx_track(io.BytesIO(gpx_bytes(run_points(reps=2, stop=60)))))
+    smooth_motion(track)
+    detect_pauses(track)
+    moving, is_fast = classify_with_hysteresis(track, 8.0)
+    segments = build_segments(track, is_fast, moving)
+    sums = segment_prefix_sums(track, moving_mask(track))
+    # Segments still add up to the moving distance
+    assert math.isclose(sum(segment['distance'] for segment in segments), sums['distance'][-1])
+    paused = [i for i, value in enumerate(track['paused']) if value]
+    assert paused
+    assert not any(segment['start_idx'] < paused[0] and segment['end_idx'] > paused[-1] + 1 for segment in segments)
+
+def test_recording_gap_is_a_pause(both_paths):
+    # The watch stopped recording for two minutes without moving
+    points = run_points(reps=0, stop=0, warmup=300, cooldown=300)
+    gap = 300
+    points = points[:gap] + [(lat, lon, time + 120, elevation, hr) for lat, lon, time, elevation, hr in points[gap:]]
+    lat, lon, time, elevation, hr = points[gap]
+    points[gap] = (points[gap - 1][0], points[gap - 1][1], time, elevation, hr)
+    with_numpy, without_numpy = both_paths(lambda: pauses_of(points))
+    assert_same(with_numpy, without_numpy)
+    assert [pause['start_idx'] for pause in with_numpy['pauses']] == [gap]
+    assert with_numpy['pauses'][0]['duration'] >= 120
+
+def test_empty_track(both_paths):
+    def pauses():
+        track = add_motion_columns(read_gpx_track(io.BytesIO(gpx_bytes(run_points(warmup=1, reps=0, stop=0, cooldown=0)))))
+        smooth_motion(track)
+        return detect_pauses(track)
+    assert both_paths(pauses) == ([], [])
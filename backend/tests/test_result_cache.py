@@ -0,0 +1,45 @@
+import sqlite3
+from app import result_cache
+from app.result_cache import AnalysisCache, cache_key
+
+SETTINGS = {'user_age': 35, 'resting_hr': 55, 'weight': 150, 'gender': 1, 'tz_name': 'UTC'}
+
+def test_cache_key_covers_the_settings(monkeypatch):
+    key = cache_key('abc', 8.0, SETTINGS, 1)
+    assert key == cache_key('abc', 8, dict(SETTINGS), 1)
+    assert key != cache_key('abd', 8.0, SETTINGS, 1)
+    assert key != cache_key('abc', 8.5, SETTINGS, 1)
+    assert key != cache_key('abc', 8.0, dict(SETTINGS, resting_hr=56), 1)
+    # The same file and settings from another user is another entry
+    assert key != cache_key('abc', 8.0, SETTINGS, 2)
+    monkeypatch.setattr(result_cache, 'ANALYSIS_ENGINE_VERSION', result_cache.ANALYSIS_ENGINE_VERSION + 1)
+    assert key != cache_key('abc', 8.0, SETTINGS, 1)
+
+def test_get_put_and_link(db_name):
+    cache = AnalysisCache(db_name)
+    assert cache.get('k') is None
+    cache.put('k', 'abc', '{"total_distance": 3.1}', user_id=1, run_id=7)
+    assert cache.get('k') == {'data': '{"total_distance": 3.1}', 'user_id': 1, 'run_id': 7}
+    cache.link_run('k', 2, 9)
+    assert cache.get('k')['run_id'] == 9
+
+def test_least_recently_used_entries_are_evicted(db_name, monkeypatch):
+    cache = AnalysisCache(db_name, max_bytes=25)
+    clock = iter(range(100))
+    monkeypatch.setattr(result_cache.time, 'time', lambda: next(clock))
+    cache.put('a', 'a', 'x' * 10)
+    cache.put('b', 'b', 'x' * 10)
+    cache.get('a')
+    cache.put('c', 'c', 'x' * 10)
+    assert cache.get('b') is None
+    assert cache.get('a') and cache.get('c')
+    # Larger than the whole cache: not stored
+    cache.put('d', 'd', 'x' * 30)
+    assert cache.get('d') is None
+
+def test_other_engine_versions_are_dropped(db_name, monkeypatch):
+    AnalysisCache(db_name).put('k', 'abc', '{}')
+    monkeypatch.setattr(result_cache, 'ANALYSIS_ENGINE_VERSION', result_cache.ANALYSIS_ENGINE_VERSION + 1)
+    AnalysisCache(db_name)
+    with sqlite3.connect(db_name) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM analysis_cache').fetchone()[0] == 0
@@ -0,0 +1,49 @@
+import io
+from app.running import analyze_run_file, read_run_track, route_track
+from app.segments import materialize_route
+from samples import run_points, gpx_bytes
+
+def stored_results():
+    return {
+        'total_distance': 1.0,
+        'track': {'lat': [1.0, 2.0, 3.0, 4.0], 'lon': [5.0, 6.0, 7.0, 8.0], 'elevation': [0.0] * 4},
+        'route_data': [{'start_idx': 0, 'end_idx': 2, 'is_fast': False},
+                       {'start_idx': 1, 'end_idx': 4, 'is_fast': True}]
+    }
+
+def test_materialize_route():
+    results = stored_results()
+    materialized = materialize_route(results)
+    assert 'track' not in materialized
+    assert [entry['coordinates'] for entry in materialized['route_data']] == [
+        [[1.0, 5.0], [2.0, 6.0]],
+        [[2.0, 6.0], [3.0, 7.0], [4.0, 8.0]]
+    ]
+    assert materialized['total_distance'] == 1.0
+    # The stored results are left alone
+    assert results == stored_results()
+
+def test_old_results_pass_through():
+    old = {'route_data': [{'coordinates': [[1.0, 5.0], [2.0, 6.0]], 'is_fast': True}]}
+    assert materialize_route(old) is old
+
+def test_analysis_keeps_index_ranges_into_the_raw_track():
+    data = gpx_bytes(run_points(reps=2))
+    results = analyze_run_file(io.BytesIO(data), 8.0, user_age=35, resting_hr=55, weight=150, gender=1, tz_name='UTC')
+    # The track isn't part of the results; it is rebuilt from the raw track
+    assert 'track' not in results
+    track = route_track(read_run_track(data), results)
+    assert len(track['lat']) == len(track['lon']) == len(track['elevation'])
+    for entry in results['route_data']:
+        assert 'coordinates' not in entry
+        assert 0 <= entry['start_idx'] < entry['end_idx'] <= len(track['lat'])
+    # Entries are rebuilt from their slice of the track; consecutive entries
+    # share their boundary point unless a pause lies between them
+    assert materialize_route(results) is results
+    materialized = materialize_route(results, track)['route_data']
+    for entry in materialized:
+        assert entry['coordinates'] == [[track['lat'][i], track['lon'][i]]
+                                        for i in range(entry['start_idx'], entry['end_idx'])]
+    for previous, entry in zip(materialized, materialized[1:]):
+        if entry['start_idx'] == previous['end_idx'] - 1:
+            assert previous['coordinates'][-1] == entry['coordinates'][0]
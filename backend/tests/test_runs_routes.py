@@ -0,0 +1,73 @@
+import io
+import pytest
+from flask import Flask
+from app.database import RunDatabase
+from app.track_store import RunTrackStore
+from app.pace_distribution import PaceHistogramStore
+from app.best_efforts import BestEffortStore
+from app.jobs import JobQueue
+from app.gpx_reader import read_gpx_track
+from app.running import route_track
+from routes import runs
+from samples import run_points, gpx_bytes
+
+GPX = gpx_bytes(run_points(reps=2))
+SETTINGS = {'user_age': 35, 'resting_hr': 55, 'weight': 150, 'gender': 1, 'tz_name': 'UTC'}
+
+@pytest.fixture
+def database(db_name, monkeypatch):
+    """The runs blueprint with its database and stores on a fresh file"""
+    database = RunDatabase(db_name)
+    database.ensure_tables()
+    monkeypatch.setattr(runs, 'db', database)
+    monkeypatch.setattr(runs, 'tracks', RunTrackStore(db_name))
+    monkeypatch.setattr(runs, 'histograms', PaceHistogramStore(db_name))
+    monkeypatch.setattr(runs, 'efforts', BestEffortStore(db_name))
+    monkeypatch.setattr(runs, 'jobs', JobQueue(db_name))
+    return database
+
+@pytest.fixture
+def client(database):
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.register_blueprint(runs.runs_bp)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 1
+    return client
+
+def test_reanalyze_saves_the_overall_pace(client, database):
+    run_id = database.add_run(1, '2024-03-29', '{}', 0.0, 0.0, 0.0, 8.0)
+    runs.tracks.save(run_id, 1, read_gpx_track(io.BytesIO(GPX)), SETTINGS)
+
+    response = client.post(f'/run/{run_id}/reanalyze', data={'pace_limit': '9.0', 'save': 'true'})
+    assert response.status_code == 200
+    assert response.get_json()['saved'] is True
+    run = database.get_run(run_id, 1)
+    assert run['pace_limit'] == 9.0
+    assert run['avg_pace'] == pytest.approx(run['data']['overall_avg_pace'])
+    assert run['avg_pace'] > 0
+
+def test_reanalyze_needs_a_stored_track(client, database):
+    run_id = database.add_run(1, '2024-03-29', '{}', 0.0, 0.0, 0.0, 8.0)
+    assert client.post(f'/run/{run_id}/reanalyze', data={'pace_limit': '9.0'}).status_code == 409
+    assert client.post(f'/run/{run_id}/reanalyze').status_code == 400
+    assert client.post('/run/999/reanalyze', data={'pace_limit': '9.0'}).status_code == 404
+
+def test_saved_runs_draw_their_route_from_the_stored_track(client, database):
+    run_id = database.add_run(1, '2024-03-29', '{}', 0.0, 0.0, 0.0, 8.0)
+    runs.tracks.save(run_id, 1, read_gpx_track(io.BytesIO(GPX)), SETTINGS)
+    response = client.post(f'/run/{run_id}/reanalyze', data={
+        'pace_limit': '9.0', 'save': 'true', 'downsample': 'lttb', 'downsample_points': '300'})
+    reanalyzed = response.get_json()['data']
+
+    run = database.get_run(run_id, 1)
+    assert 'track' not in run['data']
+    loaded = client.get(f'/run/{run_id}/analysis').get_json()
+    assert loaded['route_data'] == reanalyzed['route_data']
+    # The route is drawn from the track downsampled as it was for the saved analysis
+    track = route_track(read_gpx_track(io.BytesIO(GPX)), run['data'], runs.tracks.get(run_id)['options'])
+    assert len(track['lat']) == 300
+    for entry in loaded['route_data']:
+        assert entry['coordinates'] == [[track['lat'][i], track['lon'][i]]
+                                        for i in range(entry['start_idx'], entry['end_idx'])]
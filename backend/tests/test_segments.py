@@ -0,0 +1,88 @@
+import io
+import math
+import pytest
+from array import array
+from app.gpx_reader import read_gpx_track
+from app.geo import add_motion_columns
+from app.track import TrackArray
+from app.segments import run_lengths, classify_by_pace, classify_with_hysteresis, build_segments
+from conftest import assert_same
+from samples import run_points, gpx_bytes
+
+DATA = gpx_bytes(run_points())
+
+def motion_track():
+    return add_motion_columns(read_gpx_track(io.BytesIO(DATA)))
+
+def hand_track(paces):
+    """Track with one point a second at the given paces (min/mile) after a first point"""
+    n = len(paces) + 1
+    distances = [0.0] + [1 / 60 / pace for pace in paces]
+    track = TrackArray({
+        'lat': array('d', [0.0] * n), 'lon': array('d', [0.0] * n),
+        'time': array('d', range(n)), 'elevation': array('d', [0.0] * n),
+        'hr': array('d', [150.0] * n)
+    }).freeze()
+    track.set_column('distance', distances)
+    track.set_column('cum_distance', [sum(distances[:i + 1]) for i in range(n)])
+    track.set_column('time_step', [0.0] + [1.0] * (n - 1))
+    track.set_column('pace', [math.inf] + list(paces))
+    return track
+
+@pytest.mark.parametrize('values', [[], [1], [1, 1, 1], [1, 2, 2, 3, 1, 1], [True, False, False, True]])
+def test_run_lengths(both_paths, values):
+    with_numpy, without_numpy = both_paths(lambda: run_lengths(values))
+    assert with_numpy == without_numpy
+    starts, ends, run_values = with_numpy
+    decoded = [value for start, end, value in zip(starts, ends, run_values) for _ in range(start, end)]
+    assert decoded == list(values)
+
+def test_segments_of_a_known_track(pure_python):
+    # 10 s at 10:00/mi, 5 s at 7:30/mi, 10 s at 10:00/mi
+    track = hand_track([10.0] * 10 + [7.5] * 5 + [10.0] * 10)
+    moving, is_fast = classify_by_pace(track, 8.0)
+    segments = build_segments(track, is_fast, moving)
+    assert [segment['is_fast'] for segment in segments] == [False, True, False]
+    assert [(segment['start_idx'], segment['end_idx']) for segment in segments] == [(0, 11), (10, 16), (15, 26)]
+    assert [segment['end_time'] - segment['start_time'] for segment in segments] == [10, 5, 10]
+    assert segments[1]['distance'] == pytest.approx(5 / 60 / 7.5)
+    assert [segment['hr_count'] for segment in segments] == [10, 5, 10]
+    assert sum(segment['distance'] for segment in segments) == pytest.approx(20 / 600 + 5 / 450)
+
+def test_hysteresis_ignores_jitter_around_the_limit(pure_python):
+    # Pace wobbles across the limit but never leaves the band around it
+    track = hand_track([9.0] * 10 + [7.9, 8.1] * 10 + [7.0] * 20)
+    moving, is_fast = classify_with_hysteresis(track, 8.0)
+    assert [segment['is_fast'] for segment in build_segments(track, is_fast, moving)] == [False, True]
+    # The plain threshold splits the wobble into many segments
+    moving, is_fast = classify_by_pace(track, 8.0)
+    assert len(build_segments(track, is_fast, moving)) > 10
+
+def test_short_blips_are_absorbed(pure_python):
+    # A 3 s surge is shorter than the minimum dwell time
+    track = hand_track([10.0] * 30 + [6.0] * 3 + [10.0] * 30)
+    moving, is_fast = classify_with_hysteresis(track, 8.0)
+    assert [segment['is_fast'] for segment in build_segments(track, is_fast, moving)] == [False]
+    moving, is_fast = classify_with_hysteresis(track, 8.0, min_dwell_seconds=2, min_dwell_distance=0.0)
+    assert [segment['is_fast'] for segment in build_segments(track, is_fast, moving)] == [False, True, False]
+
+@pytest.mark.parametrize('hysteresis', [False, True])
+def test_segmentation_parity(both_paths, hysteresis):
+    def segments():
+        track = motion_track()
+        if hysteresis:
+            moving, is_fast = classify_with_hysteresis(track, 8.0)
+        else:
+            moving, is_fast = classify_by_pace(track, 8.0)
+        return build_segments(track, is_fast, moving)
+    with_numpy, without_numpy = both_paths(segments)
+    assert len(with_numpy) > 1
+    assert_same(with_numpy, without_numpy)
+
+def test_nothing_moving(both_paths):
+    def segments():
+        track = motion_track()
+        track.set_column('time_step', [0.0] * len(track))
+        moving, is_fast = classify_with_hysteresis(track, 8.0)
+        return build_segments(track, is_fast, moving)
+    assert both_paths(segments) == ([], [])
@@ -0,0 +1,105 @@
+import io
+import math
+import pytest
+from array import array
+from app.gpx_reader import read_gpx_track
+from app.track import TrackArray
+from app.geo import EARTH_RADIUS_MILES
+from app.splits import splits_for_track, values_at_distances, compute_unit_splits, as_mile_splits, MILES_PER_KM
+from app.segments import moving_mask, segment_prefix_sums
+from app.geo import add_motion_columns
+from app.elevation import FEET_PER_METER
+from conftest import assert_same
+from samples import run_points, gpx_bytes
+
+DEGREES_PER_MILE = 180 / (math.pi * EARTH_RADIUS_MILES)
+
+def straight_run(miles=2.5, pace=8.0, stop_at=None, stop=0):
+    """
+    One point a second due north at an even `pace` (min/mile). The first
+    mile climbs 1 m a second, then the road is flat; HR is 140 in the first
+    mile, 150 in the second and 160 after that. With `stop_at`, the runner
+    stands still for `stop` seconds after that many seconds of running.
+    """
+    seconds = int(round(miles * pace * 60))
+    per_second = 1 / (pace * 60)
+    lats, elevations, hrs = [], [], []
+    for t in range(seconds + 1):
+        lats.append(40.0 + t * per_second * DEGREES_PER_MILE)
+        elevations.append(float(min(t, pace * 60)))
+        hrs.append(140.0 + 10 * min(t // int(pace * 60), 2))
+        if t == stop_at:
+            lats.extend([lats[-1]] * stop)
+            elevations.extend([elevations[-1]] * stop)
+            hrs.extend([hrs[-1]] * stop)
+    return TrackArray({
+        'lat': array('d', lats), 'lon': array('d', [-75.0] * len(lats)),
+        'time': array('d', range(len(lats))), 'elevation': array('d', elevations),
+        'hr': array('d', hrs)
+    }).freeze()
+
+def test_mile_splits_of_a_known_run(pure_python):
+    splits = splits_for_track(straight_run(), 1.0)
+    assert [split['split'] for split in splits] == [1, 2, 3]
+    assert [split['distance'] for split in splits] == pytest.approx([1, 1, 0.5])
+    assert [split['partial'] for split in splits] == [False, False, True]
+    assert [split['elapsed_time_minutes'] for split in splits] == pytest.approx([8, 8, 4], abs=1e-6)
+    assert [split['moving_time_minutes'] for split in splits] == pytest.approx([8, 8, 4], abs=1e-6)
+    # Pace is per full unit, also for the partial split
+    assert [split['pace'] for split in splits] == pytest.approx([8, 8, 8], abs=1e-6)
+    # Elevation is smoothed and reported in feet; the median window shrinks
+    # at the start of the track, which shaves a step off the first climb
+    assert [split['elevation_gain'] for split in splits] == pytest.approx([480 * FEET_PER_METER, 0, 0],
+                                                                          abs=FEET_PER_METER)
+    assert [split['elevation_loss'] for split in splits] == [0, 0, 0]
+    assert [split['avg_hr'] for split in splits] == pytest.approx([140, 150, 160], abs=0.1)
+
+def test_stop_counts_towards_elapsed_time_only(pure_python):
+    # Two minutes standing still halfway through the second mile
+    splits = splits_for_track(straight_run(stop_at=720, stop=120), 1.0)
+    assert [split['elapsed_time_minutes'] for split in splits] == pytest.approx([8, 10, 4], abs=1e-6)
+    # The smoothed speed lags the stop by part of its window
+    assert [split['moving_time_minutes'] for split in splits] == pytest.approx([8, 8, 4], abs=0.25)
+
+@pytest.mark.parametrize('column', ['device_speed', 'speed'])
+def test_device_speed_doesnt_replace_smoothed_speed(pure_python, column):
+    # A device speed in m/s, under the current or the old column name, is
+    # well under the mph stop threshold but must not stop the run
+    track = straight_run()
+    track.set_column(column, array('d', [1.2] * len(track)))
+    splits = splits_for_track(track, 1.0)
+    assert [split['moving_time_minutes'] for split in splits] == pytest.approx([8, 8, 4], abs=1e-6)
+
+def test_kilometer_splits_of_a_known_run(pure_python):
+    splits = splits_for_track(straight_run(), MILES_PER_KM)
+    # 2.5 miles is 4.023 km: four full kilometers and a partial one
+    assert len(splits) == 5
+    assert splits[-1]['distance'] == pytest.approx(2.5 * 1.609344 - 4, abs=1e-6)
+    for split in splits[:4]:
+        assert split['elapsed_time_minutes'] == pytest.approx(8 * MILES_PER_KM, abs=1e-6)
+
+def test_short_partial_split_is_dropped(pure_python):
+    # 0.005 miles past the second mile is under MIN_PARTIAL_SPLIT
+    splits = splits_for_track(straight_run(miles=2.005), 1.0)
+    assert [split['partial'] for split in splits] == [False, False]
+
+def test_values_at_distances(both_paths):
+    track = TrackArray({'cum_distance': array('d', [0.0, 1.0, 1.0, 3.0]),
+                        'time': array('d', [0.0, 10.0, 20.0, 40.0])})
+
+    # Between points, on a repeated distance, past the end
+    def lookup():
+        frozen = track.freeze()
+        return values_at_distances(frozen['cum_distance'], {'time': frozen['time']}, [0.5, 1.0, 2.0, 5.0])
+    with_numpy, without_numpy = both_paths(lookup)
+    assert with_numpy == without_numpy == {'time': [5.0, 10.0, 30.0, 40.0]}
+
+def test_splits_parity(both_paths):
+    data = gpx_bytes(run_points())
+
+    def splits():
+        track = add_motion_columns(read_gpx_track(io.BytesIO(data)))
+        return compute_unit_splits(track, segment_prefix_sums(track, moving_mask(track)))
+    with_numpy, without_numpy = both_paths(splits)
+    assert_same(with_numpy, without_numpy)
+    assert as_mile_splits(with_numpy['mile'])[0]['mile'] == 1
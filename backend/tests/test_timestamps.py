@@ -0,0 +1,54 @@
+from datetime import datetime, timezone
+import pytest
+from app.timestamps import TimestampDecoder, decode_timestamps, get_timezone
+from conftest import assert_same
+
+BASE = datetime(2025, 3, 29, 12, 13, 39, tzinfo=timezone.utc).timestamp()
+
+@pytest.mark.parametrize('text, expected', [
+    ('2025-03-29T12:13:39Z', BASE),
+    ('2025-03-29t12:13:39z', BASE),
+    ('2025-03-29 12:13:39Z', BASE),
+    ('2025-03-29T12:13:39', BASE),
+    ('2025-03-29T12:13:39.250Z', BASE + 0.25),
+    ('2025-03-29T12:13:39,5Z', BASE + 0.5),
+    ('2025-03-29T14:13:39+02:00', BASE),
+    ('2025-03-29T14:13:39+0200', BASE),
+    ('2025-03-29T14:13:39+02', BASE),
+    ('2025-03-29T06:43:39-05:30', BASE),
+    ('  2025-03-29T12:13:39Z\n', BASE),
+    # Not fixed width: goes through datetime.fromisoformat
+    ('20250329T121339Z', BASE),
+])
+def test_decoder_formats(text, expected):
+    assert TimestampDecoder()(text) == pytest.approx(expected, abs=1e-6)
+
+def test_decoder_rejects_garbage():
+    with pytest.raises(ValueError):
+        TimestampDecoder()('yesterday at noon')
+
+def test_get_timezone():
+    assert get_timezone('America/Detroit').zone == 'America/Detroit'
+    # Unknown names fall back to the server's zone
+    assert get_timezone('Mars/Olympus_Mons') is get_timezone()
+
+def test_day_cache_is_bounded():
+    decoder = TimestampDecoder()
+    for day in range(TimestampDecoder.MAX_CACHED_DAYS + 10):
+        decoder(datetime.fromtimestamp(BASE + day * 86400, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'))
+    assert len(decoder.days) <= TimestampDecoder.MAX_CACHED_DAYS
+
+@pytest.mark.parametrize('texts', [
+    # Fixed width UTC, decoded in bulk with NumPy
+    ['2024-02-28T23:59:58Z', '2024-02-29T00:00:01Z', '2024-03-01T00:00:00Z', '1999-12-31T23:59:59Z'],
+    ['2025-03-29T12:13:39.125Z', '2025-03-29T12:13:40.875Z'],
+    # Mixed widths and zones fall back to the per-point decoder
+    ['2025-03-29T12:13:39Z', '2025-03-29T12:13:40.5Z', '2025-03-29T14:13:41+02:00'],
+    # A separator out of place in one row
+    ['2025-03-29T12:13:39Z', '2025-03-29 12:13:40Z'],
+    [],
+])
+def test_decode_timestamps_parity(both_paths, texts):
+    with_numpy, without_numpy = both_paths(lambda: decode_timestamps(texts))
+    assert_same(with_numpy, without_numpy)
+    assert_same(with_numpy, [TimestampDecoder()(text) for text in texts])
@@ -0,0 +1,63 @@
+import io
+import math
+from array import array
+from app.gpx_reader import read_gpx_track
+from app.track import TrackArray, np
+from conftest import requires_numpy
+from samples import run_points, gpx_bytes
+
+def make_track():
+    return TrackArray({
+        'lat': array('d', [1.0, 2.0, 3.0]),
+        'lon': array('d', [4.0, 5.0, 6.0]),
+        'time': array('d', [10.0, 11.0, 12.0]),
+        'elevation': array('d', [0.0, 0.0, 0.0]),
+        'hr': array('d', [120.0, math.nan, 130.0])
+    }, metadata={'creator': 'test'})
+
+def test_columns_and_metadata(pure_python):
+    track = make_track().freeze()
+    assert len(track) == 3
+    assert 'hr' in track and 'distance' not in track
+    assert track.heart_rates() == [120, 130]
+    assert track.nbytes == 5 * 3 * 8
+    track.set_column('distance', [0.0, 0.5, 1.5])
+    assert isinstance(track['distance'], array)
+    assert list(track['distance']) == [0.0, 0.5, 1.5]
+
+def test_take(pure_python):
+    track = make_track()
+    subset = track.take([0, 2])
+    assert list(subset['time']) == [10.0, 12.0]
+    assert subset.heart_rates() == [120, 130]
+    assert subset.metadata == track.metadata
+
+@requires_numpy
+def test_freeze_shares_the_buffers():
+    track = make_track()
+    lat = track['lat']
+    track.freeze()
+    assert isinstance(track['lat'], np.ndarray)
+    assert np.shares_memory(track['lat'], np.frombuffer(lat, dtype=np.float64))
+    assert list(track.take([1])['lon']) == [5.0]
+
+def test_reader_columns_parity(both_paths):
+    data = gpx_bytes(run_points(reps=1))
+    with_numpy, without_numpy = both_paths(lambda: read_gpx_track(io.BytesIO(data)))
+    assert with_numpy == without_numpy
+
+def test_bytes_round_trip(both_paths):
+    data = gpx_bytes(run_points(reps=1))
+
+    def round_trip():
+        track = read_gpx_track(io.BytesIO(data))
+        return track, TrackArray.from_bytes(track.to_bytes())
+    with_numpy, without_numpy = both_paths(round_trip)
+    assert with_numpy[0] == with_numpy[1]
+    assert with_numpy == without_numpy
+
+def test_bytes_keep_only_the_named_columns(pure_python):
+    track = TrackArray.from_bytes(make_track().to_bytes(names=['time', 'hr', 'speed']))
+    assert list(track.columns) == ['time', 'hr']
+    assert track.heart_rates() == [120, 130]
+    assert track.metadata == {'creator': 'test'}
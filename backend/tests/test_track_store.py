@@ -0,0 +1,35 @@
+import io
+from app.track import TrackArray
+from app.track_store import RunTrackStore
+from app.gpx_reader import read_gpx_track
+from app.database import RunDatabase
+from app.jobs import JobQueue, run_job
+from samples import run_points, gpx_bytes
+
+GPX = gpx_bytes(run_points(reps=1))
+PARAMS = {'user_age': 35, 'resting_hr': 55, 'weight': 150, 'gender': 1, 'tz_name': 'UTC'}
+
+def test_save_and_get(db_name):
+    store = RunTrackStore(db_name)
+    track = read_gpx_track(io.BytesIO(GPX))
+    store.save(7, 1, track, PARAMS)
+    stored = store.get(7, user_id=1)
+    assert list(stored['track']['time']) == list(track['time'])
+    assert stored['options'] == PARAMS
+    # Bytes are stored as they are
+    store.save(8, 1, track.to_bytes())
+    assert store.get_raw(8)['track'] == track.to_bytes()
+    assert store.get(7, user_id=2) is None
+    store.delete(7)
+    assert store.get(7) is None
+
+def test_queued_runs_keep_their_track(db_name):
+    database = RunDatabase(db_name)
+    database.ensure_tables()
+    queue = JobQueue(db_name)
+    queue.enqueue(1, GPX, dict(PARAMS, pace_limit=8.0, run_date='2024-03-29'))
+    run_id = run_job(queue, database, queue.claim('w1'))
+    stored = RunTrackStore(db_name).get(run_id, user_id=1)
+    assert isinstance(stored['track'], TrackArray)
+    assert len(stored['track']) == len(run_points(reps=1))
+    assert stored['options'] == PARAMS
@@ -0,0 +1,83 @@
+import io
+import random
+import pytest
+from app.gpx_reader import read_gpx_track
+from app.geo import add_motion_columns
+from app.zones import kth_largest, percentile, zone_times, hr_sample_durations, compute_training_zones
+from conftest import assert_same
+from samples import run_points, gpx_bytes
+
+def heart_rates(n=1000, seed=5):
+    rng = random.Random(seed)
+    return [float(round(rng.gauss(150, 12))) for _ in range(n)]
+
+@pytest.mark.parametrize('k', [1, 2, 50, 999, 1000])
+def test_kth_largest(both_paths, k):
+    values = heart_rates()
+    with_numpy, without_numpy = both_paths(lambda: kth_largest(values, k))
+    assert with_numpy == without_numpy == sorted(values)[-k]
+
+@pytest.mark.parametrize('values', [[160.0], [150.0, 150.0, 150.0], heart_rates(7)])
+@pytest.mark.parametrize('q', [0, 50, 95, 100])
+def test_percentile_matches_sorted_lookup(both_paths, values, q):
+    expected = sorted(values)[-max(int(len(values) * (100 - q) / 100), 1)]
+    assert both_paths(lambda: percentile(values, q)) == (expected, expected)
+
+def test_zone_times_bounds(both_paths):
+    upper_bounds = [0.6, 0.7, 0.8, 0.9, 1.0]
+    # Below the first zone, on a bound, between bounds, above the last zone
+    fractions = [0.1, 0.6, 0.65, 0.7, 0.95, 1.3]
+    durations = [1.0, 2.0, 4.0, 8.0, 16.0, 32.0]
+    with_numpy, without_numpy = both_paths(lambda: zone_times(fractions, durations, upper_bounds))
+    assert with_numpy == without_numpy == [3.0, 12.0, 0.0, 0.0, 48.0]
+
+def test_hand_computed_zone_split(pure_python):
+    # Ten samples at each HR; each level's samples stand for a different time
+    levels = [(110, 60.0), (130, 30.0), (150, 12.0), (170, 6.0), (190, 12.0)]
+    samples = [float(hr) for hr, _ in levels for _ in range(10)]
+    durations = [seconds for _, seconds in levels for _ in range(10)]
+    zones = compute_training_zones(samples, durations, model='hrmax', max_hr=200)
+    # 50-60-70-80-90-100% of 200 bpm: one level per zone
+    assert [zone['hr_range'] for zone in zones.values()] == [(100, 120), (120, 140), (140, 160), (160, 180), (180, 200)]
+    assert [zone['time_spent'] for zone in zones.values()] == pytest.approx([10, 5, 2, 1, 2])
+    assert [zone['percentage'] for zone in zones.values()] == pytest.approx([50, 25, 10, 5, 10])
+
+def test_sample_durations_are_time_steps(pure_python):
+    points = run_points(reps=1)
+    # Points without a HR sample are dropped; the others keep their own time step
+    points = [(lat, lon, time, elevation, hr if i % 2 else None) for i, (lat, lon, time, elevation, hr) in enumerate(points)]
+    track = add_motion_columns(read_gpx_track(io.BytesIO(gpx_bytes(points))))
+    samples, durations = hr_sample_durations(track)
+    assert list(samples) == [float(point[4]) for point in points if point[4] is not None]
+    assert set(durations) == {1.0}
+
+@pytest.mark.parametrize('model, extra', [
+    ('hrr', {}),
+    ('hrmax', {}),
+    ('lthr', {'lthr': 165}),
+    ('hrr', {'max_hr': 190}),
+])
+def test_training_zones_parity(both_paths, model, extra):
+    data = gpx_bytes(run_points())
+
+    def zones():
+        track = add_motion_columns(read_gpx_track(io.BytesIO(data)))
+        samples, durations = hr_sample_durations(track)
+        return compute_training_zones(samples, durations, user_age=35, resting_hr=55, model=model, **extra)
+    with_numpy, without_numpy = both_paths(zones)
+    assert_same(with_numpy, without_numpy)
+    assert sum(zone['percentage'] for zone in with_numpy.values()) == pytest.approx(100, abs=0.5)
+
+def test_outliers_are_dropped(both_paths):
+    samples = heart_rates(500) + [250.0, 40.0]
+    durations = [1.0] * len(samples)
+    with_numpy, without_numpy = both_paths(lambda: compute_training_zones(samples, durations, user_age=35, resting_hr=55))
+    assert_same(with_numpy, without_numpy)
+    assert sum(zone['time_spent'] for zone in with_numpy.values()) == pytest.approx(500 / 60, abs=0.05)
+
+def test_missing_data(both_paths):
+    def zones():
+        return [compute_training_zones([], [], user_age=35, resting_hr=55),
+                compute_training_zones([150.0], [1.0], user_age=35),
+                compute_training_zones([150.0], [1.0], model='hrmax')]
+    assert both_paths(zones) == ([None, None, None], [None, None, None])
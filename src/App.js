@@ -1108,6 +1108,25 @@ const calculateSlowSegmentsTime = (results) => {
   return totalTime;
 };
 
+// GPX is verbose XML and shrinks 8-12x with gzip; the backend inflates
+// .gz uploads while it parses them. Browsers without CompressionStream,
+// and files that are already compressed, upload as they are.
+const compressUpload = async (file) => {
+  if (typeof CompressionStream === 'undefined' || file.name.toLowerCase().endsWith('.gz')) {
+    return { body: file, name: file.name };
+  }
+  try {
+    const compressed = await new Response(file.stream().pipeThrough(new CompressionStream('gzip'))).blob();
+    return { body: compressed, name: `${file.name}.gz` };
+  } catch (error) {
+    console.error('Compression failed, uploading uncompressed:', error);
+    return { body: file, name: file.name };
+  }
+};
+
+// How often an upload's analysis job is checked while it runs
+const JOB_POLL_MS = 1000;
+
 function App() {
   const API_URL = 'http://localhost:5001';
   // Add the ref for the upload form
@@ -1230,7 +1249,8 @@ function App() {
     setFileName(file.name);
     setError('');
 
-    // Read the file to extract date from GPX metadata
+    // Read the file to extract date from GPX metadata; other formats
+    // fall back to the date in the file name
     const reader = new FileReader();
     reader.onload = (e) => {
       const content = e.target.result;
@@ -1256,38 +1276,6 @@ function App() {
     reader.readAsText(file);
   };
 
-  const handleSaveRun = async (results) => {
-    if (!runDate) {
-      throw new Error('No run date available');
-    }
-
-    try {
-      const response = await fetch(`${API_URL}/runs`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json'
-        },
-        credentials: 'include',
-        body: JSON.stringify({
-          date: runDate,
-          data: results
-        })
-      });
-
-      const data = await response.json();
-
-      if (!response.ok) {
-        throw new Error(data.message || 'Failed to save run');
-      }
-
-      setSaveStatus('Run saved successfully!');
-      await fetchRunHistory();
-    } catch (error) {
-      console.error('Error saving run:', error);
-      throw error;
-    }
-  };
-
   const handleSubmit = async (e) => {
     e.preventDefault();
     
@@ -1308,17 +1296,21 @@ function App() {
     console.log('File type:', selectedFile.type);
     
     // Create FormData
+    const upload = await compressUpload(selectedFile);
+    console.log('Upload size:', upload.body.size);
     const formData = new FormData();
-    formData.append('file', selectedFile);
+    formData.append('file', upload.body, upload.name);
     formData.append('paceLimit', paceLimit);
     formData.append('age', age);
     formData.append('restingHR', restingHR);
+    formData.append('timezone', Intl.DateTimeFormat().resolvedOptions().timeZone);
     
     console.log('Form data:', Object.fromEntries(formData));
     
     try {
-      console.log('Sending request to:', `${API_URL}/analyze`);
-      const response = await fetch(`${API_URL}/analyze`, {
+      // Queue the upload; the analysis runs in a background job
+      console.log('Sending request to:', `${API_URL}/jobs`);
+      const response = await fetch(`${API_URL}/jobs`, {
         method: 'POST',
         body: formData,
         credentials: 'include'
@@ -1331,56 +1323,49 @@ function App() {
         throw new Error(`Failed to analyze the run: ${errorText}`);
       }
       
-      // Get the response as text first for debugging
-      const responseText = await response.text();
-      console.log('Raw response text (first 500 chars):', responseText.substring(0, 500));
+      const { job_id } = await response.json();
+      console.log('Queued analysis job:', job_id);
       
-      // Try to parse the response text
-      let responseData;
-      try {
-        responseData = JSON.parse(responseText);
-      } catch (parseError) {
-        console.error('JSON parsing error:', parseError);
-        console.error('Parse error position:', parseError.position);
-        
-        // Try to identify the problematic part of the JSON
-        if (parseError.message.includes('position')) {
-          const position = parseInt(parseError.message.split('position')[1]);
-          const problematicPart = responseText.substring(
-            Math.max(0, position - 30),
-            Math.min(responseText.length, position + 30)
-          );
-          console.error('Problematic JSON part:', problematicPart);
+      // Poll the job until the worker has saved the run or given up
+      let job;
+      while (true) {
+        await new Promise(resolve => setTimeout(resolve, JOB_POLL_MS));
+        const jobResponse = await fetch(`${API_URL}/jobs/${job_id}`, {
+          credentials: 'include'
+        });
+        if (!jobResponse.ok) {
+          const errorText = await jobResponse.text();
+          throw new Error(`Failed to check the analysis: ${errorText}`);
         }
-        
-        throw new Error(`Failed to parse response: ${parseError.message}`);
+        job = await jobResponse.json();
+        if (job.status === 'done') {
+          break;
+        }
+        if (job.status === 'failed') {
+          throw new Error(`Failed to analyze the run: ${job.error || 'unknown error'}`);
+        }
+        setSaveStatus(job.stage ? `Analyzing: ${job.stage}` : 'Waiting for an analysis worker...');
       }
       
-      console.log('Raw API response:', responseData);
+      console.log('Analysis job finished, run saved with ID:', job.run_id);
       
-      // Extract the actual analysis data from the nested 'data' property
-      const analysisData = responseData.data || responseData;
-      
-      if (!analysisData) {
-        throw new Error('No analysis data found in the response');
+      // The job stored the run; load its analysis like a saved run
+      const analysisResponse = await fetch(`${API_URL}/run/${job.run_id}/analysis`, {
+        credentials: 'include'
+      });
+      if (!analysisResponse.ok) {
+        const errorText = await analysisResponse.text();
+        throw new Error(`Failed to load the analysis: ${errorText}`);
       }
+      const analysisData = await analysisResponse.json();
       
       console.log('Extracted analysis data:', analysisData);
       
       // Store the results
       setResults(analysisData);
       setAnalysisVisible(true);
-        
-      // Save run to history
-      if (userId && responseData.run_id) {
-        // Run was already saved by the backend
-        console.log('Run was saved with ID:', responseData.run_id);
-        setSaveStatus('Run saved successfully!');
-        await fetchRunHistory();
-      } else if (userId) {
-        // Need to save the run manually
-        handleSaveRun(analysisData);
-      }
+      setSaveStatus('Run saved successfully!');
+      await fetchRunHistory();
     } catch (error) {
       console.error('Error during analysis:', error);
       console.error('Error stack:', error.stack);
@@ -1832,7 +1817,9 @@ function App() {
     };
 
     const getRunDistance = (run) => {
-      if (run.data && run.data.total_distance) {
+      if (isFinite(run.total_distance) && run.total_distance > 0) {
+        return run.total_distance;
+      } else if (run.data && run.data.total_distance) {
         return run.data.total_distance;
       } else if (typeof run.data === 'string') {
         try {
@@ -2679,7 +2666,7 @@ function App() {
                     <div className="upload-form-container">
                       <form onSubmit={handleSubmit} className="upload-form" ref={uploadFormRef}>
                         <div className="upload-header">
-                          <h2>Upload GPX File {runDate && `(${runDate})`}</h2>
+                          <h2>Upload Run File {runDate && `(${runDate})`}</h2>
                           <button 
                             type="button" 
                             className="close-upload-button"
@@ -2692,14 +2679,14 @@ function App() {
                         <div className="upload-container">
                           <label className="file-input-label" htmlFor="gpxFile">
                             <div className="file-input-text">
-                              {fileName ? fileName : 'Choose GPX file'}
+                              {fileName ? fileName : 'Choose a GPX, TCX or FIT file'}
                             </div>
                             <div className="file-input-button">Browse</div>
                           </label>
                           <input
                             type="file"
                             id="gpxFile"
-                            accept=".gpx"
+                            accept=".gpx,.tcx,.fit,.gz"
                             onChange={handleFileChange}
                             className="file-input"
                             required